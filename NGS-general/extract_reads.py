@@ -27,23 +27,22 @@ Recognises FASTQ, CSFASTA and QUAL files.
 #######################################################################
 
 from builtins import str
-from builtins import range
 import sys
 import os
-import io
-import gzip
 import argparse
-import random
-import re
-from bcftbx.ngsutils import getreads
-from bcftbx.ngsutils import getreads_subset
+import functools
+from multiprocessing import Pool
 from bcftbx.ngsutils import getreads_regex
+from bcftbx.ngsutils import getreads_hashed
+from bcftbx.ngsutils import sample_reads
+from bcftbx.FASTQFile import FastqWriter
+from bcftbx.cmdparse import add_nprocessors_option
 
 #######################################################################
 # Module metadata
 #######################################################################
 
-__version__ = "0.3.2"
+__version__ = "0.6.0"
 
 __description__ = """Extract subsets of reads from each of the
 supplied files according to specified criteria (e.g. random,
@@ -70,65 +69,134 @@ def main(args=None):
                    "If multiple files are supplied (e.g. R1/R2 pair) then "
                    "the same subsets will be extracted for each. "
                    "(Optionally a percentage can be supplied instead e.g. "
-                   "'50%%' to extract a subset of half the reads.)")
+                   "'50%%' to extract a subset of approximately half the "
+                   "reads, selected deterministically from the read "
+                   "names.) The input files are only read once.")
     p.add_argument('-s','--seed',action='store',dest='seed',default=None,
                    help="specify seed for random number generator (used "
                    "for -n option; using the same seed should produce the "
-                   "same 'random' sample of reads)")
+                   "same 'random' sample of reads; for percentages "
+                   "the seed changes which reads are selected)")
+    p.add_argument('-z','--gzip',action='store_true',dest='gzip',
+                   help="write gzipped output files")
+    add_nprocessors_option(p,1)
     p.add_argument('infiles',metavar='infile',nargs='+',
                    help="input FASTQ, CSFASTA, or QUAL file")
     args = p.parse_args(args)
+    nprocessors = int(args.nprocessors)
     # Pattern matching option
     if args.pattern is not None:
         if args.n is not None:
             p.error("Need to supply only one of -n or -m options")
         print("Extracting reads matching '%s'" % args.pattern)
         for f in args.infiles:
-            if f.endswith('.gz'):
-                outfile = os.path.basename(os.path.splitext(f[:-3])[0])
-            else:
-                outfile = os.path.basename(os.path.splitext(f)[0])
-            outfile += '.subset_regex.fq'
+            outfile = subset_file_name(f,'subset_regex',args.gzip)
             print("Extracting to %s" % outfile)
-            with io.open(outfile,'wt') as fp:
-                for read in getreads_regex(f,args.pattern):
-                    fp.write('\n'.join(read) + '\n')
+            with FastqWriter(outfile,nthreads=nprocessors) as fp:
+                for read in getreads_regex(f,args.pattern,
+                                           nprocs=nprocessors):
+                    fp.write('\n'.join(read))
     else:
-        # Seed random number generator
-        if args.seed is not None:
-            random.seed(args.seed)
-        # Count the reads
-        nreads = sum(1 for i in getreads(args.infiles[0]))
-        print("Number of reads: %s" % nreads)
-        if len(args.infiles) > 1:
-            print("Verifying read numbers match between files")
-        for f in args.infiles[1:]:
-            if sum(1 for i in getreads(f)) != nreads:
+        if str(args.n).endswith('%'):
+            # Select a fraction of the reads by hashing the read
+            # names, which selects the same reads from each file
+            fraction = float(args.n[:-1])/100.0
+            if fraction < 0.0 or fraction > 1.0:
+                p.error("Percentage must be between 0% and 100%")
+            print("Extracting approximately %s of reads" % args.n)
+            # Each file is processed independently (in parallel if
+            # multiple processors are available)
+            extract = functools.partial(extract_hashed_subset,
+                                        fraction=fraction,
+                                        seed=args.seed,
+                                        gzipped=args.gzip)
+            if nprocessors > 1 and len(args.infiles) > 1:
+                pool = Pool(min(nprocessors,len(args.infiles)))
+                try:
+                    results = pool.map(extract,args.infiles)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [extract(f) for f in args.infiles]
+            nsubsets = []
+            for nsubset,outfile in results:
+                print("Extracted %s reads to %s" % (nsubset,outfile))
+                nsubsets.append(nsubset)
+            if len(set(nsubsets)) > 1:
                 print("Inconsistent numbers of reads between files")
                 sys.exit(1)
-        # Generate a subset of read indices to extract
+            return
+        # Select a random subset of N reads in a single pass
+        nsubset = int(args.n)
+        print("Selecting %s random reads" % nsubset)
         try:
-            nsubset = int(args.n)
-        except ValueError:
-            if str(args.n).endswith('%'):
-                nsubset = int(float(args.n[:-1])*nreads/100.0)
+            nreads,reads = sample_reads(args.infiles,nsubset,
+                                        seed=args.seed)
+        except Exception as ex:
+            print("%s" % ex)
+            sys.exit(1)
+        print("Number of reads: %s" % nreads)
         if nsubset > nreads:
             print("Requested subset (%s) is larger than file (%s)" % (nsubset,
                                                                       nreads))
             sys.exit(1)
-        print("Generating set of %s random indices" % nsubset)
-        subset_indices = random.sample(range(nreads),nsubset)
-        # Extract the reads to separate files
-        for f in args.infiles:
-            if f.endswith('.gz'):
-                outfile = os.path.basename(os.path.splitext(f[:-3])[0])
-            else:
-                outfile = os.path.basename(os.path.splitext(f)[0])
-            outfile += '.subset_%s.fq' % nsubset
+        # Write the reads to separate files
+        for i,f in enumerate(args.infiles):
+            outfile = subset_file_name(f,'subset_%s' % nsubset,args.gzip)
             print("Extracting to %s" % outfile)
-            with io.open(outfile,'wt') as fp:
-                for read in getreads_subset(f,subset_indices):
-                    fp.write('\n'.join(read) + '\n')
+            with FastqWriter(outfile,nthreads=nprocessors) as fp:
+                for read in reads:
+                    fp.write('\n'.join(read[i]))
+
+def extract_hashed_subset(f,fraction,seed=None,gzipped=False):
+    """
+    Extract a fraction of reads selected by hashing the read names
+
+    Arguments:
+      f (str): input file name
+      fraction (float): fraction of reads to extract
+      seed (str): optional, seed for selecting reads
+      gzipped (bool): if True then gzip the output file
+
+    Returns:
+      Tuple: (nsubset,outfile) where 'nsubset' is the number
+        of reads extracted and 'outfile' is the name of the
+        output file.
+    """
+    outfile = "%s.part" % subset_file_name(f,'subset',gzipped)
+    nsubset = 0
+    with FastqWriter(outfile,compress=gzipped) as fp:
+        for read in getreads_hashed(f,fraction,seed=seed):
+            fp.write('\n'.join(read))
+            nsubset += 1
+    # Rename to include the actual number of reads
+    final_outfile = subset_file_name(f,'subset_%s' % nsubset,gzipped)
+    os.rename(outfile,final_outfile)
+    return (nsubset,final_outfile)
+
+def subset_file_name(f,suffix,gzipped=False):
+    """
+    Return the name of the output file for a subset of reads
+
+    Arguments:
+      f (str): input file name
+      suffix (str): suffix to add to the name (e.g.
+        'subset_1000')
+      gzipped (bool): if True then add '.gz' extension
+
+    Returns:
+      String: the output file name (in the current
+        directory).
+    """
+    if f.endswith('.gz'):
+        outfile = os.path.basename(os.path.splitext(f[:-3])[0])
+    else:
+        outfile = os.path.basename(os.path.splitext(f)[0])
+    outfile += '.%s.fq' % suffix
+    if gzipped:
+        outfile += '.gz'
+    return outfile
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+#     fastq_cache.py: convert FASTQ files to binary FASTQ cache files
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# fastq_cache.py
+#
+########################################################################
+
+__version__ = "0.1.0"
+
+"""fastq_cache.py
+
+Usage: fastq_cache.py [ -o CACHE_FILE ] <fastq_file> [ <fastq_file> ... ]
+
+Convert FASTQ files to binary FASTQ cache ('.fqc') files, which can
+be read more quickly than the original FASTQs by the
+bcftbx.FASTQCache.FastqCache class.
+
+"""
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import sys
+import os
+import time
+import argparse
+
+# Set up for bcftbx modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+import bcftbx.FASTQCache as FASTQCache
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == "__main__":
+
+    # Process command line
+    p = argparse.ArgumentParser(
+        description="Convert FASTQ files to binary FASTQ cache "
+        "('%s') files, for faster reading in subsequent analyses." %
+        FASTQCache.FASTQ_CACHE_EXT)
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-o',action="store",dest="cache_file",default=None,
+                   help="write cache to CACHE_FILE (default is to "
+                   "append '%s' to the input FASTQ name; can only be "
+                   "used with a single input FASTQ)" %
+                   FASTQCache.FASTQ_CACHE_EXT)
+    p.add_argument('-b','--block-size',action="store",dest="block_size",
+                   type=int,default=FASTQCache.FASTQ_CACHE_BLOCK_SIZE,
+                   help="number of reads stored in each block of the "
+                   "cache (default: %d)" %
+                   FASTQCache.FASTQ_CACHE_BLOCK_SIZE)
+    p.add_argument('fastq_files',metavar="fastq_file",nargs='+',
+                   help="FASTQ file to convert (can be gzipped)")
+
+    # Process the command line
+    arguments = p.parse_args()
+    if arguments.cache_file and len(arguments.fastq_files) > 1:
+        p.error("-o can only be used with a single input FASTQ")
+    for fastq_file in arguments.fastq_files:
+        if not os.path.exists(fastq_file):
+            p.error("Input file '%s' not found" % fastq_file)
+
+    # Build the caches
+    for fastq_file in arguments.fastq_files:
+        print("Converting %s" % fastq_file)
+        start_time = time.time()
+        with FASTQCache.build_fastq_cache(
+                fastq_file,
+                cache_file=arguments.cache_file,
+                block_size=arguments.block_size) as cache:
+            print("\tWrote %d reads to %s (%.1fs)" %
+                  (cache.nreads,cache.cache_file,time.time()-start_time))
@@ -9,7 +9,7 @@
 #
 ########################################################################
 
-__version__ = "0.1.1"
+__version__ = "0.3.0"
 
 """fastq_edit.py
 
@@ -21,10 +21,32 @@ Options:
   --version             show program's version number and exit
   -h, --help            show this help message and exit
   --stats               Generate basic stats for input FASTQ
+  --stats-json=JSON_FILE
+                        Also write the stats to JSON_FILE (implies --stats)
+  --nprocessors=NPROCESSORS
+                        explicitly specify number of processors/cores to use
+                        (default 1)
   --instrument-name=INSTRUMENT_NAME
                         Update the 'instrument name' in the sequence
                         identifier part of each read record and write updated
                         FASTQ file to stdout
+  --run-id=RUN_ID       Update the 'run id' in the sequence identifier part
+                        of each read record and write updated FASTQ file to
+                        stdout
+  --flowcell-id=FLOWCELL_ID
+                        Update the 'flowcell id' in the sequence identifier
+                        part of each read record and write updated FASTQ file
+                        to stdout
+  --set-field=N:VALUE   Set the Nth ':'-separated field (counting from 1) of
+                        the read identifier (i.e. the part of the header
+                        before the first space) to VALUE in each read record
+                        and write updated FASTQ file to stdout (can be
+                        specified multiple times)
+  -o OUTPUT, --output=OUTPUT
+                        Write the updated FASTQ to OUTPUT instead of stdout
+                        (gzipped if OUTPUT ends with '.gz')
+  -t N, --threads=N     Number of threads to use for compressing gzipped
+                        output (default: 1)
 
 """
 
@@ -33,7 +55,21 @@ Options:
 #######################################################################
 
 import sys,os
+import io
+import re
+import json
+import operator
 import argparse
+from collections import Counter
+try:
+    from itertools import zip_longest
+except ImportError:
+    # Python 2
+    from itertools import izip_longest as zip_longest
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Set up for bcftbx modules
 SHARE_DIR = os.path.abspath(
@@ -41,6 +77,210 @@ SHARE_DIR = os.path.abspath(
         os.path.join(os.path.dirname(sys.argv[0]),'..')))
 sys.path.append(SHARE_DIR)
 import bcftbx.FASTQFile as FASTQFile
+from bcftbx.cmdparse import add_nprocessors_option
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Fields of Illumina read identifiers which can be set by name
+# (e.g. '@EAS139:136:FC706VJ:2:2104:15343:197393')
+HEADER_FIELDS = { 'instrument_name': 0,
+                  'run_id': 1,
+                  'flowcell_id': 2, }
+
+# Offset for converting quality characters to scores
+QUALITY_OFFSET = 33
+
+#######################################################################
+# Classes
+#######################################################################
+
+class FastqStats(object):
+    """Class for accumulating statistics on FASTQ records
+
+    Records are added in blocks of raw FASTQ data using the
+    'add_block' method; each block is handled as a whole
+    (using NumPy arrays if the 'numpy' package is available),
+    rather than one read at a time. The following statistics
+    are collected:
+
+    nreads: total number of reads
+    length_counts: list where element i is the number of
+      reads of length i
+    quality_sums: list where element i is the sum of the
+      quality scores at position i (counting from zero)
+    position_n: list where element i is the number of 'N'
+      bases at position i
+    nbases: total number of bases
+    gc_count: total number of 'G' and 'C' bases
+    index_sequences: Counter with the number of reads for
+      each index sequence (for Illumina 1.8+ headers)
+
+    Instances can be combined using '+', so statistics for
+    sections of a FASTQ can be collected separately (e.g. in
+    parallel) and then merged.
+
+    Quality scores are calculated from the quality characters
+    assuming Phred+33 encoding.
+
+    """
+    def __init__(self):
+        """Create a new FastqStats instance
+
+        """
+        self.nreads = 0
+        self.length_counts = []
+        self.quality_sums = []
+        self.position_n = []
+        self.nbases = 0
+        self.gc_count = 0
+        self.index_sequences = Counter()
+
+    def add_block(self,block):
+        """Add the records in a block of raw FASTQ data
+
+        Arguments:
+          block: bytes object holding one or more complete
+            FASTQ records (e.g. from 'FastqChunk.iter_blocks')
+
+        """
+        lines = block.split(b'\n')
+        seqs = lines[1::4]
+        quals = lines[3::4]
+        nreads = len(quals)
+        if not nreads:
+            return
+        seqs = seqs[:nreads]
+        if b'\r' in block:
+            # Remove carriage returns from Windows line endings
+            seqs = [s.rstrip(b'\r') for s in seqs]
+            quals = [q.rstrip(b'\r') for q in quals]
+        # Index sequences
+        headers = b'\n'.join(lines[0:4*nreads:4])
+        index_sequences = Counter(
+            FASTQFile.RE_ILLUMINA18_INDEX_SEQUENCE.findall(headers))
+        for index_seq in index_sequences:
+            self.index_sequences[index_seq.rstrip().decode()] += \
+                index_sequences[index_seq]
+        # Per-position statistics
+        seq = b''.join(seqs)
+        qual = b''.join(quals)
+        if len(qual) != len(seq):
+            raise Exception("Sequence and quality lengths differ for "
+                            "one or more records")
+        if numpy is not None:
+            length_counts,quality_sums,position_n = \
+                _block_stats_numpy(seqs,quals,seq,qual)
+        else:
+            length_counts,quality_sums,position_n = \
+                _block_stats(seqs,quals)
+        self.nreads += nreads
+        self.length_counts = _add_lists(self.length_counts,length_counts)
+        self.quality_sums = _add_lists(self.quality_sums,quality_sums)
+        self.position_n = _add_lists(self.position_n,position_n)
+        self.nbases += len(qual)
+        self.gc_count += seq.count(b'G') + seq.count(b'C')
+
+    @property
+    def position_counts(self):
+        """List with the number of reads covering each position
+
+        """
+        counts = []
+        total = 0
+        for n in reversed(self.length_counts[1:]):
+            total += n
+            counts.append(total)
+        return counts[::-1]
+
+    @property
+    def mean_quality(self):
+        """List with the mean quality score at each position
+
+        """
+        return [float(q)/c - QUALITY_OFFSET
+                for q,c in zip(self.quality_sums,self.position_counts)]
+
+    @property
+    def gc_percent(self):
+        """Percentage of bases which are G or C
+
+        """
+        if not self.nbases:
+            return 0.0
+        return 100.0*self.gc_count/self.nbases
+
+    @property
+    def n_percent(self):
+        """Percentage of bases which are N
+
+        """
+        if not self.nbases:
+            return 0.0
+        return 100.0*sum(self.position_n)/self.nbases
+
+    def to_dict(self):
+        """Return the statistics as a dictionary
+
+        The dictionary only contains basic Python types,
+        so it can be written out as JSON.
+
+        """
+        counts = self.position_counts
+        return {
+            'total_reads': self.nreads,
+            'total_bases': self.nbases,
+            'read_lengths': dict([(str(l),n)
+                                  for l,n in enumerate(self.length_counts)
+                                  if n]),
+            'index_sequences': dict(self.index_sequences),
+            'gc_percent': self.gc_percent,
+            'n_percent': self.n_percent,
+            'mean_quality_by_position': [round(q,2)
+                                         for q in self.mean_quality],
+            'n_percent_by_position': [round(100.0*n/c,2) for n,c in
+                                      zip(self.position_n,counts)],
+        }
+
+    def report(self,fp=None):
+        """Write a text report of the statistics
+
+        Arguments:
+          fp: file-like object to write to (default: stdout)
+
+        """
+        if fp is None:
+            fp = sys.stdout
+        fp.write(u"Total reads: %d\n" % self.nreads)
+        fp.write(u"Read lengths\n")
+        for len_,n in enumerate(self.length_counts):
+            if n:
+                fp.write(u"\t%d: %d\n" % (len_,n))
+        fp.write(u"Index sequences\n")
+        for seq,n in self.index_sequences.most_common():
+            fp.write(u"\t%s: %d\n" % (seq,n))
+        fp.write(u"GC content: %.2f%%\n" % self.gc_percent)
+        fp.write(u"N content: %.2f%%\n" % self.n_percent)
+        fp.write(u"Mean quality by position\n")
+        for i,(q,n,c) in enumerate(zip(self.mean_quality,
+                                       self.position_n,
+                                       self.position_counts)):
+            fp.write(u"\t%d: %.2f (N: %.2f%%)\n" % (i+1,q,100.0*n/c))
+
+    def __add__(self,other):
+        stats = FastqStats()
+        for s in (self,other):
+            stats.nreads += s.nreads
+            stats.length_counts = _add_lists(stats.length_counts,
+                                             s.length_counts)
+            stats.quality_sums = _add_lists(stats.quality_sums,
+                                            s.quality_sums)
+            stats.position_n = _add_lists(stats.position_n,s.position_n)
+            stats.nbases += s.nbases
+            stats.gc_count += s.gc_count
+            stats.index_sequences.update(s.index_sequences)
+        return stats
 
 #######################################################################
 # Functions
@@ -53,46 +293,361 @@ def edit_instrument_name(fastq_file,new_instrument_name):
     (i.e. first line in the each record) by changing the instrument name, and write
     the updated records to stdout.
     """
-    # Loop over all reads in the FASTQ
-    # Update the instrument name in the sequence identifier and echo to stdout
-    for read in FASTQFile.FastqIterator(fastq_file):
-        if new_instrument_name:
-            # Modify the instrument name
-            read.seqid.instrument_name = new_instrument_name
-        # Echo updated read to stdout
-        print(read)
-
-def stats(fastq_file):
-    """Generate basic stats from FASTQ file
+    fields = {}
+    if new_instrument_name:
+        fields[HEADER_FIELDS['instrument_name']] = new_instrument_name
+    edit_headers(fastq_file,fields)
+
+def edit_headers(fastq_file,fields,output=None,compress=None,nthreads=1):
+    """Set fields in the sequence identifier for all records in FASTQ file
+
+    The read identifier (i.e. the part of the first line of each
+    record up to the first space) is treated as a list of fields
+    separated by ':' (e.g. for Illumina 1.8+ identifiers, the
+    instrument name, run id, flowcell id, lane, tile and x and y
+    coordinates), and the specified fields are replaced.
+
+    The FASTQ is processed in large blocks of raw data, and the
+    header lines in each block are updated together using a
+    single regular expression substitution; records are not
+    parsed individually. Header lines with too few fields are
+    left unchanged.
+
+    Arguments:
+      fastq_file: FASTQ file to update (can be gzipped)
+      fields: dictionary mapping field indexes (starting from
+        zero, see HEADER_FIELDS) to new values
+      output: if set then write the updated FASTQ to this file
+        (default is to write to stdout)
+      compress: if True then gzip the output (default is to
+        compress if 'output' ends with '.gz')
+      nthreads: number of threads to use for compression
     """
-    # Loop over all reads in the FASTQ
-    n_reads = 0
-    read_lengths = {}
-    index_sequences = {}
-    for read in FASTQFile.FastqIterator(fastq_file):
-        # Count of reads
-        n_reads += 1
-        # Read length distribution
-        read_len = len(read.sequence)
-        if read_len in read_lengths:
-            read_lengths[read_len] += 1
+    substitute = _header_substitution(fields)
+    if output is None:
+        fp = getattr(sys.stdout,'buffer',sys.stdout)
+    else:
+        fp = None
+    with FASTQFile.FastqWriter(fastq_file=output,fp=fp,compress=compress,
+                               nthreads=nthreads) as fq:
+        for block in FASTQFile.FastqChunk(fastq_file).iter_blocks():
+            if substitute is not None:
+                lines = block.split(b'\n')
+                lines[0:-1:4] = substitute(
+                    b'\n'.join(lines[0:-1:4])).split(b'\n')
+                block = b'\n'.join(lines)
+            fq.write(block)
+
+def _header_substitution(fields):
+    """Internal: return function to update fields in header lines
+
+    The returned function takes one or more header lines
+    (as bytes, separated by newlines) and returns them with
+    the fields replaced, or None if there are no fields to
+    replace.
+
+    """
+    if not fields:
+        return None
+    nfields = max(fields) + 1
+    regex = re.compile(b'^@' + b':'.join([br"([^:\s]*)"]*nfields),
+                       re.MULTILINE)
+    replacement = []
+    for i in range(nfields):
+        if i in fields:
+            value = str(fields[i])
+            if re.search(r"[:\s]",value):
+                raise ValueError("'%s': field values cannot contain ':' "
+                                 "or whitespace" % value)
+            replacement.append(value.encode().replace(b'\\',b'\\\\'))
         else:
-            read_lengths[read_len] = 1
-        # Tag name distribution
-        index_seq = read.seqid.index_sequence
-        if index_seq is not None:
-            if index_seq in index_sequences:
-                index_sequences[index_seq] += 1
-            else:
-                index_sequences[index_seq] = 1
-    # Finished
-    print("Total reads: %d" % n_reads)
-    print("Read lengths")
-    for len_ in read_lengths:
-        print("\t%d: %d" % (len_,read_lengths[len_]))
-    print("Index sequences"
-    for seq in index_sequences:
-        print("\t%s: %d" % (seq,index_sequences[seq]))
+            replacement.append(b'\\g<%d>' % (i+1))
+    replacement = b'@' + b':'.join(replacement)
+    def substitute(headers):
+        # Usually all the headers start with the same fields (e.g.
+        # the instrument name, run id and flowcell), in which case
+        # the start of each header can be replaced as a string
+        # (which is much quicker than a regular expression
+        # substitution for each header)
+        m = regex.match(headers)
+        if m and headers[m.end():m.end()+1] in (b':',b' '):
+            prefix = headers[:m.end()+1]
+            if headers.count(b'\n'+prefix) == headers.count(b'\n'):
+                new_prefix = regex.sub(replacement,prefix)
+                return new_prefix + \
+                    headers[len(prefix):].replace(b'\n'+prefix,
+                                                  b'\n'+new_prefix)
+        return regex.sub(replacement,headers)
+    return substitute
+
+def stats(fastq_file,nprocs=1,json_file=None,fp=None):
+    """Generate basic stats from FASTQ file
+
+    The FASTQ is split into sections which are processed in
+    parallel (if more than one process is specified), and the
+    stats for each section are merged.
+
+    Arguments:
+      fastq_file: FASTQ file to generate stats for (can be
+        gzipped)
+      nprocs: number of processes to use (default: 1)
+      json_file: if set then also write the stats to this
+        file in JSON format
+      fp: file-like object to write the report to (default:
+        stdout)
+
+    Returns:
+      FastqStats: the stats for the FASTQ.
+    """
+    fastq_stats = FASTQFile.parallel_map(_chunk_stats,fastq_file,
+                                         nprocs=nprocs,
+                                         reducer=operator.add)
+    fastq_stats.report(fp)
+    if json_file:
+        with io.open(json_file,'wt') as fjson:
+            fjson.write(u"%s\n" % json.dumps(fastq_stats.to_dict(),
+                                              indent=2,sort_keys=True))
+    return fastq_stats
+
+def _chunk_stats(chunk):
+    """Internal: collect FastqStats for a FastqChunk
+
+    """
+    chunk_stats = FastqStats()
+    for block in chunk.iter_blocks():
+        chunk_stats.add_block(block)
+    return chunk_stats
+
+def _block_stats_numpy(seqs,quals,seq,qual):
+    """Internal: per-position statistics for a block using NumPy
+
+    Arguments:
+      seqs: list of sequences (as bytes) for the reads
+      quals: list of quality strings (as bytes) for the reads
+      seq: the concatenated sequences
+      qual: the concatenated quality strings
+
+    Returns:
+      Tuple: lists with the read length counts, and the
+        quality score sums and number of 'N' bases at each
+        position.
+    """
+    nreads = len(seqs)
+    lengths = numpy.fromiter(map(len,seqs),dtype=numpy.int64,
+                             count=nreads)
+    maxlen = int(lengths.max())
+    seq = numpy.frombuffer(seq,dtype=numpy.uint8)
+    qual = numpy.frombuffer(qual,dtype=numpy.uint8)
+    if int(lengths.min()) == maxlen:
+        # All reads are the same length: sum the columns
+        seq = seq.reshape(nreads,maxlen)
+        quality_sums = qual.reshape(nreads,maxlen).sum(
+            axis=0,dtype=numpy.int64)
+        position_n = (seq == ord('N')).sum(axis=0,dtype=numpy.int64)
+    else:
+        # Variable lengths: sum by the position of each base
+        starts = numpy.zeros(nreads,dtype=numpy.int64)
+        numpy.cumsum(lengths[:-1],out=starts[1:])
+        positions = numpy.arange(len(seq),dtype=numpy.int64) - \
+                    numpy.repeat(starts,lengths)
+        quality_sums = numpy.bincount(positions,weights=qual,
+                                      minlength=maxlen).astype(numpy.int64)
+        position_n = numpy.bincount(positions[seq == ord('N')],
+                                    minlength=maxlen)
+    return (numpy.bincount(lengths).tolist(),
+            quality_sums.tolist(),
+            position_n.tolist())
+
+def _block_stats(seqs,quals):
+    """Internal: per-position statistics for a block in pure Python
+
+    Fallback for '_block_stats_numpy' when 'numpy' isn't
+    available.
+
+    Arguments:
+      seqs: list of sequences (as bytes) for the reads
+      quals: list of quality strings (as bytes) for the reads
+
+    Returns:
+      Tuple: lists with the read length counts, and the
+        quality score sums and number of 'N' bases at each
+        position.
+    """
+    lengths = Counter(map(len,seqs))
+    length_counts = [0]*(max(lengths)+1)
+    for len_ in lengths:
+        length_counts[len_] = lengths[len_]
+    # Sum the columns of quality scores
+    quality_sums = [sum(col) for col in
+                    zip_longest(*[bytearray(q) for q in quals],
+                                fillvalue=0)]
+    position_n = [0]*len(quality_sums)
+    for s in seqs:
+        i = s.find(b'N')
+        while i != -1:
+            position_n[i] += 1
+            i = s.find(b'N',i+1)
+    return (length_counts,quality_sums,position_n)
+
+def _add_lists(a,b):
+    """Internal: add two lists elementwise, padding the shorter with zeroes
+
+    """
+    if len(a) < len(b):
+        a,b = b,a
+    a = list(a)
+    for i,n in enumerate(b):
+        a[i] += n
+    return a
+
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+
+fastq_data = u"""@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CCGTCCAT
+GAAACGCGGC
++
+#####+++++
+@HWI-700511R:233:C446JACXX:6:1101:1280:2080 1:N:0:GTCNNCAT
+CGAGCTCGAN
++
+IIIIIIIII#
+@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CCGTCCAT
+NAAAC
++
+#5555
+"""
+
+class TestFastqStats(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp(suffix='.TestFastqStats')
+        self.fastq = os.path.join(self.wd,'test.fastq')
+        with io.open(self.fastq,'wt') as fp:
+            fp.write(fastq_data)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _check_stats(self,s):
+        self.assertEqual(s.nreads,3)
+        self.assertEqual(s.nbases,25)
+        self.assertEqual(s.to_dict()['read_lengths'],{ '5': 1, '10': 2 })
+        self.assertEqual(s.index_sequences,{ 'CCGTCCAT': 2, 'GTCNNCAT': 1 })
+        self.assertEqual(s.gc_count,14)
+        self.assertEqual(s.position_n,[1,0,0,0,0,0,0,0,0,1])
+        self.assertEqual(s.position_counts,[3]*5+[2]*5)
+        self.assertEqual([round(q,2) for q in s.mean_quality],
+                         [14.67,20.67,20.67,20.67,20.67,
+                          25.0,25.0,25.0,25.0,6.0])
+    def test_fastq_stats_add_block(self):
+        s = FastqStats()
+        s.add_block(fastq_data.encode())
+        self._check_stats(s)
+    def test_fastq_stats_add_block_no_numpy(self):
+        global numpy
+        numpy_ = numpy
+        numpy = None
+        try:
+            s = FastqStats()
+            s.add_block(fastq_data.encode())
+        finally:
+            numpy = numpy_
+        self._check_stats(s)
+    def test_fastq_stats_add_block_crlf(self):
+        s = FastqStats()
+        s.add_block(fastq_data.replace(u'\n',u'\r\n').encode())
+        self._check_stats(s)
+    def test_fastq_stats_non_illumina18_headers(self):
+        s = FastqStats()
+        s.add_block(b"@SRR001666.1 071112_SLXA-EAS1_s_7:5:1:817:345 "
+                    b"length=36\nGATTACA\n+\nIIIIIII\n"
+                    b"@HWUSI-EAS100R:6:73:941:1973#0/1\nGATTACA\n+\n"
+                    b"IIIIIII\n")
+        self.assertEqual(s.nreads,2)
+        self.assertEqual(s.index_sequences,{})
+    def test_fastq_stats_merge(self):
+        lines = fastq_data.encode().split(b'\n')
+        s1 = FastqStats()
+        s1.add_block(b'\n'.join(lines[:4])+b'\n')
+        s2 = FastqStats()
+        s2.add_block(b'\n'.join(lines[4:]))
+        self._check_stats(s1+s2)
+        self._check_stats(s2+s1)
+    def test_stats(self):
+        json_file = os.path.join(self.wd,'stats.json')
+        for nprocs in (1,2):
+            report = io.StringIO()
+            s = stats(self.fastq,nprocs=nprocs,json_file=json_file,
+                      fp=report)
+            self._check_stats(s)
+            self.assertTrue(report.getvalue().startswith(
+                u"Total reads: 3\nRead lengths\n\t5: 1\n\t10: 2\n"))
+            self.assertTrue(u"GC content: 56.00%\n" in report.getvalue())
+            with io.open(json_file,'rt') as fp:
+                data = json.load(fp)
+            self.assertEqual(data['total_reads'],3)
+            self.assertEqual(data['n_percent'],8.0)
+            self.assertEqual(data['n_percent_by_position'][0],33.33)
+
+class TestEditHeaders(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp(suffix='.TestEditHeaders')
+        self.fastq = os.path.join(self.wd,'test.fastq')
+        with io.open(self.fastq,'wt') as fp:
+            fp.write(fastq_data)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _edit_headers(self,fastq,fields,gzipped=False):
+        output = os.path.join(self.wd,'out.fastq')
+        if gzipped:
+            output += '.gz'
+        edit_headers(fastq,fields,output=output)
+        with FASTQFile.get_fastq_file_handle(output,'rt') as fp:
+            return fp.read()
+    def test_edit_headers_instrument_name(self):
+        self.assertEqual(self._edit_headers(self.fastq,{ 0: 'M00879' }),
+                         fastq_data.replace('@HWI-700511R:','@M00879:'))
+    def test_edit_headers_multiple_fields(self):
+        self.assertEqual(self._edit_headers(self.fastq,
+                                            { 1: '45', 2: 'AB12CD', 4: '2' }),
+                         fastq_data.replace(':233:C446JACXX:6:1101:',
+                                            ':45:AB12CD:6:2:'))
+    def test_edit_headers_mixed_headers(self):
+        # Headers which don't share the same fields, or which
+        # have too few fields, and quality lines starting with '@'
+        data = u"""@HWI-700511R:233:C446JACXX:6:1101:1241:2242 1:N:0:CC
+GAAAC
++
+@@@@@
+@SRR1234.1 1
+GAAAC
++
+@HWI-
+@M00879:233:C446JACXX:6:1101:1280:2080 1:N:0:CC
+GAAAC
++
+@HWI-
+"""
+        fastq = os.path.join(self.wd,'mixed.fastq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(data)
+        self.assertEqual(self._edit_headers(fastq,{ 0: 'NEW' }),
+                         data.replace('@HWI-700511R:','@NEW:').replace(
+                             '@M00879:','@NEW:').replace(
+                                 '@SRR1234.1 1','@NEW 1'))
+        self.assertEqual(self._edit_headers(fastq,{ 2: 'NEW' }),
+                         data.replace(':C446JACXX:',':NEW:'))
+    def test_edit_headers_gzipped_output(self):
+        self.assertEqual(self._edit_headers(self.fastq,{ 0: 'M00879' },
+                                            gzipped=True),
+                         fastq_data.replace('@HWI-700511R:','@M00879:'))
+    def test_edit_headers_no_fields(self):
+        self.assertEqual(self._edit_headers(self.fastq,{}),fastq_data)
+    def test_edit_headers_bad_value(self):
+        self.assertRaises(ValueError,edit_headers,self.fastq,{ 0: 'A:B' })
+        self.assertRaises(ValueError,edit_headers,self.fastq,{ 0: 'A B' })
 
 #######################################################################
 # Main program
@@ -102,32 +657,88 @@ if __name__ == "__main__":
 
     # Process command line using optparse
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Perform various operations on FASTQ file.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
     p.add_argument('--stats',action='store_true',dest='do_stats',
                    default=False,
                    help="Generate basic stats for input FASTQ")
+    p.add_argument('--stats-json',action='store',dest='stats_json',
+                   default=None,
+                   help="Also write the stats to STATS_JSON (implies "
+                   "--stats)")
+    add_nprocessors_option(p,1)
     p.add_argument('--instrument-name',action='store',dest='instrument_name',
                    default=None,
                    help="Update the 'instrument name' in the sequence "
                    "identifier part of each read record and write updated "
                    "FASTQ file to stdout")
+    p.add_argument('--run-id',action='store',dest='run_id',
+                   default=None,
+                   help="Update the 'run id' in the sequence identifier "
+                   "part of each read record and write updated FASTQ "
+                   "file to stdout")
+    p.add_argument('--flowcell-id',action='store',dest='flowcell_id',
+                   default=None,
+                   help="Update the 'flowcell id' in the sequence "
+                   "identifier part of each read record and write "
+                   "updated FASTQ file to stdout")
+    p.add_argument('--set-field',action='append',dest='set_fields',
+                   default=[],metavar='N:VALUE',
+                   help="Set the Nth ':'-separated field (counting from "
+                   "1) of the read identifier (i.e. the part of the "
+                   "header before the first space) to VALUE in each "
+                   "read record and write updated FASTQ file to stdout "
+                   "(can be specified multiple times)")
+    p.add_argument('-o','--output',action='store',dest='output',
+                   default=None,
+                   help="Write the updated FASTQ to OUTPUT instead of "
+                   "stdout (gzipped if OUTPUT ends with '.gz')")
+    p.add_argument('-t','--threads',action='store',dest='nthreads',
+                   default=1,type=int,metavar='N',
+                   help="Number of threads to use for compressing "
+                   "gzipped output (default: 1)")
     p.add_argument('fastq_file',help="FASTQ file to operate on")
 
     # Process the command line
     arguments = p.parse_args()
     new_instrument_name = arguments.instrument_name
-    do_stats = arguments.do_stats
+    do_stats = (arguments.do_stats or arguments.stats_json is not None)
 
     # Deal with arguments
     fastq = arguments.fastq_file
     if not os.path.exists(fastq):
         p.error("Input file '%s' not found" % fastq)
 
-    # Run the edit instrument name program
-    if new_instrument_name is not None:
-        edit_instrument_name(fastq,new_instrument_name)
+    # Collect the header fields to update
+    fields = {}
+    for name in HEADER_FIELDS:
+        value = getattr(arguments,name)
+        if value:
+            fields[HEADER_FIELDS[name]] = value
+    for set_field in arguments.set_fields:
+        try:
+            n,value = set_field.split(':',1)
+            n = int(n)
+            if n < 1:
+                raise ValueError
+        except ValueError:
+            p.error("Bad --set-field value '%s' (should be N:VALUE)" %
+                    set_field)
+        fields[n-1] = value
+    edit = (fields or new_instrument_name is not None or
+            arguments.run_id is not None or
+            arguments.flowcell_id is not None)
+
+    # Update the headers
+    if edit:
+        try:
+            edit_headers(fastq,fields,output=arguments.output,
+                         nthreads=arguments.nthreads)
+        except ValueError as ex:
+            p.error(str(ex))
 
     # Generate the stats
     if do_stats:
-        stats(fastq)
+        stats(fastq,nprocs=int(arguments.nprocessors),
+              json_file=arguments.stats_json)
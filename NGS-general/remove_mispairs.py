@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 #
 # Remove "singleton" reads from fastq file
-from builtins import str
 import sys
 import os
 import io
@@ -26,11 +25,13 @@ if __name__ == "__main__":
     singles_header = fastq+".single.header"
     pairs_header = fastq+".pair.header"
     # Loop over file and collect read names
+    # (Reads are handled as raw bytes, and the headers are
+    # compared without being parsed)
     headers = set()
     pairs = set()
     n = 1
-    for read in FASTQFile.FastqIterator(fastq):
-        seqid = str(read.seqid)
+    for read in FASTQFile.FastqIterator(fastq,binary=True):
+        seqid = read.raw_seqid
         if seqid in headers:
             # Part of a pair
             pairs.add(seqid)
@@ -39,19 +40,19 @@ if __name__ == "__main__":
         n += 1
         if not (n % 1000000): print("%s" % n)
     # Loop again outputing only paired reads
-    fp = io.open(fastq_out,'wt')
-    fp_singles = io.open(singles_header,'wt')
-    fp_pairs = io.open(pairs_header,'wt')
+    fp = io.open(fastq_out,'wb')
+    fp_singles = io.open(singles_header,'wb')
+    fp_pairs = io.open(pairs_header,'wb')
     n = 1
-    for read in FASTQFile.FastqIterator(fastq):
-        seqid = str(read.seqid)
+    for read in FASTQFile.FastqIterator(fastq,binary=True):
+        seqid = read.raw_seqid
         if seqid in pairs:
             # Output one read from pair
-            fp.write(str(read)+"\n")
-            fp_pairs.write(seqid+"\n")
+            fp.write(read.data)
+            fp_pairs.write(seqid+b"\n")
         else:
             # Singleton read
-            fp_singles.write(seqid+"\n")
+            fp_singles.write(seqid+b"\n")
         n += 1
         if not (n % 1000000): print("%s" % n)
     # Close files
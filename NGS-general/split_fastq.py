@@ -9,6 +9,7 @@
 #######################################################################
 
 from builtins import str
+import sys
 import argparse
 import re
 import os
@@ -16,8 +17,11 @@ import io
 from bcftbx.IlluminaData import IlluminaFastq
 from bcftbx.IlluminaData import IlluminaDataError
 from bcftbx.utils import parse_lanes
-from bcftbx.ngsutils import getreads
 from bcftbx.ngsutils import getreads_regex
+from bcftbx.FASTQFile import FastqIterator
+from bcftbx.FASTQFile import FastqWriter
+from bcftbx.FASTQFile import parallel_map
+from bcftbx.cmdparse import add_nprocessors_option
 
 #######################################################################
 # Unit tests
@@ -65,6 +69,16 @@ AAF#FJJJJJJJJJJJ
         # Check results
         self.assertEqual(nreads,5)
         self.assertEqual(lanes,[2,8])
+    def test_get_fastq_lanes_multiple_processes(self):
+        # Make test Fastq
+        fastq_in = os.path.join(self.wd,"Test_S1_R1_001.fastq")
+        with io.open(fastq_in,'wt') as fp:
+            fp.write(self.fastq_data)
+        # Extract lanes
+        nreads,lanes = get_fastq_lanes(fastq_in,nprocs=2)
+        # Check results
+        self.assertEqual(nreads,5)
+        self.assertEqual(lanes,[2,8])
     def test_get_fastq_lanes_from_gzipped_input(self):
         # Make test gzipped Fastq
         fastq_in = os.path.join(self.wd,"Test_S1_R1_001.fastq.gz")
@@ -123,6 +137,20 @@ AAF#FJJJJJJJJJJJ
             reads_l8.append(r)
         self.assertEqual(len(reads_l8),2)
         self.assertEqual('\n'.join(reads_l8),self.fastq_data_l8.strip())
+    def test_extract_reads_for_lane_multiple_processes(self):
+        # Make test Fastq
+        fastq_in = os.path.join(self.wd,"Test_S1_R1_001.fastq")
+        with io.open(fastq_in,'wt') as fp:
+            fp.write(self.fastq_data_l2)
+            fp.write(self.fastq_data_l8)
+            fp.write(self.fastq_data_l2)
+        # Extract reads for lane 2
+        reads_l2 = []
+        for r in extract_reads_for_lane(fastq_in,2,nprocs=2):
+            reads_l2.append(r)
+        self.assertEqual(len(reads_l2),6)
+        self.assertEqual('\n'.join(reads_l2),
+                         '\n'.join([self.fastq_data_l2.strip()]*2))
     def test_get_fastq_lanes_from_gzipped_input(self):
         # Make test gzipped Fastq
         fastq_in = os.path.join(self.wd,"Test_S1_R1_001.fastq.gz")
@@ -142,38 +170,123 @@ AAF#FJJJJJJJJJJJ
         self.assertEqual(len(reads_l8),2)
         self.assertEqual('\n'.join(reads_l8),self.fastq_data_l8.strip())
 
+class TestSplitFastqByLane(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.fastq_data_l2 = u"""@K00311:43:HL3LWBBXX:2:1101:21440:1121 1:N:0:CNATGT
+GCCNGACAGCAGAAAT
++
+AAF#FJJJJJJJJJJJ
+@K00311:43:HL3LWBBXX:2:1101:21460:1121 1:N:0:CNATGT
+GGGNGTCATTGATCAT
++
+AAF#FJJJJJJJJJJJ
+"""
+        self.fastq_data_l8 = u"""@K00311:43:HL3LWBBXX:8:1101:21805:1121 1:N:0:CNATGT
+CCCNACCCTTGCCTAC
++
+AAF#FJJJJJJJJJJJ
+"""
+        self.fastq_in = os.path.join(self.wd,"Test_S1_R1_001.fastq")
+        with io.open(self.fastq_in,'wt') as fp:
+            lines = self.fastq_data_l2.split('\n')
+            fp.write('\n'.join(lines[:4])+'\n')
+            fp.write(self.fastq_data_l8)
+            fp.write('\n'.join(lines[4:]))
+    def tearDown(self):
+        if os.path.exists(self.wd):
+            shutil.rmtree(self.wd)
+    def test_split_fastq_by_lane(self):
+        counts = split_fastq_by_lane(self.fastq_in,out_dir=self.wd)
+        self.assertEqual(counts,{ 2: 2, 8: 1 })
+        out_l2 = os.path.join(self.wd,"Test_S1_L002_R1_001.fastq")
+        out_l8 = os.path.join(self.wd,"Test_S1_L008_R1_001.fastq")
+        self.assertEqual(io.open(out_l2,'rt').read(),self.fastq_data_l2)
+        self.assertEqual(io.open(out_l8,'rt').read(),self.fastq_data_l8)
+        self.assertEqual(sorted(os.listdir(self.wd)),
+                         ["Test_S1_L002_R1_001.fastq",
+                          "Test_S1_L008_R1_001.fastq",
+                          "Test_S1_R1_001.fastq"])
+    def test_split_fastq_by_lane_subset_of_lanes(self):
+        counts = split_fastq_by_lane(self.fastq_in,lanes=(8,),
+                                     out_dir=self.wd)
+        self.assertEqual(counts,{ 2: 2, 8: 1 })
+        out_l8 = os.path.join(self.wd,"Test_S1_L008_R1_001.fastq")
+        self.assertEqual(io.open(out_l8,'rt').read(),self.fastq_data_l8)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.wd,"Test_S1_L002_R1_001.fastq")))
+    def test_split_fastq_by_lane_gzipped_output(self):
+        counts = split_fastq_by_lane(self.fastq_in,out_dir=self.wd,
+                                     compress=True,nthreads=2)
+        self.assertEqual(counts,{ 2: 2, 8: 1 })
+        out_l2 = os.path.join(self.wd,"Test_S1_L002_R1_001.fastq.gz")
+        out_l8 = os.path.join(self.wd,"Test_S1_L008_R1_001.fastq.gz")
+        self.assertEqual(gzip.open(out_l2,'rt').read(),self.fastq_data_l2)
+        self.assertEqual(gzip.open(out_l8,'rt').read(),self.fastq_data_l8)
+    def test_split_fastq_by_lane_missing_lane(self):
+        self.assertRaises(ValueError,split_fastq_by_lane,self.fastq_in,
+                          lanes=(2,3),out_dir=self.wd)
+        self.assertEqual(sorted(os.listdir(self.wd)),
+                         ["Test_S1_R1_001.fastq"])
+    def test_split_fastq_by_lane_invalid_header(self):
+        fastq_in = os.path.join(self.wd,"test.fastq")
+        with io.open(fastq_in,'wt') as fp:
+            fp.write(self.fastq_data_l2)
+            fp.write(u"@read1\nACGT\n+\nAAAA\n")
+        self.assertRaises(Exception,split_fastq_by_lane,fastq_in,
+                          out_dir=self.wd)
+        self.assertEqual(sorted(os.listdir(self.wd)),
+                         ["Test_S1_R1_001.fastq","test.fastq"])
+
 #######################################################################
 # Functions
 #######################################################################
 
-def get_fastq_lanes(fastq):
+def get_fastq_lanes(fastq,nprocs=1):
     """
     Return list of lanes present in Fastq file
 
     Arguments:
       fastq (str): path to Fastq file (can
         be gzipped)
+      nprocs (int): number of processes to use
+        for scanning the Fastq (default: 1)
 
     Returns:
       Tuple: tuple (n,lanes) where ``n`` is a the
         number of reads and ``lanes`` is a list
         of integer lane numbers.
     """
-    regex = re.compile(r"^([^:]*:){3}(\d*):")
+    nreads,lanes = parallel_map(_get_lanes_for_chunk,fastq,
+                                nprocs=nprocs,
+                                reducer=_merge_lanes)
+    return (nreads,sorted(list(lanes)))
+
+def _get_lanes_for_chunk(chunk):
+    """
+    Internal: return number of reads and lanes in a FastqChunk
+    """
+    regex = re.compile(br"^([^:]*:){3}(\d*):")
     nreads = 0
     lanes = set()
-    for read in getreads(fastq):
+    for read in chunk.iter_reads(binary=True):
         nreads += 1
         try:
-            lane = regex.match(''.join(read)).group(2)
+            lane = regex.match(read.raw_seqid).group(2)
             lanes.add(int(lane))
-        except AttributeError:
+        except (AttributeError,ValueError):
             raise Exception("Failed to find lane in read %s: "
                             "not a valid Fastq file?"
-                            % '\n'.join(read))
-    return (nreads,sorted(list(lanes)))
+                            % read.data.decode())
+    return (nreads,lanes)
+
+def _merge_lanes(result1,result2):
+    """
+    Internal: combine results from '_get_lanes_for_chunk'
+    """
+    return (result1[0]+result2[0],result1[1].union(result2[1]))
 
-def extract_reads_for_lane(fastq,lane):
+def extract_reads_for_lane(fastq,lane,nprocs=1):
     """
     Fetch reads from Fastq from specified lane
 
@@ -188,14 +301,122 @@ def extract_reads_for_lane(fastq,lane):
 
     Arguments:
       fastq (str): path to Fastq (can be gzipped)
+      lane (int): lane number to extract reads for
+      nprocs (int): number of processes to use
+        for searching the Fastq (default: 1)
 
     Yields:
       String: matching read record as a string.
     """
     regex_pattern = r"^([^:]*:){3}%s:" % lane
-    for read in getreads_regex(fastq,regex_pattern):
+    for read in getreads_regex(fastq,regex_pattern,nprocs=nprocs):
         yield '\n'.join(read)
 
+def split_fastq_by_lane(fastq,lanes=None,out_dir=None,compress=False,
+                        nthreads=1):
+    """
+    Split reads from Fastq into per-lane Fastqs in a single pass
+
+    Iterates through the Fastq once, taking the lane number
+    for each record from the raw header bytes and routing
+    the record to the writer for that lane. Output files are
+    named using the 'output_fastq_name' function, and are
+    only created for lanes which have at least one read;
+    each file is written with a '.part' extension, which is
+    removed once all the reads have been written.
+
+    Example usage:
+
+    >>> counts = split_fastq_by_lane('illumina_R1.fq.gz',lanes=(1,2))
+    >>> for lane in counts:
+    >>> ... print("Lane %d: %d reads" % (lane,counts[lane]))
+
+    Arguments:
+      fastq (str): path to Fastq (can be gzipped)
+      lanes (list): optional, list of lane numbers to write
+        reads for (default is to write reads for all lanes)
+      out_dir (str): optional, directory to write the output
+        Fastqs to (default: current directory)
+      compress (bool): if True then gzip the output Fastqs
+        (default: write uncompressed Fastqs)
+      nthreads (int): number of threads to use for
+        compressing each output Fastq (default: 1)
+
+    Returns:
+      Dictionary: maps each lane number in the Fastq to the
+        number of reads for that lane (including lanes which
+        weren't written).
+
+    Raises:
+      ValueError: if any of the requested lanes aren't found
+        in the Fastq (in which case no outputs are kept).
+    """
+    if lanes is not None:
+        lanes = set([str(lane).encode('utf-8') for lane in lanes])
+    counts = {}
+    writers = {}
+    try:
+        for read in FastqIterator(fastq,binary=True):
+            try:
+                lane = read[0].split(b':',4)[3]
+            except IndexError:
+                raise Exception("Failed to find lane in read %s: "
+                                "not a valid Fastq file?"
+                                % read.data.decode())
+            try:
+                writers[lane].write(read)
+            except KeyError:
+                # First read for this lane
+                if not lane.isdigit():
+                    raise Exception("Failed to find lane in read %s: "
+                                    "not a valid Fastq file?"
+                                    % read.data.decode())
+                if lanes is None or lane in lanes:
+                    outfile = output_fastq_name(fastq,int(lane))
+                    if compress:
+                        outfile += ".gz"
+                    if out_dir is not None:
+                        outfile = os.path.join(out_dir,outfile)
+                    writers[lane] = FastqWriter("%s.part" % outfile,
+                                                compress=compress,
+                                                nthreads=nthreads)
+                    writers[lane].write(read)
+                else:
+                    writers[lane] = _NullWriter()
+            counts[lane] = counts.get(lane,0) + 1
+        # Check that all the requested lanes were found
+        if lanes is not None:
+            missing = sorted([int(lane) for lane in lanes
+                              if lane not in counts])
+            if missing:
+                raise ValueError("Requested lane%s %s not found in %s" %
+                                 ('s' if len(missing) > 1 else '',
+                                  ','.join([str(x) for x in missing]),
+                                  fastq))
+    except Exception:
+        # Remove incomplete outputs
+        for writer in writers.values():
+            writer.close()
+            if writer.name:
+                os.remove(writer.name)
+        raise
+    # Finish the outputs
+    for writer in writers.values():
+        writer.close()
+        if writer.name:
+            os.rename(writer.name,writer.name[:-len(".part")])
+    return dict([(int(lane),counts[lane]) for lane in counts])
+
+class _NullWriter(object):
+    """
+    Internal: discard reads for lanes which aren't being written
+    """
+    name = None
+    def write(self,read):
+        pass
+    def close(self):
+        pass
+
 def output_fastq_name(fastq,lane):
     """
     Generate an output Fastq name
@@ -233,17 +454,58 @@ if __name__ == "__main__":
                    "a comma-separated list (e.g. 1,3), a range (e.g. "
                    "5-7) or a combination (e.g. 1,3,5-7). Default is "
                    "to extract all lanes in the Fastq")
+    p.add_argument("-z","--gzip",action="store_true",
+                   help="gzip the output Fastqs")
+    p.add_argument("-t","--threads",metavar="N",type=int,default=1,
+                   help="number of threads to use for compressing "
+                   "each output Fastq (default 1; only used with "
+                   "--gzip)")
+    p.add_argument("--multi-pass",action="store_true",
+                   help="determine the lanes present and then extract "
+                   "the reads for each lane in a separate pass through "
+                   "the Fastq (default is to split all lanes in a single "
+                   "pass)")
+    add_nprocessors_option(p,1)
     p.add_argument("fastq",metavar="FASTQ",
                    help="Fastq to split")
     args = p.parse_args()
+    # Lanes
+    if args.lanes:
+        lanes = parse_lanes(args.lanes)
+    else:
+        lanes = None
+    if not args.multi_pass:
+        # Split all lanes in a single pass
+        print("Splitting %s by lane" % args.fastq)
+        try:
+            counts = split_fastq_by_lane(args.fastq,lanes=lanes,
+                                         compress=args.gzip,
+                                         nthreads=args.threads)
+        except ValueError as ex:
+            p.error(str(ex))
+        fastq_lanes = sorted(list(counts.keys()))
+        print("-- %d reads" % sum(counts.values()))
+        print("-- Lanes: %s" % ','.join([str(x) for x in fastq_lanes]))
+        for lane in fastq_lanes:
+            if lanes is None or lane in lanes:
+                outfile = output_fastq_name(args.fastq,lane)
+                if args.gzip:
+                    outfile += ".gz"
+                print("-- Lane %s: %d reads\n   %s" % (lane,counts[lane],
+                                                      outfile))
+            else:
+                print("-- Lane %s: %d reads (not extracted)" %
+                      (lane,counts[lane]))
+        print("Done")
+        sys.exit(0)
     # Extract lanes from Fastq
     print("Determining lanes present in %s" % args.fastq)
-    nreads,fastq_lanes = get_fastq_lanes(args.fastq)
+    nreads,fastq_lanes = get_fastq_lanes(args.fastq,
+                                         nprocs=int(args.nprocessors))
     print("-- %d reads" % nreads)
     print("-- Lanes: %s" % ','.join([str(x) for x in fastq_lanes]))
     # Lanes
-    if args.lanes:
-        lanes = parse_lanes(args.lanes)
+    if lanes:
         for lane in lanes:
             if lane not in fastq_lanes:
                 raise Exception("Requested lane %s not found "
@@ -256,12 +518,16 @@ if __name__ == "__main__":
         print("-- Lane %s" % lane)
         nreads = 0
         outfile = output_fastq_name(args.fastq,lane)
+        if args.gzip:
+            outfile += ".gz"
         tmp_outfile = "%s.part" % outfile
         print("   %s" % outfile)
-        with io.open(tmp_outfile,'wt') as fq:
-            for i,read in enumerate(extract_reads_for_lane(args.fastq,lane)):
+        with FastqWriter(tmp_outfile,compress=args.gzip,
+                         nthreads=args.threads) as fq:
+            for i,read in enumerate(extract_reads_for_lane(
+                    args.fastq,lane,nprocs=int(args.nprocessors))):
                 nreads += 1
-                fq.write("%s\n" % read)
+                fq.write(read)
         os.rename(tmp_outfile,outfile)
         print("   %d reads" % nreads)
     print("Done")
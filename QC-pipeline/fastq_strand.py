@@ -4,7 +4,7 @@
 #     Copyright (C) University of Manchester 2017-2019 Peter Briggs
 #
 
-__version__ = "0.0.7"
+__version__ = "0.0.8"
 
 #######################################################################
 # Imports
@@ -16,15 +16,14 @@ import os
 import io
 import argparse
 import tempfile
-import random
 import subprocess
 import shutil
 import logging
 from bcftbx.utils import find_program
 from bcftbx.ngsutils import getreads
-from bcftbx.ngsutils import getreads_subset
+from bcftbx.ngsutils import sample_reads
+from bcftbx.ngsutils import count_reads
 from bcftbx.qc.report import strip_ngs_extensions
-from builtins import range
 
 #######################################################################
 # Tests
@@ -516,34 +515,39 @@ def fastq_strand(argv,working_dir=None):
             raise Exception("Bad working directory: %s" % working_dir)
     print("Working directory: %s" % working_dir)
     # Make subset of input read pairs
-    nreads = sum(1 for i in getreads(os.path.abspath(args.r1)))
-    print("%d reads" % nreads)
+    fqs_in = [os.path.abspath(fq) for fq in (args.r1,args.r2)
+              if fq is not None]
     if args.subset == 0:
         print("Using all read pairs in Fastq files")
+        nreads = count_reads(fqs_in[0])
         subset = nreads
-    elif args.subset > nreads:
-        print("Actual number of read pairs smaller than requested subset")
-        subset = nreads
-    else:
-        subset = args.subset
-        print("Using random subset of %d read pairs" % subset)
-    if subset == nreads:
-        subset_indices = [i for i in range(nreads)]
+        reads = zip(*[getreads(fq) for fq in fqs_in])
     else:
-        subset_indices = random.sample(range(nreads),subset)
-    fqs_in = filter(lambda fq: fq is not None,(args.r1,args.r2))
+        # Single pass reservoir sample
+        nreads,reads = sample_reads(fqs_in,args.subset)
+        if args.subset > nreads:
+            print("Actual number of read pairs smaller than requested "
+                  "subset")
+            subset = nreads
+        else:
+            subset = args.subset
+            print("Using random subset of %d read pairs" % subset)
+    print("%d reads" % nreads)
     fastqs = []
+    fps = []
     for fq in fqs_in:
         fq_subset = os.path.join(working_dir,
                                  os.path.basename(fq))
         if fq_subset.endswith(".gz"):
             fq_subset = '.'.join(fq_subset.split('.')[:-1])
         fq_subset = "%s.subset.fq" % '.'.join(fq_subset.split('.')[:-1])
-        with io.open(fq_subset,'wt') as fp:
-            for read in getreads_subset(os.path.abspath(fq),
-                                        subset_indices):
-                fp.write(u'\n'.join(read) + '\n')
+        fps.append(io.open(fq_subset,'wt'))
         fastqs.append(fq_subset)
+    for read_pair in reads:
+        for fp,read in zip(fps,read_pair):
+            fp.write(u'\n'.join(read) + '\n')
+    for fp in fps:
+        fp.close()
     # Make directory to keep output from STAR
     if args.keep_star_output:
         star_output_dir = os.path.join(outdir,
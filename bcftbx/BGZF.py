@@ -0,0 +1,738 @@
+#     BGZF.py: read and write blocked gzip (BGZF) files
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# BGZF.py
+#
+#########################################################################
+
+"""
+Classes and functions for reading and writing BGZF ('blocked gzip')
+files:
+
+* BgzfWriter: writes data to a BGZF file, optionally compressing
+  blocks in parallel
+* BgzfReader: reads data from a BGZF file, with random access via
+  virtual offsets and optional parallel decompression
+* BgzfIndex: maps offsets in the uncompressed data to virtual offsets
+
+Additionally there are a few utility functions:
+
+* compress_block: compress data into a single BGZF block
+* compress_blocks: compress data into a series of BGZF blocks
+* decompress_block: decompress a single BGZF block
+* is_bgzf_file: check whether a file is in BGZF format
+* make_virtual_offset: combine block and within-block offsets
+* split_virtual_offset: split a virtual offset into its components
+* build_bgzf_index: create a '.gzi' block index for a BGZF file
+
+BGZF is the format used by samtools, tabix, htslib etc (and by
+Illumina for '.bcl.bgzf' files): the data are compressed in
+independent blocks of at most 64Kb, each of which is a complete
+gzip member with an extra header field giving the size of the
+compressed block. A BGZF file is therefore also a valid gzip file
+which can be read by any gzip-aware tool, but the independent
+blocks also allow the data to be compressed and decompressed in
+parallel, and positions in the uncompressed data to be located
+without decompressing everything before them.
+
+Positions are specified using 'virtual offsets', which combine
+the offset of a block in the compressed file with an offset
+within the uncompressed data for that block (the compressed
+offset in the upper 48 bits, and the within-block offset in the
+lower 16 bits).
+
+The BGZF format is described in the SAM/BAM specification:
+https://samtools.github.io/hts-specs/SAMv1.pdf
+
+"""
+
+# Maximum amount of uncompressed data in each block (as used
+# by htslib, so that the compressed block always fits in 64Kb)
+BGZF_BLOCK_SIZE = 0xff00
+
+# Maximum size of a compressed block
+BGZF_MAX_BLOCK_SIZE = 0x10000
+
+# Empty block used to mark the end of a BGZF file
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC' \
+           b'\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+# Default compression level
+BGZF_COMPRESSLEVEL = 6
+
+# Number of blocks handled in each task when compressing or
+# decompressing in parallel
+BGZF_BATCH_BLOCKS = 64
+
+# BGZF index ('.gzi') files
+BGZF_INDEX_EXT = '.gzi'
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import io
+import zlib
+import struct
+import bisect
+import collections
+from multiprocessing.pool import ThreadPool
+from builtins import str
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Fixed part of the gzip header of a BGZF block: magic, method,
+# flags, mtime, extra flags, OS and length of the extra field
+_GZIP_HEADER = struct.Struct('<BBBBIBBH')
+
+# Complete header for blocks that we write (with the 'BC' extra
+# subfield holding the total block size minus 1)
+_BGZF_HEADER = struct.Struct('<BBBBIBBHBBHH')
+
+# Gzip trailer: CRC32 and size of the uncompressed data
+_GZIP_TRAILER = struct.Struct('<II')
+
+# Header and value for extra subfields
+_SUBFIELD_HEADER = struct.Struct('<BBH')
+_BSIZE = struct.Struct('<H')
+
+#######################################################################
+# Class definitions
+#######################################################################
+
+class BgzfWriter(object):
+    """Class for writing data to a BGZF file
+
+    For example:
+
+    >>> with BgzfWriter('out.txt.gz') as fp:
+    ...     fp.write("Some text\\n")
+
+    The 'write' method accepts bytes or strings (which are
+    encoded as UTF-8). Data are collected into blocks of 65,280
+    bytes which are compressed independently; if more than one
+    thread is requested then batches of blocks are compressed
+    concurrently by a pool of threads (zlib releases the GIL
+    while compressing) and written to the file in the original
+    order.
+
+    The 'tell' method returns the virtual offset of the next
+    byte to be written, which can be used later to seek to that
+    position using a BgzfReader.
+
+    The end-of-file marker block is written when the writer is
+    closed.
+
+    """
+
+    def __init__(self,filen=None,fp=None,compresslevel=BGZF_COMPRESSLEVEL,
+                 nthreads=1):
+        """Create a new BgzfWriter
+
+        Arguments:
+          filen: name of the file to write to
+          fp: file-like object opened for writing in binary
+            mode (used instead of 'filen')
+          compresslevel: optional; compression level (1-9,
+            default: 6)
+          nthreads: optional; number of threads to use for
+            compression (default: 1)
+        """
+        self.name = filen
+        if fp is None:
+            self._fp = io.open(filen,'wb')
+            self._close_fp = True
+        else:
+            self._fp = fp
+            self._close_fp = False
+        self.compresslevel = compresslevel
+        self.nthreads = max(1,int(nthreads))
+        self._buffer = bytearray()
+        self._coffset = 0
+        self._pending = collections.deque()
+        self._pool = None
+        if self.nthreads > 1:
+            self._pool = ThreadPool(self.nthreads)
+            self._batch_size = BGZF_BATCH_BLOCKS*BGZF_BLOCK_SIZE
+        else:
+            self._batch_size = BGZF_BLOCK_SIZE
+        self.closed = False
+
+    def write(self,data):
+        """Write data to the file
+
+        Arguments:
+          data: bytes or string to write
+        """
+        if isinstance(data,str):
+            data = data.encode('utf-8')
+        self._buffer.extend(data)
+        if len(self._buffer) >= self._batch_size:
+            self._write_blocks()
+
+    def writelines(self,lines):
+        """Write multiple items of data to the file
+
+        Arguments:
+          lines: iterable yielding bytes or strings
+        """
+        for line in lines:
+            self.write(line)
+
+    def tell(self):
+        """Return the virtual offset of the next byte to be written
+        """
+        self._write_blocks()
+        self._write_pending()
+        return make_virtual_offset(self._coffset,len(self._buffer))
+
+    def flush(self):
+        """Write out all buffered data
+
+        Note that this ends the current block (so frequent
+        flushing will reduce the compression efficiency).
+        """
+        self._write_blocks(final=True)
+        self._write_pending()
+        self._fp.flush()
+
+    def close(self):
+        """Write out all buffered data and the EOF marker, and close
+        """
+        if self.closed:
+            return
+        self.flush()
+        self._fp.write(BGZF_EOF)
+        self._coffset += len(BGZF_EOF)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self._close_fp:
+            self._fp.close()
+        else:
+            self._fp.flush()
+        self.closed = True
+
+    def _write_blocks(self,final=False):
+        """Internal: compress and write complete blocks from the buffer
+
+        Arguments:
+          final: if True then also write any incomplete block
+            at the end of the buffer
+        """
+        if final:
+            nbytes = len(self._buffer)
+        else:
+            nbytes = len(self._buffer) - len(self._buffer)%BGZF_BLOCK_SIZE
+        if not nbytes:
+            return
+        data = bytes(self._buffer[:nbytes])
+        del self._buffer[:nbytes]
+        if self._pool is None:
+            self._write(compress_blocks(data,self.compresslevel))
+        else:
+            # Queue the batch for compression and write out any
+            # completed batches, limiting the number in flight
+            self._pending.append(self._pool.apply_async(
+                compress_blocks,(data,self.compresslevel)))
+            while self._pending and (len(self._pending) > 2*self.nthreads
+                                     or self._pending[0].ready()):
+                self._write(self._pending.popleft().get())
+
+    def _write_pending(self):
+        """Internal: wait for and write out all queued blocks
+        """
+        while self._pending:
+            self._write(self._pending.popleft().get())
+
+    def _write(self,data):
+        """Internal: write compressed data to the file
+        """
+        self._fp.write(data)
+        self._coffset += len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class BgzfReader(object):
+    """Class for reading data from a BGZF file
+
+    For example:
+
+    >>> with BgzfReader('reads.fastq.gz') as fp:
+    ...     for line in fp:
+    ...         print(line)
+
+    Data are returned as bytes. As well as 'read', 'readline'
+    and iteration over lines, the reader provides 'tell' (which
+    returns the virtual offset of the next byte to be read) and
+    'seek' (which moves to a virtual offset).
+
+    If more than one thread is requested then batches of blocks
+    are read ahead and decompressed concurrently by a pool of
+    threads.
+
+    """
+
+    def __init__(self,filen=None,fp=None,nthreads=1):
+        """Create a new BgzfReader
+
+        Arguments:
+          filen: name of the BGZF file to read
+          fp: file-like object opened for reading in binary
+            mode (used instead of 'filen')
+          nthreads: optional; number of threads to use for
+            decompression (default: 1)
+        """
+        self.name = filen
+        if fp is None:
+            self._fp = io.open(filen,'rb')
+            self._close_fp = True
+        else:
+            self._fp = fp
+            self._close_fp = False
+        self.nthreads = max(1,int(nthreads))
+        self._pool = None
+        if self.nthreads > 1:
+            self._pool = ThreadPool(self.nthreads)
+        # Decompressed blocks which have been read ahead
+        self._blocks = collections.deque()
+        # Offset of the next raw block to be read from the file
+        self._next_coffset = self._fp.tell()
+        # Current block: compressed offset, data, position
+        self._coffset = self._next_coffset
+        self._data = b''
+        self._pos = 0
+        self._eof = False
+        self.closed = False
+
+    def _load_block(self):
+        """Internal: make the next block with data the current block
+
+        Returns:
+          Boolean: True if a block was loaded, False if the end
+            of the file was reached.
+        """
+        while True:
+            if not self._blocks:
+                self._read_ahead()
+                if not self._blocks:
+                    return False
+            coffset,data = self._blocks.popleft()
+            if data:
+                self._coffset = coffset
+                self._data = data
+                self._pos = 0
+                return True
+
+    def _read_ahead(self):
+        """Internal: read and decompress the next batch of blocks
+        """
+        if self._eof:
+            return
+        nblocks = BGZF_BATCH_BLOCKS if self._pool is not None else 1
+        raw_blocks = []
+        for i in range(nblocks):
+            block = _read_raw_block(self._fp)
+            if block is None:
+                self._eof = True
+                break
+            raw_blocks.append((self._next_coffset,block))
+            self._next_coffset += len(block[0])
+        if self._pool is not None and len(raw_blocks) > 1:
+            data = self._pool.map(_decompress_raw_block,
+                                  [b for c,b in raw_blocks])
+        else:
+            data = [_decompress_raw_block(b) for c,b in raw_blocks]
+        self._blocks.extend(zip([c for c,b in raw_blocks],data))
+
+    def read(self,size=-1):
+        """Read data from the file
+
+        Arguments:
+          size: optional; maximum number of bytes to read
+            (default is to read to the end of the file)
+
+        Returns:
+          Bytes: the data (empty at the end of the file).
+        """
+        chunks = []
+        while size is None or size < 0 or size > 0:
+            if self._pos >= len(self._data):
+                if not self._load_block():
+                    break
+            if size is None or size < 0:
+                end = len(self._data)
+            else:
+                end = min(len(self._data),self._pos+size)
+                size -= end - self._pos
+            chunks.append(self._data[self._pos:end])
+            self._pos = end
+        return b''.join(chunks)
+
+    def readline(self):
+        """Read a line from the file
+
+        Returns:
+          Bytes: the next line (including the trailing newline,
+            if present; empty at the end of the file).
+        """
+        chunks = []
+        while True:
+            if self._pos >= len(self._data):
+                if not self._load_block():
+                    break
+            i = self._data.find(b'\n',self._pos)
+            if i >= 0:
+                chunks.append(self._data[self._pos:i+1])
+                self._pos = i + 1
+                break
+            chunks.append(self._data[self._pos:])
+            self._pos = len(self._data)
+        return b''.join(chunks)
+
+    def tell(self):
+        """Return the virtual offset of the next byte to be read
+        """
+        if self._pos >= len(self._data):
+            # At the end of the current block, so point to the
+            # start of the next block
+            if self._blocks:
+                return make_virtual_offset(self._blocks[0][0],0)
+            return make_virtual_offset(self._next_coffset,0)
+        return make_virtual_offset(self._coffset,self._pos)
+
+    def seek(self,voffset):
+        """Move to a virtual offset within the file
+
+        Arguments:
+          voffset: virtual offset (e.g. as returned by 'tell',
+            or by 'BgzfIndex.virtual_offset')
+
+        Returns:
+          Integer: the virtual offset.
+        """
+        coffset,pos = split_virtual_offset(voffset)
+        self._blocks.clear()
+        self._fp.seek(coffset)
+        self._next_coffset = coffset
+        self._eof = False
+        self._coffset = coffset
+        self._data = b''
+        self._pos = 0
+        if not self._load_block():
+            if pos:
+                raise ValueError("Virtual offset %s is beyond the end "
+                                 "of the file" % voffset)
+        elif pos > len(self._data):
+            raise ValueError("Virtual offset %s is beyond the end of "
+                             "the block" % voffset)
+        elif self._coffset == coffset:
+            self._pos = pos
+        return voffset
+
+    def close(self):
+        """Close the file
+        """
+        if self.closed:
+            return
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self._close_fp:
+            self._fp.close()
+        self.closed = True
+
+    def __iter__(self):
+        return iter(self.readline,b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class BgzfIndex(object):
+    """Class mapping uncompressed offsets in a BGZF file to virtual offsets
+
+    A BgzfIndex is loaded from the '.gzi' index file created by
+    the 'build_bgzf_index' function (which uses the same format
+    as 'bgzip -i'), for example:
+
+    >>> idx = build_bgzf_index('data.txt.gz')
+    >>> fp = BgzfReader('data.txt.gz')
+    >>> fp.seek(idx.virtual_offset(1000000))
+
+    The following properties are available:
+
+    filen: path to the BGZF file
+    index_file: path to the index file
+    blocks: list of (compressed,uncompressed) offset pairs for
+      the start of each block
+
+    """
+
+    def __init__(self,filen,index_file=None):
+        """Load the index for a BGZF file
+
+        Arguments:
+          filen: path to the BGZF file
+          index_file: optional; path to the index file (defaults
+            to the BGZF path with '.gzi' appended)
+        """
+        if index_file is None:
+            index_file = filen + BGZF_INDEX_EXT
+        self.filen = filen
+        self.index_file = index_file
+        with io.open(index_file,'rb') as fp:
+            data = fp.read()
+        try:
+            nentries = struct.unpack_from('<Q',data,0)[0]
+            offsets = struct.unpack_from('<%dQ' % (2*nentries),data,8)
+        except struct.error:
+            raise Exception("%s: not a BGZF index file" % index_file)
+        self.blocks = [(0,0)] + list(zip(offsets[0::2],offsets[1::2]))
+        self._uoffsets = [u for c,u in self.blocks]
+
+    def virtual_offset(self,uoffset):
+        """Return the virtual offset for an uncompressed offset
+
+        Arguments:
+          uoffset: offset within the uncompressed data
+
+        Returns:
+          Integer: the corresponding virtual offset.
+        """
+        if uoffset < 0:
+            raise ValueError("Offset must not be negative")
+        i = bisect.bisect_right(self._uoffsets,uoffset) - 1
+        coffset,block_uoffset = self.blocks[i]
+        return make_virtual_offset(coffset,uoffset-block_uoffset)
+
+    def __len__(self):
+        return len(self.blocks)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def compress_block(data,compresslevel=BGZF_COMPRESSLEVEL):
+    """Compress data into a single BGZF block
+
+    Arguments:
+      data: bytes to compress (at most 65,280 bytes)
+      compresslevel: optional; compression level (1-9)
+
+    Returns:
+      Bytes: the BGZF block (header, deflated data and trailer).
+    """
+    if len(data) > BGZF_BLOCK_SIZE:
+        raise ValueError("Too much data for a single BGZF block (%d "
+                         "bytes)" % len(data))
+    compressor = zlib.compressobj(compresslevel,zlib.DEFLATED,
+                                  -zlib.MAX_WBITS)
+    cdata = compressor.compress(data) + compressor.flush()
+    bsize = _BGZF_HEADER.size + len(cdata) + _GZIP_TRAILER.size
+    if bsize > BGZF_MAX_BLOCK_SIZE:
+        # Incompressible data: store it instead
+        compressor = zlib.compressobj(0,zlib.DEFLATED,-zlib.MAX_WBITS)
+        cdata = compressor.compress(data) + compressor.flush()
+        bsize = _BGZF_HEADER.size + len(cdata) + _GZIP_TRAILER.size
+    return b''.join((_BGZF_HEADER.pack(0x1f,0x8b,8,4,0,0,0xff,6,
+                                       ord('B'),ord('C'),2,bsize-1),
+                     cdata,
+                     _GZIP_TRAILER.pack(zlib.crc32(data) & 0xffffffff,
+                                        len(data))))
+
+def compress_blocks(data,compresslevel=BGZF_COMPRESSLEVEL):
+    """Compress data into a series of BGZF blocks
+
+    Arguments:
+      data: bytes to compress
+      compresslevel: optional; compression level (1-9)
+
+    Returns:
+      Bytes: the BGZF blocks.
+    """
+    return b''.join([compress_block(data[i:i+BGZF_BLOCK_SIZE],
+                                    compresslevel)
+                     for i in range(0,len(data),BGZF_BLOCK_SIZE)])
+
+def decompress_block(block):
+    """Decompress a single BGZF block
+
+    Arguments:
+      block: bytes holding a complete BGZF block
+
+    Returns:
+      Bytes: the uncompressed data.
+    """
+    xlen = _GZIP_HEADER.unpack_from(block,0)[-1]
+    return _decompress_raw_block((block,_GZIP_HEADER.size+xlen))
+
+def is_bgzf_file(filen):
+    """Check whether a file is in BGZF format
+
+    Arguments:
+      filen: path to the file
+
+    Returns:
+      Boolean: True if the first block of the file is a BGZF
+        block, False otherwise.
+    """
+    try:
+        with io.open(filen,'rb') as fp:
+            return (_read_raw_block(fp) is not None)
+    except Exception:
+        return False
+
+def make_virtual_offset(coffset,uoffset):
+    """Make a virtual offset from block and within-block offsets
+
+    Arguments:
+      coffset: offset of the start of the block in the
+        compressed file
+      uoffset: offset within the uncompressed data for the
+        block
+
+    Returns:
+      Integer: the virtual offset.
+    """
+    if uoffset < 0 or uoffset >= BGZF_MAX_BLOCK_SIZE:
+        raise ValueError("Within-block offset out of range: %s" % uoffset)
+    if coffset < 0 or coffset >= 1 << 48:
+        raise ValueError("Block offset out of range: %s" % coffset)
+    return (coffset << 16) | uoffset
+
+def split_virtual_offset(voffset):
+    """Split a virtual offset into block and within-block offsets
+
+    Arguments:
+      voffset: the virtual offset
+
+    Returns:
+      Tuple: (coffset,uoffset) where 'coffset' is the offset of
+        the block in the compressed file and 'uoffset' is the
+        offset within the uncompressed data for the block.
+    """
+    return (voffset >> 16,voffset & 0xffff)
+
+def build_bgzf_index(filen,index_file=None):
+    """Create a block index file for a BGZF file
+
+    Scans the block headers and trailers (without decompressing
+    the data) and writes the compressed and uncompressed offsets
+    of the start of each block to a '.gzi' index file (in the
+    same format as 'bgzip -i').
+
+    Arguments:
+      filen: path to the BGZF file
+      index_file: optional; path to write the index file to
+        (defaults to the BGZF path with '.gzi' appended)
+
+    Returns:
+      BgzfIndex: the index for the BGZF file.
+    """
+    if index_file is None:
+        index_file = filen + BGZF_INDEX_EXT
+    offsets = []
+    coffset = 0
+    uoffset = 0
+    with io.open(filen,'rb') as fp:
+        while True:
+            fp.seek(coffset)
+            header = _read_block_header(fp)
+            if header is None:
+                break
+            bsize = header[1]
+            fp.seek(coffset+bsize-4)
+            isize = struct.unpack('<I',fp.read(4))[0]
+            if offsets or coffset:
+                offsets.append((coffset,uoffset))
+            coffset += bsize
+            uoffset += isize
+    # Don't index the (empty) EOF block
+    if offsets and offsets[-1][1] == uoffset:
+        offsets = offsets[:-1]
+    with io.open(index_file,'wb') as fp:
+        fp.write(struct.pack('<Q',len(offsets)))
+        for entry in offsets:
+            fp.write(struct.pack('<QQ',*entry))
+    return BgzfIndex(filen,index_file=index_file)
+
+def _read_block_header(fp):
+    """Internal: read and check the header of a BGZF block
+
+    Arguments:
+      fp: file-like object positioned at the start of a block
+
+    Returns:
+      Tuple: (header,bsize) where 'header' is the complete
+        gzip header (as bytes) and 'bsize' is the total size
+        of the block, or None if the end of the file was
+        reached.
+    """
+    header = fp.read(_GZIP_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _GZIP_HEADER.size:
+        raise Exception("Truncated BGZF block header")
+    id1,id2,cm,flags,mtime,xfl,os_,xlen = _GZIP_HEADER.unpack(header)
+    if id1 != 0x1f or id2 != 0x8b or cm != 8 or not (flags & 4):
+        raise Exception("Not a BGZF block")
+    extra = fp.read(xlen)
+    # Locate the 'BC' subfield holding the block size
+    pos = 0
+    while pos + _SUBFIELD_HEADER.size <= len(extra):
+        si1,si2,slen = _SUBFIELD_HEADER.unpack_from(extra,pos)
+        pos += _SUBFIELD_HEADER.size
+        if si1 == ord('B') and si2 == ord('C') and slen == 2:
+            bsize = _BSIZE.unpack_from(extra,pos)[0] + 1
+            return (header+extra,bsize)
+        pos += slen
+    raise Exception("Not a BGZF block (no 'BC' field in header)")
+
+def _read_raw_block(fp):
+    """Internal: read the next complete BGZF block from a file
+
+    Arguments:
+      fp: file-like object positioned at the start of a block
+
+    Returns:
+      Tuple: (block,header_size) where 'block' is the complete
+        block (as bytes) and 'header_size' is the size of its
+        header, or None if the end of the file was reached.
+    """
+    header = _read_block_header(fp)
+    if header is None:
+        return None
+    header,bsize = header
+    data = fp.read(bsize-len(header))
+    if len(data) != bsize-len(header):
+        raise Exception("Truncated BGZF block")
+    return (header+data,len(header))
+
+def _decompress_raw_block(raw_block):
+    """Internal: decompress a block returned by '_read_raw_block'
+
+    Arguments:
+      raw_block: tuple (block,header_size)
+
+    Returns:
+      Bytes: the uncompressed data.
+    """
+    block,header_size = raw_block
+    crc,isize = _GZIP_TRAILER.unpack_from(block,
+                                          len(block)-_GZIP_TRAILER.size)
+    data = zlib.decompress(block[header_size:-_GZIP_TRAILER.size],
+                           -zlib.MAX_WBITS)
+    if len(data) != isize or (zlib.crc32(data) & 0xffffffff) != crc:
+        raise Exception("Corrupted BGZF block")
+    return data
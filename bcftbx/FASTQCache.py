@@ -0,0 +1,574 @@
+#!/usr/bin/env python
+#
+#     FASTQCache.py: binary columnar cache files for FASTQ data
+#     Copyright (C) University of Manchester 2020 Peter Briggs
+#
+########################################################################
+#
+# FASTQCache.py
+#
+#########################################################################
+
+"""
+Classes and functions for creating and reading binary 'cache' files
+holding the records from a FASTQ file in a compact columnar form:
+
+* FastqCache: iterates through the records in a FASTQ cache file
+* build_fastq_cache: convert a FASTQ file into a FASTQ cache file
+
+A FASTQ cache is intended for data which will be read many times
+(for example by several different QC or analysis steps): the
+conversion is done once, and subsequent reads avoid the cost of
+decompressing and parsing the original FASTQ.
+
+The cache file ('.fqc') holds the records in blocks (by default
+65,536 records per block); within each block the data are stored
+as separate columns:
+
+* sequence lengths (uint32)
+* bases packed 2 bits per base (A, C, G and T), with a separate
+  bit mask marking 'N' bases and a list of positions and values
+  for any other characters (so the original data are always
+  reproduced exactly)
+* quality characters (one byte each)
+* headers split into tokens at ':', ' ', '/' and '#'; each token
+  position is stored as a constant, an indexed dictionary of
+  values, or raw text (whichever fits), and headers which can't
+  be tokenised consistently are stored as raw text
+* the '+' lines (stored only if they're not all empty, or all
+  repeats of the header)
+
+A table at the end of the file records the offset of each block
+and the index of its first record, which allows individual
+records to be located without reading the preceding blocks.
+
+The cache file is memory-mapped when read, and FastqCache
+provides the same iteration interface as the FastqIterator class
+(returning either FastqRead or RawFastqRead objects).
+
+Note that this module requires the 3rd-party 'numpy' package.
+
+"""
+
+# FASTQ cache ('.fqc') files
+FASTQ_CACHE_EXT = '.fqc'
+FASTQ_CACHE_MAGIC = b'FQC1'
+FASTQ_CACHE_VERSION = 1
+FASTQ_CACHE_BLOCK_SIZE = 65536
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+import os
+import io
+import bisect
+import struct
+import mmap
+import functools
+from future.moves import itertools
+from .FASTQFile import FastqIterator
+from .FASTQFile import FastqRead
+from .FASTQFile import RawFastqRead
+from .FASTQFile import FastqBatch
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#######################################################################
+# Constants
+#######################################################################
+
+# File header: magic (4 bytes), version, flags (unused), number
+# of reads, number of blocks, and offset of the block table
+_CACHE_HEADER = struct.Struct('<4sHHQQQ')
+
+# Block header: number of reads and '+' line storage mode
+_BLOCK_HEADER = struct.Struct('<QB')
+
+# Length prefix for each section within a block
+_SECTION_LENGTH = struct.Struct('<Q')
+
+# Storage mode and length for each header token
+_TOKEN_HEADER = struct.Struct('<BQ')
+
+# Storage modes for '+' lines
+_OPTID_EMPTY = 0
+_OPTID_HEADER = 1
+_OPTID_RAW = 2
+
+# Storage modes for headers and header tokens
+_HEADERS_RAW = 0
+_HEADERS_TOKENS = 1
+_TOKEN_CONSTANT = 0
+_TOKEN_DICTIONARY = 1
+_TOKEN_RAW = 2
+
+# Separators used to split headers into tokens, and translation
+# tables to extract them (and to convert them to newlines)
+_HEADER_SEPARATORS = b' :/#'
+_NOT_SEPARATORS = bytes(bytearray(
+    [i for i in range(256) if i not in bytearray(_HEADER_SEPARATORS+b'\n')]))
+_SEPARATORS_TO_NEWLINE = bytes(bytearray(
+    [ord('\n') if i in bytearray(_HEADER_SEPARATORS) else i
+     for i in range(256)]))
+
+# Maximum number of distinct values for dictionary-encoded tokens
+_MAX_DICTIONARY_SIZE = 65535
+
+if numpy is not None:
+    # Lookup tables for packing and unpacking bases
+    _BASE_CODES = numpy.zeros(256,dtype=numpy.uint8)
+    _BASE_KNOWN = numpy.zeros(256,dtype=bool)
+    for _i,_base in enumerate(bytearray(b'ACGT')):
+        _BASE_CODES[_base] = _i
+        _BASE_KNOWN[_base] = True
+    _BASE_KNOWN[ord('N')] = True
+    # Each packed byte is mapped to its four bases via a lookup
+    # of 4-byte integers
+    _UNPACK_BASES = numpy.ascontiguousarray(
+        numpy.frombuffer(b'ACGT',dtype=numpy.uint8)[
+            (numpy.arange(256,dtype=numpy.uint8)[:,None] >>
+             numpy.array([6,4,2,0],dtype=numpy.uint8)) & 3]).view(
+                 '<u4').ravel()
+
+#######################################################################
+# Class definitions
+#######################################################################
+
+class FastqCache(Iterator):
+    """Class to loop over all records in a FASTQ cache file
+
+    Provides a mechanism for looping over all the records in a
+    FASTQ cache file created by 'build_fastq_cache', in the same
+    way as FastqIterator does for FASTQ files:
+
+    >>> for read in FastqCache('reads.fastq.fqc'):
+    ...    print(read.seqid)
+
+    By default FastqRead objects are returned; if 'binary' is
+    True then RawFastqRead objects are returned instead.
+
+    The cache also provides random access to individual records
+    via the 'get_read' method, and to the data in blocks of
+    records via the 'iter_batches' method (which returns
+    FastqBatch objects).
+
+    The following properties are also available:
+
+    cache_file: path to the cache file
+    nreads: number of records in the cache
+    nblocks: number of blocks of records in the cache
+
+    Requires the 'numpy' package.
+
+    """
+
+    def __init__(self,cache_file,binary=False):
+        """Create a new FastqCache
+
+        Arguments:
+          cache_file: path to the FASTQ cache file
+          binary: optional; if True then return RawFastqRead
+            objects (default is to return FastqRead objects)
+        """
+        if numpy is None:
+            raise ImportError("FastqCache requires 'numpy'")
+        self.cache_file = cache_file
+        self.binary = binary
+        self._fp = io.open(cache_file,'rb')
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(),0,
+                                 access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fp.close()
+            raise Exception("%s: not a FASTQ cache file" % cache_file)
+        try:
+            magic,version,flags,nreads,nblocks,table_offset = \
+                _CACHE_HEADER.unpack_from(self._mm,0)
+        except struct.error:
+            magic = None
+        if magic != FASTQ_CACHE_MAGIC:
+            self.close()
+            raise Exception("%s: not a FASTQ cache file" % cache_file)
+        if version != FASTQ_CACHE_VERSION:
+            self.close()
+            raise Exception("%s: unsupported FASTQ cache version (%s)" %
+                            (cache_file,version))
+        self.nreads = nreads
+        self.nblocks = nblocks
+        table = numpy.frombuffer(self._mm,dtype='<u8',count=2*nblocks,
+                                 offset=table_offset).reshape(-1,2)
+        self._block_offsets = table[:,0].tolist()
+        self._block_starts = table[:,1].tolist()
+        self._block = None
+        self._reads = None
+
+    def _read_block(self,k):
+        """Internal: decode block 'k'
+
+        Returns:
+          Tuple: (headers,sequences,optids,qualities) where
+            'headers' is a list of bytes and each of the other
+            items is a bytes object holding the corresponding
+            line for every record, terminated by a newline.
+        """
+        if self._block is not None and self._block[0] == k:
+            return self._block[1]
+        mm = self._mm
+        pos = self._block_offsets[k]
+        n,optid_mode = _BLOCK_HEADER.unpack_from(mm,pos)
+        pos += _BLOCK_HEADER.size
+        sections = []
+        for i in range(8):
+            size = _SECTION_LENGTH.unpack_from(mm,pos)[0]
+            pos += _SECTION_LENGTH.size
+            sections.append((pos,size))
+            pos += size
+        lengths = numpy.frombuffer(mm,dtype='<u4',count=n,
+                                   offset=sections[0][0])
+        total = int(lengths.sum(dtype=numpy.int64))
+        # Unpack the bases
+        packed = numpy.frombuffer(mm,dtype=numpy.uint8,
+                                  count=sections[1][1],
+                                  offset=sections[1][0])
+        bases = _UNPACK_BASES[packed].view(numpy.uint8)[:total]
+        nmask = numpy.unpackbits(numpy.frombuffer(mm,dtype=numpy.uint8,
+                                                  count=sections[2][1],
+                                                  offset=sections[2][0])
+                                 )[:total].view(bool)
+        bases[nmask] = ord('N')
+        nexceptions = sections[4][1]
+        if nexceptions:
+            exceptions = numpy.frombuffer(mm,dtype='<u8',
+                                          count=nexceptions,
+                                          offset=sections[3][0])
+            bases[exceptions] = numpy.frombuffer(mm,dtype=numpy.uint8,
+                                                 count=nexceptions,
+                                                 offset=sections[4][0])
+        quals = numpy.frombuffer(mm,dtype=numpy.uint8,
+                                 count=sections[5][1],
+                                 offset=sections[5][0])
+        sequences = _add_newlines(bases,lengths)
+        qualities = _add_newlines(quals,lengths)
+        # Headers
+        start,size = sections[6]
+        headers = _decode_headers(mm[start:start+size],n)
+        # '+' lines
+        if optid_mode == _OPTID_EMPTY:
+            optids = b'+\n'*n
+        elif optid_mode == _OPTID_HEADER:
+            optids = (b'\n'+b'\n'.join(headers)).replace(b'\n@',b'\n+')
+            optids = optids[1:] + b'\n'
+        else:
+            start,size = sections[7]
+            optids = mm[start:start+size]
+        block = (headers,sequences,optids,qualities)
+        self._block = (k,block)
+        return block
+
+    def _block_lines(self,k,binary=None):
+        """Internal: return lists of record lines for block 'k'
+
+        Returns:
+          List: [headers,sequences,optids,qualities] where each
+            item is a list of bytes (or of strings, if 'binary'
+            is False).
+        """
+        if binary is None:
+            binary = self.binary
+        headers,sequences,optids,qualities = self._read_block(k)
+        if binary:
+            return [headers] + [data.split(b'\n')[:-1]
+                                for data in (sequences,optids,qualities)]
+        headers = b'\n'.join(headers) + b'\n'
+        return [data.decode('utf-8').split('\n')[:-1]
+                for data in (headers,sequences,optids,qualities)]
+
+    def _iter_reads(self):
+        """Internal: return an iterator over the records in the cache
+        """
+        if self.binary:
+            make_read = functools.partial(tuple.__new__,RawFastqRead)
+            return itertools.chain.from_iterable(
+                map(make_read,zip(*self._block_lines(k)))
+                for k in range(self.nblocks))
+        else:
+            return itertools.chain.from_iterable(
+                itertools.starmap(FastqRead,zip(*self._block_lines(k)))
+                for k in range(self.nblocks))
+
+    def get_read(self,n):
+        """Return a single record from the cache
+
+        Arguments:
+          n: index of the record to return (with index 0 being
+            the first record)
+
+        Returns:
+          FastqRead (or RawFastqRead, if 'binary' was set).
+        """
+        if n < 0 or n >= self.nreads:
+            raise IndexError("%s: read index %s out of range" %
+                             (self.cache_file,n))
+        k = bisect.bisect_right(self._block_starts,n) - 1
+        lines = [x[n-self._block_starts[k]]
+                 for x in self._block_lines(k,binary=True)]
+        if self.binary:
+            return RawFastqRead(lines)
+        return FastqRead(*[l.decode('utf-8') for l in lines])
+
+    def iter_batches(self):
+        """Iterate over the blocks of records as FastqBatch objects
+
+        Yields a FastqBatch for each block of records in the
+        cache.
+        """
+        for k in range(self.nblocks):
+            headers,sequences,optids,qualities = \
+                self._block_lines(k,binary=True)
+            yield FastqBatch(headers,sequences,qualities)
+
+    def close(self):
+        """Close the cache file
+        """
+        if self._mm is not None:
+            self._block = None
+            self._mm.close()
+            self._mm = None
+        self._fp.close()
+
+    def __iter__(self):
+        return self._iter_reads()
+
+    def __next__(self):
+        if self._reads is None:
+            self._reads = self._iter_reads()
+        return next(self._reads)
+
+    def next(self):
+        return self.__next__()
+
+    def __len__(self):
+        return self.nreads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+#######################################################################
+# Functions
+#######################################################################
+
+def build_fastq_cache(fastq,cache_file=None,
+                      block_size=FASTQ_CACHE_BLOCK_SIZE):
+    """Convert a FASTQ file into a FASTQ cache file
+
+    Arguments:
+      fastq: path to the FASTQ file (can be gzipped)
+      cache_file: optional; path to write the cache to (defaults
+        to the FASTQ name with '.fqc' appended)
+      block_size: optional; number of records to store in each
+        block (default: 65536)
+
+    Returns:
+      FastqCache: cache object for the new cache file.
+    """
+    if numpy is None:
+        raise ImportError("build_fastq_cache requires 'numpy'")
+    if cache_file is None:
+        cache_file = fastq + FASTQ_CACHE_EXT
+    reads = FastqIterator(fastq,binary=True)
+    nreads = 0
+    block_table = []
+    tmp_cache_file = "%s.tmp" % cache_file
+    with io.open(tmp_cache_file,'wb') as fp:
+        # Placeholder for the file header
+        fp.write(b'\0'*_CACHE_HEADER.size)
+        while True:
+            block = list(itertools.islice(reads,block_size))
+            if not block:
+                break
+            block_table.append((fp.tell(),nreads))
+            fp.write(_encode_block(block))
+            nreads += len(block)
+        # Block table
+        table_offset = fp.tell()
+        fp.write(numpy.array(block_table,dtype='<u8').tobytes())
+        # File header
+        fp.seek(0)
+        fp.write(_CACHE_HEADER.pack(FASTQ_CACHE_MAGIC,
+                                    FASTQ_CACHE_VERSION,
+                                    0,
+                                    nreads,
+                                    len(block_table),
+                                    table_offset))
+    os.rename(tmp_cache_file,cache_file)
+    return FastqCache(cache_file)
+
+def _encode_block(reads):
+    """Internal: encode a list of RawFastqReads as a cache block
+
+    Returns:
+      Bytes: the encoded block.
+    """
+    n = len(reads)
+    headers,sequences,optids,qualities = zip(*reads)
+    # Sequence lengths
+    lengths = numpy.fromiter(map(len,sequences),dtype=numpy.int64,count=n)
+    qlengths = numpy.fromiter(map(len,qualities),dtype=numpy.int64,count=n)
+    if not numpy.array_equal(lengths,qlengths):
+        raise Exception("Sequence and quality lengths differ for "
+                        "one or more records")
+    # Bases: 2-bit codes, N mask and other characters
+    bases = numpy.frombuffer(b''.join(sequences),dtype=numpy.uint8)
+    codes = numpy.zeros(4*((len(bases)+3)//4),dtype=numpy.uint8)
+    codes[:len(bases)] = _BASE_CODES[bases]
+    codes = codes.reshape(-1,4)
+    packed = (codes[:,0] << 6) | (codes[:,1] << 4) | \
+             (codes[:,2] << 2) | codes[:,3]
+    nmask = numpy.packbits(bases == ord('N'))
+    exceptions = numpy.flatnonzero(~_BASE_KNOWN[bases])
+    # '+' lines
+    if all([o == b'+' for o in optids]):
+        optid_mode = _OPTID_EMPTY
+        optid_data = b''
+    elif all([h[:1] == b'@' and o[1:] == h[1:]
+              for h,o in zip(headers,optids)]):
+        optid_mode = _OPTID_HEADER
+        optid_data = b''
+    else:
+        optid_mode = _OPTID_RAW
+        optid_data = b'\n'.join(optids) + b'\n'
+    # Assemble the block
+    sections = (lengths.astype('<u4').tobytes(),
+                packed.astype(numpy.uint8).tobytes(),
+                nmask.tobytes(),
+                exceptions.astype('<u8').tobytes(),
+                bases[exceptions].tobytes(),
+                b''.join(qualities),
+                _encode_headers(headers),
+                optid_data)
+    data = [_BLOCK_HEADER.pack(n,optid_mode)]
+    for section in sections:
+        data.append(_SECTION_LENGTH.pack(len(section)))
+        data.append(section)
+    return b''.join(data)
+
+def _encode_headers(headers):
+    """Internal: encode a list of headers
+
+    Splits each header into tokens; if all the headers have the
+    same structure then each token position is stored separately
+    using the most compact of the available representations,
+    otherwise the headers are stored as raw text.
+
+    Returns:
+      Bytes: the encoded headers.
+    """
+    n = len(headers)
+    blob = b'\n'.join(headers)
+    # Check that the headers all have the same separators
+    separators = set(blob.translate(None,_NOT_SEPARATORS).split(b'\n'))
+    if len(separators) != 1 or len(min(separators)) > 254:
+        return struct.pack('<B',_HEADERS_RAW) + blob
+    separators = separators.pop()
+    # Split all the headers into tokens in a single operation
+    nfields = len(separators) + 1
+    tokens = blob.translate(_SEPARATORS_TO_NEWLINE).split(b'\n')
+    data = [struct.pack('<BB',_HEADERS_TOKENS,nfields),separators]
+    for i in range(nfields):
+        column = tokens[i::nfields]
+        values = set(column)
+        if len(values) == 1:
+            mode = _TOKEN_CONSTANT
+            encoded = values.pop()
+        elif len(values) <= min(_MAX_DICTIONARY_SIZE,n//2):
+            mode = _TOKEN_DICTIONARY
+            values = sorted(values)
+            lookup = dict([(v,j) for j,v in enumerate(values)])
+            encoded = b''.join((
+                struct.pack('<Q',len(values)),
+                numpy.array([lookup[v] for v in column],
+                            dtype='<u2').tobytes(),
+                b'\n'.join(values)))
+        else:
+            mode = _TOKEN_RAW
+            encoded = b'\n'.join(column)
+        data.append(_TOKEN_HEADER.pack(mode,len(encoded)))
+        data.append(encoded)
+    return b''.join(data)
+
+def _add_newlines(data,lengths):
+    """Internal: append a newline to each of a set of sequences
+
+    Arguments:
+      data: numpy array of bytes holding the sequences
+        concatenated together
+      lengths: numpy array with the length of each sequence
+
+    Returns:
+      Bytes: the sequences, each terminated by a newline.
+    """
+    n = len(lengths)
+    if n and lengths.min() == lengths.max():
+        # All the same length (the usual case)
+        out = numpy.empty((n,int(lengths[0])+1),dtype=numpy.uint8)
+        out[:,:-1] = data.reshape(n,int(lengths[0]))
+        out[:,-1] = ord('\n')
+    else:
+        positions = numpy.arange(len(data),dtype=numpy.int64)
+        positions += numpy.repeat(numpy.arange(n,dtype=numpy.int64),
+                                  lengths)
+        out = numpy.full(len(data)+n,ord('\n'),dtype=numpy.uint8)
+        out[positions] = data
+    return out.tobytes()
+
+def _decode_headers(data,n):
+    """Internal: decode the headers for 'n' records
+
+    Returns:
+      List: the headers as bytes.
+    """
+    if data[0:1] == struct.pack('<B',_HEADERS_RAW):
+        return data[1:].split(b'\n')
+    nfields = struct.unpack_from('<B',data,1)[0]
+    separators = bytearray(data[2:2+nfields-1])
+    pos = 2 + nfields - 1
+    # Constant tokens are built into a template which the
+    # variable tokens are substituted into
+    template = []
+    columns = []
+    for i in range(nfields):
+        mode,size = _TOKEN_HEADER.unpack_from(data,pos)
+        pos += _TOKEN_HEADER.size
+        encoded = data[pos:pos+size]
+        pos += size
+        if mode == _TOKEN_CONSTANT:
+            template.append(encoded.replace(b'%',b'%%'))
+        elif mode == _TOKEN_DICTIONARY:
+            nvalues = struct.unpack_from('<Q',encoded,0)[0]
+            values = encoded[8+2*n:].split(b'\n')
+            if len(values) != nvalues:
+                raise Exception("Corrupted header dictionary in FASTQ "
+                                "cache")
+            indices = numpy.frombuffer(encoded,dtype='<u2',count=n,
+                                       offset=8).tolist()
+            columns.append([values[j] for j in indices])
+            template.append(b'%s')
+        else:
+            columns.append(encoded.split(b'\n'))
+            template.append(b'%s')
+        if i < nfields - 1:
+            template.append(bytes(separators[i:i+1]).replace(b'%',b'%%'))
+    template = b''.join(template)
+    if not columns:
+        return [template.replace(b'%%',b'%')]*n
+    return list(map(template.__mod__,zip(*columns)))
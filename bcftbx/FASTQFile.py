@@ -12,22 +12,73 @@ A set of classes for reading through FASTQ files and manipulating
 the data within them:
 
 * FastqIterator: enables looping through all read records in FASTQ file
+* FastqPairIterator: enables looping through R1/R2 read pairs in lockstep
+* FastqPairError: raised when R1/R2 FASTQs have different numbers of reads
 * FastqRead: provides access to a single FASTQ read record
+* RawFastqRead: provides lazy access to a read record held as raw bytes
+* FastqBatchReader: enables looping over FASTQ records in columnar batches
+* FastqBatch: provides access to a batch of records as NumPy arrays
 * SequenceIdentifier: provides access to sequence identifier info in a read
 * FastqAttributes: provides access to gross attributes of FASTQ file
+* ThreadedGzipReader: reads gzipped data with decompression in a background thread
+* FastqWriter: writes FASTQ records with buffering and optional multi-threaded
+  gzip or BGZF compression
+* FastqIndex: provides random access to the records in an indexed FASTQ file
+* ReadCount: holds the result of counting the reads in a FASTQ file
+* FastqChunk: provides access to the records in a section of a FASTQ file
+* QualityEncoding: holds the result of sniffing the quality encoding of a FASTQ
 
 Additionally there are a few utility functions:
 
 * get_fastq_file_handle: return a file handled opened for reading a FASTQ file
+* open_gzip_threaded: open a gzipped file for reading via ThreadedGzipReader
+* build_fastq_index: create a '.fqi' random access index for a FASTQ file
 * nreads: return the number of reads in a FASTQ file
+* count_fastq_reads: count reads in one or more FASTQs in parallel
+* chunks: split a FASTQ file into sections aligned to record boundaries
+* parallel_map: apply a function to sections of a FASTQ in parallel
+* sniff_encoding: determine the likely quality encoding of a FASTQ file
 * fastqs_are_pair: check whether two FASTQs form an R1/R2 pair
+* pair_key: return the part of a sequence identifier shared by R1/R2 reads
 
 Information on the FASTQ file format: http://en.wikipedia.org/wiki/FASTQ_format
 
+Note that the batch reader requires the 3rd-party 'numpy' package.
+
 """
 
 CHUNKSIZE = 102400
 
+# Defaults for threaded gzip decompression
+GZIP_BLOCKSIZE = 1024*1024
+GZIP_QUEUE_DEPTH = 8
+
+# Defaults for FASTQ output
+WRITER_BUFSIZE = 4*1024*1024
+GZIP_COMPRESSLEVEL = 6
+
+# FASTQ index ('.fqi') files
+FASTQ_INDEX_EXT = '.fqi'
+FASTQ_INDEX_MAGIC = b'FQI1'
+FASTQ_INDEX_INTERVAL = 1000
+
+# Size of blocks of raw data scanned when sniffing quality encodings
+SNIFF_BLOCKSIZE = 1024*1024
+
+# Ranges of quality characters for each encoding, and the
+# corresponding Galaxy data types
+QUALITY_ENCODINGS = (('Phred+33',ord('!'),ord('J'),'fastqsanger'),
+                     ('Phred+64',ord('@'),ord('h'),'fastqillumina'),
+                     ('Solexa+64',ord(';'),ord('h'),'fastqsolexa'),)
+
+# Size of the initial window used to locate record boundaries
+# when splitting uncompressed files into chunks
+CHUNK_SCAN_SIZE = 64*1024
+
+# Read counting: uncompressed files larger than this are
+# split into chunks of this size for parallel counting
+COUNT_CHUNKSIZE = 256*1024*1024
+
 #######################################################################
 # Import modules that this module depends on
 #######################################################################
@@ -41,7 +92,22 @@ import io
 import re
 import logging
 import gzip
+import zlib
+import threading
+import functools
+import struct
+import mmap
+import time
+import collections
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from future.moves import itertools
+from future.moves import queue
+from . import BGZF
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #######################################################################
 # Precompiled regular expressions
@@ -51,6 +117,11 @@ from future.moves import itertools
 # @EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG
 RE_ILLUMINA18 = re.compile(r"^@([^:]+):([0-9]+):([^:]+):([0-9]+):([0-9]+):([0-9]+):([0-9]+) (1|2):(Y|N):([0-9]+):(.*)$")
 #
+# Extract index sequences from raw (bytes) Illumina 1.8+ format
+# identifiers, matching the same form as RE_ILLUMINA18 (for use on
+# blocks with one identifier per line)
+RE_ILLUMINA18_INDEX_SEQUENCE = re.compile(br"^@[^:\n]+:[0-9]+:[^:\n]+:[0-9]+:[0-9]+:[0-9]+:[0-9]+ [12]:[YN]:[0-9]+:(.*)$",re.MULTILINE)
+#
 # Match  earlier Illumina format (1.3/1.5), e.g.:
 # @HWUSI-EAS100R:6:73:941:1973#0/1
 RE_ILLUMINA = re.compile(r"^@([^:]+):([0-9]+):([0-9]+):([0-9]+):([0-9]+)#([0-9]+)/(1|2)$")
@@ -78,9 +149,22 @@ class FastqIterator(Iterator):
     >>>    print(read)
     >>> fp.close()
 
+    Alternatively the iterator can operate in 'binary' mode, where
+    the data are read as bytes and a RawFastqRead object is returned
+    for each record instead:
+
+    >>> for read in FastqIterator(fastq_file,binary=True):
+    >>>    print(read.sequence)
+
+    The RawFastqRead objects hold the raw lines of each record
+    and only create the FastqRead and SequenceIdentifier objects
+    on demand, which is significantly faster when only some of
+    the record data is needed.
+
     """
 
-    def __init__(self,fastq_file=None,fp=None,bufsize=CHUNKSIZE):
+    def __init__(self,fastq_file=None,fp=None,bufsize=CHUNKSIZE,
+                 binary=False):
         """Create a new FastqIterator
 
         The input FASTQ can be either a text file or a compressed (gzipped)
@@ -89,24 +173,89 @@ class FastqIterator(Iterator):
 
         Args:
            fastq_file: name of the FASTQ file to iterate through
-           fp: file-like object opened for reading
+           fp: file-like object opened for reading (must be opened
+             in binary mode if 'binary' is True)
            bufsize: optional; integer specifying number of bytes to
              read as a single 'chunk' from disk
+           binary: optional; if True then read the data as bytes
+             and return RawFastqRead objects (default is to read
+             text and return FastqRead objects)
 
         """
         self.__fastq_file = fastq_file
         self.__bufsize = bufsize
+        self.__binary = bool(binary)
         if fp is None:
-            self.__fp = get_fastq_file_handle(self.__fastq_file,'rt')
+            if self.__binary:
+                mode = 'rb'
+            else:
+                mode = 'rt'
+            self.__fp = get_fastq_file_handle(self.__fastq_file,mode,
+                                              threaded=True)
         else:
             self.__fp = fp
         self._buf = ''
         self._lines = []
         self._ip = 0
+        if self.__binary:
+            self._records = self._raw_records()
+
+    def _raw_records(self):
+        """Internal: generator yielding RawFastqRead objects
+
+        Reads the data in chunks and splits each chunk into
+        lines in a single operation; the lines are then grouped
+        into RawFastqRead tuples without any further processing.
+        Lines belonging to an incomplete record at the end of a
+        chunk are carried over to the start of the next chunk.
+        """
+        fp = self.__fp
+        bufsize = self.__bufsize
+        new_read = functools.partial(tuple.__new__,RawFastqRead)
+        tail = b''
+        while True:
+            data = fp.read(bufsize)
+            if data:
+                lines = (tail + data).split(b'\n')
+                # Last item is an incomplete line
+                remainder = [lines.pop()]
+            elif tail:
+                # Reached EOF with data remaining: any
+                # partial record is discarded
+                lines = tail.split(b'\n')
+                if not lines[-1]:
+                    lines.pop()
+                remainder = []
+            else:
+                break
+            nlines = len(lines)
+            if nlines%4:
+                nlines = nlines - nlines%4
+                remainder = lines[nlines:] + remainder
+                del lines[nlines:]
+            tail = b'\n'.join(remainder)
+            ilines = iter(lines)
+            for read in map(new_read,zip(ilines,ilines,ilines,ilines)):
+                yield read
+            if not data:
+                break
+        if self.__fastq_file is not None:
+            fp.close()
+
+    def __iter__(self):
+        if self.__binary:
+            # Hand back the generator directly
+            return self._records
+        return self
 
     def __next__(self):
         """Return next record from FASTQ file as a FastqRead object
+
+        If the iterator was created in 'binary' mode then
+        returns a RawFastqRead object instead.
         """
+        if self.__binary:
+            return next(self._records)
         # Convenience variables
         lines = self._lines
         buf = self._buf
@@ -153,6 +302,256 @@ class FastqIterator(Iterator):
         """
         return self.__next__()
 
+class FastqPairError(Exception):
+    """Exception for R1/R2 FASTQs with different numbers of reads"""
+
+class FastqPairIterator(Iterator):
+    """FastqPairIterator
+
+    Class to loop over the records in a pair of R1/R2 FASTQ files
+    in lockstep, returning a tuple of (r1,r2) reads for each
+    position in the files.
+
+    Example looping over all read pairs:
+
+    >>> for r1,r2 in FastqPairIterator(fastq_r1,fastq_r2):
+    >>>    print(r1.seqid.is_pair_of(r2.seqid))
+
+    A FastqPairError exception is raised if one of the files has
+    more reads than the other.
+
+    As with the FastqIterator, the iterator can operate in
+    'binary' mode where RawFastqRead objects are returned instead
+    of FastqRead objects; this is useful for fast checking of
+    pairs using the 'pair_key' function, for example:
+
+    >>> for r1,r2 in FastqPairIterator(fastq_r1,fastq_r2,binary=True):
+    >>>    if pair_key(r1.raw_seqid) != pair_key(r2.raw_seqid):
+    >>>       print("Not paired")
+
+    """
+
+    def __init__(self,fastq1=None,fastq2=None,fp1=None,fp2=None,
+                 bufsize=CHUNKSIZE,binary=False):
+        """Create a new FastqPairIterator
+
+        Args:
+           fastq1: name of the R1 FASTQ file
+           fastq2: name of the R2 FASTQ file
+           fp1: file-like object opened for reading R1 data
+             (instead of 'fastq1')
+           fp2: file-like object opened for reading R2 data
+             (instead of 'fastq2')
+           bufsize: optional; integer specifying number of bytes to
+             read as a single 'chunk' from disk
+           binary: optional; if True then read the data as bytes
+             and return pairs of RawFastqRead objects (default is
+             to return FastqRead objects)
+
+        """
+        self._pairs = self._read_pairs(
+            FastqIterator(fastq_file=fastq1,fp=fp1,bufsize=bufsize,
+                          binary=binary),
+            FastqIterator(fastq_file=fastq2,fp=fp2,bufsize=bufsize,
+                          binary=binary))
+
+    def _read_pairs(self,reads1,reads2):
+        """Internal: generator yielding pairs of reads
+        """
+        for r1,r2 in itertools.zip_longest(reads1,reads2):
+            if r1 is None or r2 is None:
+                raise FastqPairError("R1 and R2 FASTQs have different "
+                                     "numbers of reads")
+            yield (r1,r2)
+
+    def __iter__(self):
+        # Hand back the generator directly
+        return self._pairs
+
+    def __next__(self):
+        """Return next pair of records as a tuple
+        """
+        return next(self._pairs)
+
+    def next(self):
+        """
+        Implemented for Python2 compatibility
+        """
+        return self.__next__()
+
+class FastqBatchReader(Iterator):
+    """FastqBatchReader
+
+    Class to loop over the records in a FASTQ file in batches,
+    returning a FastqBatch object for each batch.
+
+    Example reporting the maximum quality character for each
+    batch of reads:
+
+    >>> for batch in FastqBatchReader(fastq_file):
+    >>>    print(chr(batch.qualities.max()))
+
+    Each FastqBatch holds the record data as NumPy arrays, so
+    that operations across all the reads in the batch can be
+    vectorised (rather than being performed one read at a
+    time). The final batch may be smaller than the requested
+    batch size.
+
+    Input FASTQ can be in gzipped format; FASTQ data can also
+    be supplied as a file-like object opened for reading in
+    binary mode.
+
+    Requires the 'numpy' package.
+
+    """
+
+    def __init__(self,fastq_file=None,fp=None,batch_size=65536,
+                 bufsize=CHUNKSIZE):
+        """Create a new FastqBatchReader
+
+        Args:
+           fastq_file: name of the FASTQ file to iterate through
+           fp: file-like object opened for reading in binary mode
+           batch_size: optional; maximum number of records to
+             return in each batch (default: 65536)
+           bufsize: optional; integer specifying number of bytes to
+             read as a single 'chunk' from disk
+
+        """
+        if numpy is None:
+            raise ImportError("FastqBatchReader requires 'numpy'")
+        if batch_size < 1:
+            raise ValueError("Batch size must be a positive integer")
+        self.__batch_size = batch_size
+        self.__reads = iter(FastqIterator(fastq_file=fastq_file,fp=fp,
+                                          bufsize=bufsize,binary=True))
+
+    def __next__(self):
+        """Return next batch of records as a FastqBatch object
+        """
+        reads = list(itertools.islice(self.__reads,self.__batch_size))
+        if not reads:
+            raise StopIteration
+        return FastqBatch([r.raw_seqid for r in reads],
+                          [r.sequence for r in reads],
+                          [r.quality for r in reads])
+
+    def next(self):
+        """
+        Implemented for Python2 compatibility
+        """
+        return self.__next__()
+
+class FastqBatch(object):
+    """Class to store a batch of FASTQ records as columnar arrays
+
+    Provides the following properties for accessing the data
+    for the records in the batch:
+
+    headers: the sequence identifier lines concatenated into a
+      single bytes object
+    header_offsets: 1-D integer array with the offsets of the
+      start of each header within 'headers' (with an additional
+      final element giving the end of the last header)
+    sequences: 2-D uint8 array with one row per read containing
+      the sequence characters, padded with zeroes to the length
+      of the longest read
+    qualities: 2-D uint8 array with one row per read containing
+      the quality characters, padded with zeroes
+    lengths: 1-D integer array with the length of each read
+
+    The 'mask' property returns a 2-D boolean array which is
+    True for elements of 'sequences' and 'qualities' which
+    hold actual data (rather than padding).
+
+    Data for individual records can be obtained using the
+    'header', 'sequence' and 'quality' methods.
+
+    Requires the 'numpy' package.
+
+    """
+
+    def __init__(self,headers,sequences,qualities):
+        """Create a new FastqBatch object
+
+        Arguments:
+          headers: list of the sequence identifier lines
+            (as bytes) for each record
+          sequences: list of the sequences (as bytes)
+          qualities: list of the quality strings (as bytes)
+        """
+        if numpy is None:
+            raise ImportError("FastqBatch requires 'numpy'")
+        nreads = len(headers)
+        if len(sequences) != nreads or len(qualities) != nreads:
+            raise Exception("Mismatched numbers of headers, sequences "
+                            "and qualities")
+        # Headers
+        self.headers = b''.join(headers)
+        self.header_offsets = numpy.zeros(nreads+1,dtype=numpy.int64)
+        numpy.cumsum(numpy.fromiter((len(h) for h in headers),
+                                    dtype=numpy.int64,count=nreads),
+                     out=self.header_offsets[1:])
+        # Sequence lengths
+        self.lengths = numpy.fromiter((len(s) for s in sequences),
+                                      dtype=numpy.int64,count=nreads)
+        qlengths = numpy.fromiter((len(q) for q in qualities),
+                                  dtype=numpy.int64,count=nreads)
+        if not numpy.array_equal(self.lengths,qlengths):
+            raise Exception("Sequence and quality lengths differ for "
+                            "one or more records")
+        # Sequence and quality arrays
+        if nreads:
+            maxlen = int(self.lengths.max())
+        else:
+            maxlen = 0
+        self.mask = numpy.arange(maxlen) < self.lengths[:,None]
+        self.sequences = self.__pack(sequences,nreads,maxlen)
+        self.qualities = self.__pack(qualities,nreads,maxlen)
+
+    def __pack(self,data,nreads,maxlen):
+        """Internal: build padded 2-D array from list of bytes
+        """
+        arr = numpy.zeros((nreads,maxlen),dtype=numpy.uint8)
+        arr[self.mask] = numpy.frombuffer(b''.join(data),dtype=numpy.uint8)
+        return arr
+
+    def header(self,i):
+        """Return the sequence identifier line for a record
+
+        Arguments:
+          i: index of the record in the batch
+
+        Returns:
+          Bytes: the sequence identifier line.
+        """
+        return self.headers[self.header_offsets[i]:self.header_offsets[i+1]]
+
+    def sequence(self,i):
+        """Return the sequence for a record
+
+        Arguments:
+          i: index of the record in the batch
+
+        Returns:
+          Bytes: the sequence.
+        """
+        return self.sequences[i,:self.lengths[i]].tobytes()
+
+    def quality(self,i):
+        """Return the quality string for a record
+
+        Arguments:
+          i: index of the record in the batch
+
+        Returns:
+          Bytes: the quality string.
+        """
+        return self.qualities[i,:self.lengths[i]].tobytes()
+
+    def __len__(self):
+        return len(self.lengths)
+
 class FastqRead(object):
     """Class to store a FASTQ record with information about a read
 
@@ -178,8 +577,15 @@ class FastqRead(object):
     is_colorspace: returns True if the read looks like a colorspace read, False
       otherwise
 
+    The class uses '__slots__' to reduce the memory overhead of
+    each read, which is significant when millions of reads are
+    held in memory at once.
+
     """
 
+    __slots__ = ('raw_seqid','sequence','optid','quality',
+                 '_seqid','_seqlen','_maxqual','_minqual','_is_colorspace')
+
     def __init__(self,seqid_line=None,seq_line=None,optid_line=None,quality_line=None):
         """Create a new FastqRead object
 
@@ -193,33 +599,32 @@ class FastqRead(object):
         self.sequence = str(seq_line).rstrip()
         self.optid = str(optid_line).rstrip()
         self.quality = str(quality_line).rstrip()
+        # Cached values
+        self._seqid = None
+        self._seqlen = None
+        self._maxqual = None
+        self._minqual = None
+        self._is_colorspace = None
 
     @property
     def seqid(self):
-        try:
-            return self._seqid
-        except AttributeError:
+        if self._seqid is None:
             self._seqid = SequenceIdentifier(self.raw_seqid)
-            return self._seqid
+        return self._seqid
 
     @property
     def seqlen(self):
-        try:
-            return self._seqlen
-        except AttributeError:
+        if self._seqlen is None:
             if self.is_colorspace:
                 self._seqlen = len(self.sequence) - 1
             else:
                 self._seqlen = len(self.sequence)
-            return self._seqlen
+        return self._seqlen
 
     @property
     def maxquality(self):
-        try:
-            # Cached value
-            return self._maxqual
-        except AttributeError:
-            # Compute, store and return
+        if self._maxqual is None:
+            # Compute and store
             if self.quality:
                 self._maxqual = max(self.quality)
             else:
@@ -228,11 +633,8 @@ class FastqRead(object):
 
     @property
     def minquality(self):
-        try:
-            # Cached value
-            return self._minqual
-        except AttributeError:
-            # Compute, store and return
+        if self._minqual is None:
+            # Compute and store
             if self.quality:
                 self._minqual = min(self.quality)
             else:
@@ -241,25 +643,17 @@ class FastqRead(object):
 
     @property
     def is_colorspace(self):
-        try:
-            return self._is_colorspace
-        except AttributeError:
-            pass
-        if self.seqid.format is None:
-            # Check if it looks like colorspace
-            # Sequence starts with 'T' and only contains characters
-            # 0-3 or '.'
-            sequence = self.sequence
-            if sequence.startswith('T'):
-                for c in sequence[1:]:
-                    if c not in '.0123':
-                        self._is_colorspace = False
-                        return self._is_colorspace
-                # Passed colorspace tests
-                self._is_colorspace = True
-                return self._is_colorspace
-        # Not colorspace
-        self._is_colorspace = False
+        if self._is_colorspace is None:
+            self._is_colorspace = False
+            if self.seqid.format is None:
+                # Check if it looks like colorspace
+                # Sequence starts with 'T' and only contains
+                # characters 0-3 or '.'
+                sequence = self.sequence
+                if sequence.startswith('T') and \
+                   not sequence[1:].strip('.0123'):
+                    # Passed colorspace tests
+                    self._is_colorspace = True
         return self._is_colorspace
 
     def __repr__(self):
@@ -271,13 +665,120 @@ class FastqRead(object):
     def __eq__(self,other):
         return (str(self) == str(other))
 
+class RawFastqRead(tuple):
+    """Class providing lazy access to a FASTQ record stored as bytes
+
+    RawFastqRead objects are returned by the FastqIterator when
+    operating in 'binary' mode. Each object is a tuple holding
+    the four lines of the record as bytes (without the newlines),
+    and no further processing of the data is performed until it
+    is accessed.
+
+    Provides the following properties for accessing the read data
+    as bytes:
+
+    raw_seqid: the sequence identifier line (first line of the record)
+    sequence: the raw sequence (second line of the record)
+    optid: the optional sequence identifier line (third line of the
+      record)
+    quality: the quality values (fourth line of the record)
+    data: the complete record (including the trailing newline)
+
+    Additional properties:
+
+    seqid: the sequence identifier as a SequenceIdentifier object
+    seqlen: length of the sequence
+
+    The 'fastqread' method returns the equivalent FastqRead
+    object.
+    """
+    __slots__ = ()
+
+    @property
+    def raw_seqid(self):
+        return self[0].rstrip()
+
+    @property
+    def sequence(self):
+        return self[1].rstrip()
+
+    @property
+    def optid(self):
+        return self[2].rstrip()
+
+    @property
+    def quality(self):
+        return self[3].rstrip()
+
+    @property
+    def data(self):
+        return b'\n'.join(self) + b'\n'
+
+    @property
+    def seqid(self):
+        return SequenceIdentifier(self.raw_seqid.decode())
+
+    @property
+    def seqlen(self):
+        # Colorspace test is the same as for FastqRead
+        sequence = self.sequence
+        if sequence.startswith(b'T') and \
+           not sequence[1:].translate(None,b'.0123') and \
+           self.seqid.format is None:
+            return len(sequence) - 1
+        return len(sequence)
+
+    def fastqread(self):
+        """Return the record as a FastqRead object
+        """
+        return FastqRead(self.raw_seqid.decode(),
+                         self.sequence.decode(),
+                         self.optid.decode(),
+                         self.quality.decode())
+
+    def __bytes__(self):
+        return self.data
+
+    def __repr__(self):
+        return str(self.fastqread())
+
+    def __eq__(self,other):
+        return (str(self) == str(other))
+
+    def __ne__(self,other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
 class SequenceIdentifier(object):
     """Class to store/manipulate sequence identifier information from a FASTQ record
 
     Provides access to the data items in the sequence identifier line of a FASTQ
     record.
+
+    The identifier line is only split into its component data items
+    when one of them (or the format) is first accessed, so creating a
+    SequenceIdentifier and converting it back to a string are cheap;
+    the class also uses '__slots__' to minimise the memory required
+    for each instance.
     """
 
+    __slots__ = ('__seqid','_fields','_format')
+
+    # Names of the data items, in the order that they are stored
+    _FIELDS = ('instrument_name',
+               'run_id',
+               'flowcell_id',
+               'flowcell_lane',
+               'tile_no',
+               'x_coord',
+               'y_coord',
+               'multiplex_index_no',
+               'pair_id',
+               'bad_read',
+               'control_bit_flag',
+               'index_sequence')
+
     def __init__(self,seqid):
         """Create a new SequenceIdentifier object
 
@@ -285,51 +786,35 @@ class SequenceIdentifier(object):
           seqid: the sequence identifier line (i.e. first line) from the
             FASTQ read record
         """
-        # Initialise
         self.__seqid = str(seqid).rstrip()
-        self.instrument_name = None
-        self.run_id = None
-        self.flowcell_id = None
-        self.flowcell_lane = None
-        self.tile_no = None
-        self.x_coord = None
-        self.y_coord = None
-        self.multiplex_index_no = None
-        self.pair_id =  None
-        self.bad_read = None
-        self.control_bit_flag = None
-        self.index_sequence = None
+        self._fields = None
         self._format = None
+
+    def _parse(self):
+        """Internal: split the identifier line into its data items
+
+        Sets the '_fields' list and the '_format' attribute.
+        """
         # Identify sequence id line elements
         m = RE_ILLUMINA18.match(self.__seqid)
         if m:
             # example of Illumina 1.8+ format:
             # @EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG
             self._format = 'illumina18'
-            self.instrument_name = m.group(1)
-            self.run_id = m.group(2)
-            self.flowcell_id = m.group(3)
-            self.flowcell_lane = m.group(4)
-            self.tile_no = m.group(5)
-            self.x_coord = m.group(6)
-            self.y_coord = m.group(7)
-            self.pair_id = m.group(8)
-            self.bad_read = m.group(9)
-            self.control_bit_flag = m.group(10)
-            self.index_sequence = m.group(11)
-        else:
-            # Example of earlier Illumina format (1.3/1.5):
-            # @HWUSI-EAS100R:6:73:941:1973#0/1
-            m = RE_ILLUMINA.match(self.__seqid)
-            if m:
-                self._format = 'illumina'
-                self.instrument_name = m.group(1)
-                self.flowcell_lane = m.group(2)
-                self.tile_no = m.group(3)
-                self.x_coord = m.group(4)
-                self.y_coord = m.group(5)
-                self.multiplex_index_no = m.group(6)
-                self.pair_id = m.group(7)
+            self._fields = list(m.groups())
+            self._fields.insert(7,None)
+            return
+        # Example of earlier Illumina format (1.3/1.5):
+        # @HWUSI-EAS100R:6:73:941:1973#0/1
+        m = RE_ILLUMINA.match(self.__seqid)
+        if m:
+            self._format = 'illumina'
+            groups = m.groups()
+            self._fields = [groups[0],None,None]
+            self._fields.extend(groups[1:])
+            self._fields.extend((None,None,None))
+            return
+        self._fields = [None]*12
 
     @property
     def format(self):
@@ -340,10 +825,9 @@ class SequenceIdentifier(object):
           String: 'illumina18', 'illumina' or None
 
         """
-        try:
-            return self._format
-        except AttributeError:
-            pass
+        if self._fields is None:
+            self._parse()
+        return self._format
 
     def is_pair_of(self,seqid):
         """Check if this forms a pair with another SequenceIdentifier
@@ -371,6 +855,9 @@ class SequenceIdentifier(object):
             return False
         
     def __repr__(self):
+        if self._fields is None:
+            # Not parsed (so not modified): return what was put in
+            return self.__seqid
         if self.format == 'illumina18':
             return "@%s:%s:%s:%s:%s:%s:%s %s:%s:%s:%s" % (self.instrument_name, 
                                                           self.run_id,
@@ -395,6 +882,23 @@ class SequenceIdentifier(object):
             # Return what was put in
             return self.__seqid
 
+def _sequence_identifier_field(i,name):
+    # Internal: make a property providing access to the data item
+    # stored at position 'i' in a SequenceIdentifier
+    def getter(self):
+        if self._fields is None:
+            self._parse()
+        return self._fields[i]
+    def setter(self,value):
+        if self._fields is None:
+            self._parse()
+        self._fields[i] = value
+    return property(getter,setter,doc="'%s' data item" % name)
+
+for _i,_name in enumerate(SequenceIdentifier._FIELDS):
+    setattr(SequenceIdentifier,_name,_sequence_identifier_field(_i,_name))
+del _i,_name
+
 class FastqAttributes(object):
     """Class to provide access to gross attributes of a FASTQ file
 
@@ -437,31 +941,1052 @@ class FastqAttributes(object):
         """
         return os.path.getsize(self.__fastq_file)
 
+class ThreadedGzipReader(io.RawIOBase):
+    """Class for reading gzipped data with read-ahead decompression
+
+    ThreadedGzipReader provides a raw binary file-like object
+    for reading the uncompressed contents of a gzipped file.
+    The compressed data are read and inflated in a background
+    thread, and the blocks of uncompressed data are passed
+    back via a bounded queue; as zlib releases the GIL while
+    decompressing, this allows decompression to overlap with
+    the processing of the data by the caller.
+
+    Files consisting of multiple concatenated gzip members
+    are handled transparently.
+
+    Typically the reader should be wrapped in an
+    'io.BufferedReader' (and optionally an 'io.TextIOWrapper')
+    before use, for example:
+
+    >>> fp = io.BufferedReader(ThreadedGzipReader('reads.fq.gz'))
+
+    The 'open_gzip_threaded' function performs this wrapping.
+
+    """
+
+    def __init__(self,filen,queue_depth=GZIP_QUEUE_DEPTH,
+                 blocksize=GZIP_BLOCKSIZE):
+        """Create a new ThreadedGzipReader
+
+        Arguments:
+          filen: path to the gzipped file to read
+          queue_depth: optional; maximum number of blocks of
+            uncompressed data to hold in the queue waiting to be
+            read (default: 8)
+          blocksize: optional; number of bytes of compressed data
+            to read from the file at a time (also sets the maximum
+            size of each block of uncompressed data; default: 1Mb)
+
+        """
+        io.RawIOBase.__init__(self)
+        self.name = filen
+        self.queue_depth = queue_depth
+        self.blocksize = blocksize
+        self._block = b''
+        self._pos = 0
+        self._eof = False
+        # Start the decompression thread
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=_inflate_gzip_blocks,
+                                        args=(filen,
+                                              self._queue,
+                                              self._stop,
+                                              blocksize))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self,b):
+        """Read uncompressed data into a pre-allocated buffer
+
+        Arguments:
+          b: writable bytes-like object to read data into
+
+        Returns:
+          Integer: number of bytes read (zero at EOF).
+        """
+        while self._pos >= len(self._block):
+            if self._eof:
+                return 0
+            block = self._queue.get()
+            if block is None:
+                self._eof = True
+                self._block = b''
+                self._pos = 0
+                return 0
+            elif isinstance(block,Exception):
+                self._eof = True
+                raise block
+            self._block = block
+            self._pos = 0
+        n = min(len(b),len(self._block) - self._pos)
+        b[:n] = memoryview(self._block)[self._pos:self._pos+n]
+        self._pos += n
+        return n
+
+    def close(self):
+        """Stop the decompression thread and close the reader
+        """
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        io.RawIOBase.close(self)
+
+def _inflate_gzip_blocks(filen,blocks,stop,blocksize):
+    """Internal: decompress gzipped file into a queue of blocks
+
+    Target function for the ThreadedGzipReader decompression
+    thread. Blocks of uncompressed data are put onto the queue,
+    followed by None to indicate the end of the data; if an
+    error occurs then the exception is put onto the queue
+    instead. Decompression stops early if the 'stop' event
+    is set.
+
+    Arguments:
+      filen: path to gzipped file
+      blocks: Queue instance to put uncompressed blocks onto
+      stop: threading.Event instance signalling early stop
+      blocksize: size of compressed data chunks to read
+    """
+    def put(item):
+        # Put item on queue, giving up if stopped
+        while not stop.is_set():
+            try:
+                blocks.put(item,timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    try:
+        with io.open(filen,'rb') as fp:
+            for block in _iter_gzip_blocks(fp,blocksize):
+                if stop.is_set() or not put(block):
+                    return
+    except Exception as ex:
+        put(ex)
+        return
+    put(None)
+
+def _iter_gzip_blocks(fp,blocksize,members=None):
+    """Internal: generator yielding uncompressed blocks of gzipped data
+
+    Reads compressed data from the current position of the
+    supplied file, and yields blocks of uncompressed data.
+    Multiple concatenated gzip members are handled (ignoring
+    any trailing zero padding).
+
+    Arguments:
+      fp: file-like object opened for reading bytes
+      blocksize: size of compressed data chunks to read
+        (also the maximum size of the uncompressed blocks)
+      members: optional; if supplied then should be a list,
+        which will have a tuple appended for each member
+        that is encountered with the offsets of the start of
+        the member in the compressed data and in the
+        uncompressed data (relative to the starting position)
+    """
+    inflater = None
+    data = b''
+    nread = 0
+    uoffset = 0
+    while True:
+        if not data:
+            data = fp.read(blocksize)
+            if not data:
+                if inflater is not None:
+                    # Flush any pending output
+                    block = inflater.decompress(b'',blocksize)
+                    while block:
+                        yield block
+                        block = inflater.decompress(b'',blocksize)
+                if inflater is not None and \
+                   not _inflater_eof(inflater,final=True):
+                    raise EOFError("%s: compressed file ended "
+                                   "before the end-of-stream "
+                                   "marker was reached" %
+                                   getattr(fp,'name','<data>'))
+                return
+            nread += len(data)
+        if inflater is None:
+            # Start of a new gzip member (ignoring any
+            # trailing zero padding)
+            data = data.lstrip(b'\x00')
+            if not data:
+                continue
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if members is not None:
+                members.append((nread - len(data),uoffset))
+        block = inflater.decompress(data,blocksize)
+        if _inflater_eof(inflater):
+            # End of this member
+            data = inflater.unused_data
+            inflater = None
+        else:
+            data = inflater.unconsumed_tail
+        if block:
+            uoffset += len(block)
+            yield block
+
+def _inflater_eof(inflater,final=False):
+    """Internal: check if a zlib decompressor reached the end of a stream
+
+    On Python 2 decompressor objects don't have the 'eof'
+    attribute, so instead the end of the stream is detected
+    from any input left over after the end of the compressed
+    data; if 'final' is True (i.e. there is no more input)
+    then a single byte is passed to the decompressor to
+    check whether the stream is complete.
+
+    Arguments:
+      inflater: zlib decompressor object
+      final: optional; if True then there is no more input
+        to pass to the decompressor
+    """
+    try:
+        return inflater.eof
+    except AttributeError:
+        pass
+    if final and not inflater.unused_data:
+        try:
+            inflater.decompress(b'\x00')
+        except zlib.error:
+            return False
+    return bool(inflater.unused_data)
+
+class FastqWriter(object):
+    """Class for writing FASTQ records to a file
+
+    FastqWriter collects records into a large buffer and writes
+    them out in blocks, optionally compressing the output with
+    gzip. For example:
+
+    >>> with FastqWriter('out.fastq.gz') as fq:
+    ...     for read in FastqIterator('in.fastq'):
+    ...         fq.write(read)
+
+    The 'write' method accepts FastqRead and RawFastqRead objects,
+    record data as bytes or strings (a trailing newline is added if
+    missing), and FastqBatch objects; 'writelines' writes all the
+    records from an iterable. 'write_data' writes bytes exactly
+    as given (no newline is added).
+
+    When compressing, each block is written as an independent gzip
+    member (so the output is a valid multi-member gzip file which
+    can be read by any gzip-aware tool). If more than one thread is
+    requested then blocks are compressed concurrently by a pool of
+    threads (zlib releases the GIL while compressing) and the
+    members are written to the file in the original order.
+
+    If 'bgzf' is set then the output is written in BGZF format
+    instead (see the BGZF module), which is still valid gzip but
+    can also be decompressed in parallel and accessed randomly.
+
+    """
+
+    def __init__(self,fastq_file=None,fp=None,compress=None,nthreads=1,
+                 compresslevel=GZIP_COMPRESSLEVEL,bufsize=WRITER_BUFSIZE,
+                 bgzf=False):
+        """Create a new FastqWriter
+
+        Arguments:
+          fastq_file: name of the FASTQ file to write to
+          fp: file-like object opened for writing in binary
+            mode (used instead of 'fastq_file')
+          compress: optional; if True then gzip the output, if
+            False then write uncompressed output (default is to
+            compress if 'fastq_file' ends with '.gz')
+          nthreads: optional; number of threads to use for
+            compression (default: 1)
+          compresslevel: optional; gzip compression level (1-9,
+            default: 6)
+          bufsize: optional; size of the blocks of data (in
+            bytes) which are written (and compressed) at a time
+            (default: 4Mb)
+          bgzf: optional; if True then write compressed output
+            in BGZF format (default is to write standard gzip)
+
+        """
+        self.name = fastq_file
+        if fp is None:
+            self._fp = io.open(fastq_file,'wb')
+            self._close_fp = True
+        else:
+            self._fp = fp
+            self._close_fp = False
+        self.bgzf = bool(bgzf)
+        if compress is None:
+            compress = (self.bgzf or (fastq_file is not None and
+                                      str(fastq_file).endswith('.gz')))
+        self.compress = bool(compress)
+        if self.bgzf:
+            self._compressor = BGZF.compress_blocks
+        else:
+            self._compressor = _gzip_member
+        self.nthreads = max(1,int(nthreads))
+        self.compresslevel = compresslevel
+        self.bufsize = bufsize
+        self._buffer = []
+        self._buffered = 0
+        self._nblocks = 0
+        self._pending = collections.deque()
+        self._pool = None
+        if self.compress and self.nthreads > 1:
+            self._pool = ThreadPool(self.nthreads)
+        self.closed = False
+
+    def write(self,read):
+        """Write a record to the file
+
+        Arguments:
+          read: the record to write (either a FastqRead,
+            RawFastqRead or FastqBatch, or the record data
+            as bytes or a string)
+        """
+        if isinstance(read,RawFastqRead):
+            data = read.data
+        elif isinstance(read,bytes):
+            data = read
+        elif isinstance(read,FastqBatch):
+            records = [b''.join((read.header(i),b'\n',
+                                 read.sequence(i),b'\n+\n',
+                                 read.quality(i),b'\n'))
+                       for i in range(len(read))]
+            self._buffer.extend(records)
+            self._buffered += sum(map(len,records))
+            if self._buffered >= self.bufsize:
+                self._flush_buffer()
+            return
+        else:
+            data = str(read).encode('utf-8')
+        if not data.endswith(b'\n'):
+            data += b'\n'
+        self.write_data(data)
+
+    def write_data(self,data):
+        """Write bytes to the file verbatim
+
+        Unlike 'write', no trailing newline is added.
+
+        Arguments:
+          data: the data to write (as bytes)
+        """
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.bufsize:
+            self._flush_buffer()
+
+    def writelines(self,reads):
+        """Write multiple records to the file
+
+        Arguments:
+          reads: iterable yielding records to write (see
+            the 'write' method)
+        """
+        for read in reads:
+            self.write(read)
+
+    def flush(self):
+        """Write out all buffered data
+        """
+        self._flush_buffer()
+        while self._pending:
+            self._fp.write(self._pending.popleft().get())
+        self._fp.flush()
+
+    def close(self):
+        """Write out all buffered data and close the file
+        """
+        if self.closed:
+            return
+        if self.compress and self._nblocks == 0 and not self.bgzf:
+            # Always write at least one gzip member
+            self._nblocks += 1
+            self._fp.write(_gzip_member(b'',self.compresslevel))
+        self.flush()
+        if self.compress and self.bgzf:
+            self._fp.write(BGZF.BGZF_EOF)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self._close_fp:
+            self._fp.close()
+        self.closed = True
+
+    def _flush_buffer(self):
+        """Internal: write (and compress) the buffered data
+        """
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._nblocks += 1
+        if not self.compress:
+            self._fp.write(data)
+        elif self._pool is None:
+            self._fp.write(self._compressor(data,self.compresslevel))
+        else:
+            # Queue the block for compression and write out any
+            # completed blocks, limiting the number in flight
+            self._pending.append(self._pool.apply_async(
+                self._compressor,(data,self.compresslevel)))
+            while self._pending and (len(self._pending) > 2*self.nthreads
+                                     or self._pending[0].ready()):
+                self._fp.write(self._pending.popleft().get())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+def _gzip_member(data,compresslevel=GZIP_COMPRESSLEVEL):
+    """Internal: compress data to a complete gzip member
+
+    Arguments:
+      data: bytes to compress
+      compresslevel: gzip compression level (1-9)
+
+    Returns:
+      Bytes: the gzip member (header, deflated data and
+        trailer).
+    """
+    compressor = zlib.compressobj(compresslevel,zlib.DEFLATED,
+                                  16+zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class FastqIndex(object):
+    """Class providing random access to records in an indexed FASTQ
+
+    A FastqIndex is loaded from the '.fqi' index file created by
+    the 'build_fastq_index' function for a FASTQ file, for example:
+
+    >>> build_fastq_index('reads.fq')
+    >>> idx = FastqIndex('reads.fq')
+    >>> read = idx.get_read(1000000)
+
+    The index records the offset of the start of every Nth record
+    (where N is the index 'interval') in the uncompressed data, so
+    for uncompressed FASTQs a record can be located by seeking to
+    the nearest indexed offset and then reading at most N-1 records.
+
+    For gzipped FASTQs the index also records the offsets of each
+    gzip member in the compressed and uncompressed data. Reading
+    starts from the member containing the nearest indexed record,
+    with the data before that record being decompressed and
+    discarded without any further processing; so access is fastest
+    for files made up of many members (e.g. concatenated lanes or
+    BGZF files).
+
+    The following properties are available:
+
+    fastq: path to the indexed FASTQ file
+    nreads: total number of records in the file
+    interval: number of records between indexed offsets
+    compressed: True if the FASTQ is gzipped
+
+    Records can be fetched using the 'get_read', 'iter_range'
+    and 'iter_reads' methods, and the 'split' method will divide
+    the file into equal ranges of records.
+
+    """
+
+    def __init__(self,fastq,index_file=None):
+        """Create a new FastqIndex
+
+        Raises an exception if the index file doesn't exist, or
+        is out of date with respect to the FASTQ file (i.e. the
+        FASTQ size or modification time have changed).
+
+        Arguments:
+          fastq: path to the FASTQ file
+          index_file: optional; path to the index file (defaults
+            to the FASTQ path with '.fqi' appended)
+
+        """
+        self.fastq = fastq
+        if index_file is None:
+            index_file = fastq + FASTQ_INDEX_EXT
+        self.index_file = index_file
+        with io.open(index_file,'rb') as fp:
+            data = fp.read()
+        hdr = struct.Struct(_FASTQ_INDEX_HEADER)
+        try:
+            (magic,compressed,interval,nreads,fsize,mtime,
+             noffsets,nmembers) = hdr.unpack_from(data)
+        except struct.error:
+            magic = None
+        if magic != FASTQ_INDEX_MAGIC:
+            raise Exception("%s: not a FASTQ index file" % index_file)
+        st = os.stat(fastq)
+        if st.st_size != fsize or st.st_mtime != mtime:
+            raise Exception("%s: index is out of date for %s" %
+                            (index_file,fastq))
+        self.compressed = bool(compressed)
+        self.interval = interval
+        self.nreads = nreads
+        self._offsets = _unpack_uint64_array(data,hdr.size,noffsets)
+        members = _unpack_uint64_array(data,hdr.size+8*noffsets,
+                                       2*nmembers)
+        self._members = list(zip(members[0::2],members[1::2]))
+        # Index of the member containing each indexed record
+        self._member_for_offset = []
+        imember = 0
+        for offset in self._offsets:
+            while imember+1 < nmembers and \
+                  self._members[imember+1][1] <= offset:
+                imember += 1
+            self._member_for_offset.append(imember)
+
+    def _open_at(self,k):
+        """Internal: open the FASTQ positioned at indexed record k
+
+        Returns a file-like object opened for reading bytes
+        from the start of the record at index position k (i.e.
+        record number k*interval).
+        """
+        offset = self._offsets[k]
+        if not self.compressed:
+            fp = io.open(self.fastq,'rb')
+            fp.seek(offset)
+            return fp
+        coffset,uoffset = self._members[self._member_for_offset[k]]
+        # Opening by name means that closing the GzipFile also
+        # closes the underlying file
+        fp = gzip.open(self.fastq,'rb')
+        try:
+            fp.fileobj.seek(coffset)
+            # Skip uncompressed data up to the required offset
+            skip = offset - uoffset
+            while skip:
+                data = fp.read(min(skip,GZIP_BLOCKSIZE))
+                if not data:
+                    raise Exception("%s: unexpected end of data" %
+                                    self.fastq)
+                skip -= len(data)
+        except Exception:
+            fp.close()
+            raise
+        return fp
+
+    def _seek_base(self,k):
+        """Internal: return uncompressed offset where seek to k starts
+        """
+        if not self.compressed:
+            return self._offsets[k]
+        return self._members[self._member_for_offset[k]][1]
+
+    def iter_reads(self,indices,binary=False):
+        """Iterate over records specified by their index positions
+
+        Records are returned in order of their positions in
+        the file (with index 0 being the first record),
+        regardless of the order of the supplied indices.
+
+        The file is only repositioned when a later indexed
+        offset is closer to the next requested record than
+        the current position; otherwise reading continues
+        from the current position.
+
+        Arguments:
+          indices: iterable with the index positions of the
+            records to return
+          binary: optional; if True then return RawFastqRead
+            objects (default is to return FastqRead objects)
+
+        Yields:
+          FastqRead (or RawFastqRead) for each requested record.
+        """
+        indices = sorted([int(i) for i in indices])
+        if not indices:
+            return
+        if indices[0] < 0 or indices[-1] >= self.nreads:
+            raise IndexError("One or more requested read indices out "
+                             "of range")
+        fp = None
+        reads = None
+        current = None
+        try:
+            for idx in indices:
+                k = idx//self.interval
+                if reads is None or idx < current or \
+                   self._seek_base(k) > \
+                   self._offsets[current//self.interval]:
+                    # Reposition at the nearest indexed record
+                    if fp is not None:
+                        fp.close()
+                    fp = self._open_at(k)
+                    reads = iter(FastqIterator(fp=fp,binary=True))
+                    current = k*self.interval
+                # Skip to the required record
+                for read in itertools.islice(reads,idx-current,None):
+                    break
+                current = idx + 1
+                if binary:
+                    yield read
+                else:
+                    yield read.fastqread()
+        finally:
+            if fp is not None:
+                fp.close()
+
+    def iter_range(self,start,stop=None,binary=False):
+        """Iterate over a contiguous range of records
+
+        Arguments:
+          start: index of the first record to return (with
+            index 0 being the first record in the file)
+          stop: optional; index of the record to stop at (i.e.
+            this record is not included); defaults to the end
+            of the file
+          binary: optional; if True then return RawFastqRead
+            objects (default is to return FastqRead objects)
+
+        Yields:
+          FastqRead (or RawFastqRead) for each record in the
+          range.
+        """
+        if stop is None or stop > self.nreads:
+            stop = self.nreads
+        if start < 0 or start > self.nreads:
+            raise IndexError("Start index %s out of range" % start)
+        if start >= stop:
+            return
+        k = start//self.interval
+        fp = self._open_at(k)
+        try:
+            reads = itertools.islice(FastqIterator(fp=fp,binary=True),
+                                     start-k*self.interval,
+                                     stop-k*self.interval)
+            for read in reads:
+                if binary:
+                    yield read
+                else:
+                    yield read.fastqread()
+        finally:
+            fp.close()
+
+    def get_read(self,n,binary=False):
+        """Return a single record
+
+        Arguments:
+          n: index of the record to return (with index 0
+            being the first record in the file)
+          binary: optional; if True then return a RawFastqRead
+            object (default is to return a FastqRead)
+
+        Returns:
+          FastqRead (or RawFastqRead) for the record.
+        """
+        if n < 0 or n >= self.nreads:
+            raise IndexError("Read index %s out of range" % n)
+        for read in self.iter_range(n,n+1,binary=binary):
+            return read
+
+    def split(self,k):
+        """Divide the records into equal contiguous ranges
+
+        Arguments:
+          k: number of ranges to divide the records into
+
+        Returns:
+          List: list of (start,stop) tuples giving the record
+            indices for each range, suitable for passing to
+            'iter_range'.
+        """
+        if k < 1:
+            raise ValueError("Number of ranges must be a positive integer")
+        bounds = [i*self.nreads//k for i in range(k+1)]
+        return [(bounds[i],bounds[i+1]) for i in range(k)]
+
+    def __len__(self):
+        return self.nreads
+
+class ReadCount(object):
+    """Class to hold the result of counting reads in a FASTQ file
+
+    Returned by the 'count_fastq_reads' function; provides the
+    following properties:
+
+    fastq: path to the FASTQ file
+    nreads: number of reads in the file
+    nbytes: number of bytes of (uncompressed) data processed
+    elapsed: time taken to count the reads (seconds)
+    bytes_per_second: rate at which the data were processed
+
+    """
+    def __init__(self,fastq,nreads,nbytes,elapsed):
+        """Create a new ReadCount
+
+        Arguments:
+          fastq: path to the FASTQ file
+          nreads: number of reads counted
+          nbytes: number of bytes of data processed
+          elapsed: time taken (in seconds)
+        """
+        self.fastq = fastq
+        self.nreads = nreads
+        self.nbytes = nbytes
+        self.elapsed = elapsed
+
+    @property
+    def bytes_per_second(self):
+        """Return the number of bytes processed per second
+        """
+        if self.elapsed > 0:
+            return self.nbytes/float(self.elapsed)
+        return float(self.nbytes)
+
+    def __repr__(self):
+        return "%s: %d reads" % (self.fastq,self.nreads)
+
+class FastqChunk(object):
+    """Class representing a section of a FASTQ file
+
+    FastqChunk objects are returned by the 'chunks' function and
+    provide the following properties:
+
+    fastq: path to the FASTQ file
+    start: start of the section
+    end: end of the section (or None for the end of the file)
+    indexed: True if 'start' and 'end' are record numbers (to
+      be located via the '.fqi' index), False if they are
+      byte offsets into the uncompressed file
+
+    The records in the section can be obtained via the
+    'iter_reads' method, or by iterating over the chunk:
+
+    >>> for read in chunk:
+    ...    print(read.seqid)
+
+    FastqChunks only store the file name and limits, so they
+    can be passed cheaply to other processes.
+
+    """
+    def __init__(self,fastq,start=0,end=None,indexed=False):
+        """Create a new FastqChunk
+
+        Arguments:
+          fastq: path to the FASTQ file
+          start: start of the section (byte offset or record
+            number; default: 0)
+          end: end of the section (byte offset or record number;
+            default: None, i.e. to the end of the file)
+          indexed: optional; if True then 'start' and 'end' are
+            record numbers in the '.fqi' index for the file
+        """
+        self.fastq = fastq
+        self.start = start
+        self.end = end
+        self.indexed = indexed
+
+    def iter_reads(self,binary=False):
+        """Iterate over the records in the section
+
+        Arguments:
+          binary: optional; if True then yield RawFastqRead
+            objects (default is to yield FastqRead objects)
+        """
+        if self.indexed:
+            for read in FastqIndex(self.fastq).iter_range(self.start,
+                                                          self.end,
+                                                          binary=binary):
+                yield read
+            return
+        if self.start == 0 and self.end is None:
+            for read in FastqIterator(self.fastq,binary=binary):
+                yield read
+            return
+        fp = io.open(self.fastq,'rb')
+        try:
+            fp.seek(self.start)
+            fp = io.BufferedReader(_BoundedReader(fp,self.end-self.start))
+            if not binary:
+                fp = io.TextIOWrapper(fp)
+            for read in FastqIterator(fp=fp,binary=binary):
+                yield read
+        finally:
+            fp.close()
+
+    def iter_blocks(self,blocksize=GZIP_BLOCKSIZE):
+        """Iterate over blocks of raw data from the section
+
+        Each block is a bytes object holding one or more
+        complete records (including the trailing newline of
+        the last record), so that the raw data can be scanned
+        without splitting it into individual records first.
+
+        Arguments:
+          blocksize: optional; approximate number of bytes
+            to read for each block (blocks are extended or
+            truncated to the nearest record boundary)
+        """
+        if self.indexed:
+            reads = FastqIndex(self.fastq).iter_range(self.start,
+                                                      self.end,
+                                                      binary=True)
+            nreads = max(1,blocksize//256)
+            while True:
+                block = b''.join([r.data for r in
+                                  itertools.islice(reads,nreads)])
+                if not block:
+                    return
+                yield block
+        if self.start == 0 and self.end is None:
+            fp = get_fastq_file_handle(self.fastq,'rb',threaded=True)
+        else:
+            fp = io.open(self.fastq,'rb')
+            fp.seek(self.start)
+            fp = io.BufferedReader(_BoundedReader(fp,self.end-self.start))
+        try:
+            for block in _iter_record_blocks(fp,blocksize):
+                yield block
+        finally:
+            fp.close()
+
+    def __iter__(self):
+        return self.iter_reads()
+
+    def __repr__(self):
+        return "%s[%s:%s]" % (self.fastq,self.start,
+                              '' if self.end is None else self.end)
+
+def _iter_record_blocks(fp,blocksize):
+    """Internal: yield blocks of complete records from a file
+
+    Reads the data in blocks and cuts each block after the
+    last complete 4-line record, by counting the newlines
+    rather than splitting the block into lines; the remaining
+    data are carried over to the start of the next block. As
+    with FastqIterator, any incomplete record at the end of
+    the data is discarded.
+
+    Arguments:
+      fp: file-like object opened for reading bytes, and
+        positioned at the start of a record
+      blocksize: number of bytes to read for each block
+    """
+    tail = b''
+    eof = False
+    while not eof:
+        data = fp.read(blocksize)
+        if not data:
+            # Final block: terminate the last line if necessary
+            eof = True
+            if tail and not tail.endswith(b'\n'):
+                tail += b'\n'
+        data = tail + data
+        # Locate the end of the last complete record
+        nlines = data.count(b'\n')
+        if nlines < 4:
+            end = 0
+        else:
+            end = len(data)
+            for i in range(nlines%4+1):
+                end = data.rfind(b'\n',0,end)
+            end += 1
+        tail = data[end:]
+        if end:
+            yield data[:end]
+
+class _BoundedReader(io.RawIOBase):
+    """Internal: raw reader returning at most 'size' bytes from 'fp'
+    """
+    def __init__(self,fp,size):
+        io.RawIOBase.__init__(self)
+        self._fp = fp
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self,b):
+        n = min(len(b),self._remaining)
+        if n <= 0:
+            return 0
+        data = self._fp.read(n)
+        b[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._fp.close()
+        io.RawIOBase.close(self)
+
+class QualityEncoding(object):
+    """Class to hold the result of sniffing a FASTQ quality encoding
+
+    Returned by the 'sniff_encoding' function; provides the
+    following properties:
+
+    fastq: path to the FASTQ file (or None)
+    header_format: format of the first read header ('illumina18',
+      'illumina', 'colorspace' or None)
+    seqlen: sequence length of the first read
+    nreads: number of reads examined
+    min_qual: smallest quality character code seen
+    max_qual: largest quality character code seen
+    encodings: list of the encodings consistent with the quality
+      values (some or all of 'Phred+33', 'Phred+64', 'Solexa+64')
+    galaxy_types: list of the corresponding Galaxy data types
+    encoding: the most likely encoding (or None)
+    galaxy_type: the Galaxy data type for the most likely encoding
+    confidence: 'high' if only one encoding is consistent with
+      the data, 'low' if more than one is (in which case
+      'encoding' is a best guess), or None if no encodings are
+      consistent
+    complete: True if all the reads (or the requested subset)
+      were examined, False if the scan stopped early once the
+      encoding was determined
+
+    """
+    def __init__(self,fastq=None,header_format=None,seqlen=None,
+                 nreads=0,min_qual=None,max_qual=None,complete=True):
+        """Create a new QualityEncoding
+
+        Arguments:
+          fastq: path to the FASTQ file
+          header_format: format of the first read header
+          seqlen: sequence length of the first read
+          nreads: number of reads examined
+          min_qual: smallest quality character code
+          max_qual: largest quality character code
+          complete: whether all reads were examined
+        """
+        self.fastq = fastq
+        self.header_format = header_format
+        self.seqlen = seqlen
+        self.nreads = nreads
+        self.min_qual = min_qual
+        self.max_qual = max_qual
+        self.complete = complete
+        self.encodings = []
+        self.galaxy_types = []
+        if min_qual is not None:
+            for name,lo,hi,galaxy_type in QUALITY_ENCODINGS:
+                if min_qual < lo or max_qual > hi:
+                    continue
+                if header_format == 'colorspace':
+                    if name != 'Phred+33':
+                        continue
+                    galaxy_type = 'fastqcssanger'
+                self.encodings.append(name)
+                self.galaxy_types.append(galaxy_type)
+
+    @property
+    def encoding(self):
+        """Return the most likely encoding
+        """
+        if self.encodings:
+            return self.encodings[0]
+        return None
+
+    @property
+    def galaxy_type(self):
+        """Return the Galaxy type for the most likely encoding
+        """
+        if self.galaxy_types:
+            return self.galaxy_types[0]
+        return None
+
+    @property
+    def confidence(self):
+        """Return the confidence in the most likely encoding
+        """
+        if not self.encodings:
+            return None
+        elif len(self.encodings) == 1:
+            return 'high'
+        return 'low'
+
+    def __repr__(self):
+        return "%s: %s" % (self.fastq,self.encoding)
+
+# Header for FASTQ index files: magic (4 bytes), compression flag,
+# interval, number of reads, FASTQ size, FASTQ mtime, number of
+# indexed offsets, and number of gzip members
+_FASTQ_INDEX_HEADER = '<4sBxxxQQQdQQ'
+
+def _pack_uint64_array(values):
+    """Internal: convert list of integers to little-endian uint64 bytes
+    """
+    return struct.pack('<%dQ' % len(values),*values)
+
+def _unpack_uint64_array(data,offset,n):
+    """Internal: convert little-endian uint64 bytes to list of integers
+    """
+    return list(struct.unpack_from('<%dQ' % n,data,offset))
+
 #######################################################################
 # Functions
 #######################################################################
 
-def get_fastq_file_handle(fastq,mode='rt'):
+def get_fastq_file_handle(fastq,mode='rt',threaded=False):
     """Return a file handle opened for reading for a FASTQ file
 
     Deals with both compressed (gzipped) and uncompressed FASTQ
     files.
 
+    If 'threaded' is True then gzipped FASTQs are opened for
+    reading using 'open_gzip_threaded', so that decompression
+    is performed in a background thread.
+
     Arguments:
       fastq: name (including path, if required) of FASTQ file.
         The file can be gzipped (must have '.gz' extension)
       mode: optional mode for file opening (defaults to 'rt')
+      threaded: optional; if True then use threaded
+        decompression when reading gzipped FASTQs (default
+        is to use 'gzip.open')
 
     Returns:
       File handle that can be used for read operations.
 
     """
     if os.path.splitext(fastq)[1] == '.gz':
+        if threaded and mode in ('r','rb','rt'):
+            return open_gzip_threaded(fastq,mode)
         return gzip.open(fastq,mode)
     else:
         return io.open(fastq,mode)
 
-def nreads(fastq=None,fp=None):
+def open_gzip_threaded(filen,mode='rb',queue_depth=GZIP_QUEUE_DEPTH,
+                       blocksize=GZIP_BLOCKSIZE):
+    """Open a gzipped file for reading with threaded decompression
+
+    Returns a file-like object for reading the uncompressed
+    contents of a gzipped file, where decompression is performed
+    in a background thread by a ThreadedGzipReader instance.
+
+    Arguments:
+      filen: path to the gzipped file
+      mode: optional; either 'rb' (or 'r', the default) to read
+        bytes, or 'rt' to read text
+      queue_depth: optional; maximum number of uncompressed
+        blocks to read ahead (default: 8)
+      blocksize: optional; size of compressed data chunks to
+        read from the file (default: 1Mb)
+
+    Returns:
+      File-like object opened for reading.
+
+    """
+    if mode not in ('r','rb','rt'):
+        raise ValueError("Invalid mode for reading: '%s'" % mode)
+    fp = io.BufferedReader(ThreadedGzipReader(filen,
+                                              queue_depth=queue_depth,
+                                              blocksize=blocksize),
+                           buffer_size=blocksize)
+    if mode == 'rt':
+        return io.TextIOWrapper(fp)
+    return fp
+
+def nreads(fastq=None,fp=None,nprocs=1):
     """Return number of reads in a FASTQ file
 
     Performs a simple-minded read count, by counting the number of lines
@@ -472,7 +1997,8 @@ def nreads(fastq=None,fp=None):
     'fp' argument).
 
     This function can handle gzipped FASTQ files supplied via the 'fastq'
-    argument.
+    argument; FASTQs supplied by name are counted using the
+    'count_fastq_reads' function.
 
     Line counting uses a variant of the "buf count" method outlined here:
     http://stackoverflow.com/a/850962/579925
@@ -480,32 +2006,438 @@ def nreads(fastq=None,fp=None):
     Arguments:
       fastq: fastq(.gz) file
       fp: open file descriptor for fastq file
+      nprocs: optional; number of processes to use when counting
+        large uncompressed FASTQs supplied by name (default: 1)
 
     Returns:
       Number of reads
 
     """
-    nlines = 0
     if fp is None:
-        fp = get_fastq_file_handle(fastq)
+        return count_fastq_reads(fastq,nprocs=nprocs)[0].nreads
+    nlines = 0
     buf_size = 1024 * 1024
     read_fp = fp.read # optimise the loop
     buf = read_fp(buf_size)
+    if isinstance(buf,bytes):
+        newline = b'\n'
+    else:
+        newline = '\n'
     while buf:
-        nlines += buf.count('\n')
+        nlines += buf.count(newline)
         buf = read_fp(buf_size)
-    if fastq is not None:
-        fp.close()
     if (nlines%4) != 0:
         raise Exception("Bad read count (not fastq file, or corrupted?)")
-    return nlines/4
+    return nlines//4
+
+def count_fastq_reads(fastqs,nprocs=1,chunksize=COUNT_CHUNKSIZE):
+    """Count the reads in one or more FASTQ files
+
+    Counts the reads in each file by counting newlines in the
+    raw (uncompressed) bytes, without decoding the data to text.
+
+    Uncompressed FASTQs are memory-mapped; if more than one
+    process is requested then files larger than 'chunksize'
+    are split into chunks which are counted in parallel.
+    Gzipped FASTQs are decompressed and counted in a single
+    process each. Multiple files are counted concurrently
+    when more than one process is used.
+
+    Raises an exception if the number of lines in any file is
+    not a multiple of four.
+
+    Example:
 
-def fastqs_are_pair(fastq1=None,fastq2=None,verbose=True,fp1=None,fp2=None):
+    >>> for count in count_fastq_reads(fastqs,nprocs=4):
+    >>>    print("%s\t%d" % (count.fastq,count.nreads))
+
+    Arguments:
+      fastqs: path to a FASTQ file, or a list of paths
+      nprocs: optional; number of processes to use (default: 1)
+      chunksize: optional; size of the chunks (in bytes) that
+        large uncompressed FASTQs are split into for parallel
+        counting
+
+    Returns:
+      List: ReadCount instances for each FASTQ, in the same order
+        as the input.
+    """
+    if isinstance(fastqs,str):
+        fastqs = [fastqs]
+    else:
+        fastqs = list(fastqs)
+    # Make list of tasks
+    tasks = []
+    for i,fastq in enumerate(fastqs):
+        if os.path.splitext(fastq)[1] == '.gz' or nprocs <= 1:
+            tasks.append((i,fastq,0,None))
+        else:
+            fsize = os.path.getsize(fastq)
+            for start in range(0,max(fsize,1),chunksize):
+                tasks.append((i,fastq,start,min(start+chunksize,fsize)))
+    # Count lines
+    nlines = [0]*len(fastqs)
+    nbytes = [0]*len(fastqs)
+    elapsed = [0.0]*len(fastqs)
+    if nprocs > 1 and len(tasks) > 1:
+        pool = Pool(nprocs)
+        mapper = pool.imap_unordered
+    else:
+        pool = None
+        mapper = map
+    try:
+        for i,n,size,t in mapper(_count_newlines,tasks):
+            nlines[i] += n
+            nbytes[i] += size
+            elapsed[i] += t
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    # Assemble results
+    counts = []
+    for i,fastq in enumerate(fastqs):
+        if nlines[i]%4 != 0:
+            raise Exception("%s: bad read count (not fastq file, or "
+                            "corrupted?)" % fastq)
+        counts.append(ReadCount(fastq,nlines[i]//4,nbytes[i],elapsed[i]))
+    return counts
+
+def _count_newlines(task):
+    """Internal: count newlines in a FASTQ file or part of a file
+
+    Worker function for 'count_fastq_reads'. The task is a
+    tuple (i,fastq,start,end), where 'start' and 'end' specify
+    the byte range to count within for an uncompressed FASTQ
+    (if 'end' is None then counts to the end of the file).
+
+    Returns a tuple (i,nlines,nbytes,elapsed).
+    """
+    i,fastq,start,end = task
+    t0 = time.time()
+    nlines = 0
+    nbytes = 0
+    if os.path.splitext(fastq)[1] == '.gz':
+        with io.open(fastq,'rb') as fp:
+            for block in _iter_gzip_blocks(fp,GZIP_BLOCKSIZE):
+                nlines += block.count(b'\n')
+                nbytes += len(block)
+    else:
+        if end is None:
+            end = os.path.getsize(fastq)
+        if end > start:
+            with io.open(fastq,'rb') as fp:
+                mm = mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ)
+                try:
+                    for pos in range(start,end,GZIP_BLOCKSIZE):
+                        nlines += mm[pos:min(pos+GZIP_BLOCKSIZE,end)].\
+                                  count(b'\n')
+                finally:
+                    mm.close()
+            nbytes = end - start
+    return (i,nlines,nbytes,time.time()-t0)
+
+def chunks(fastq,n):
+    """Split a FASTQ file into sections aligned to record boundaries
+
+    Uncompressed FASTQs are split into 'n' byte ranges of
+    roughly equal size; the end of each range is moved forward
+    to the start of the next record. A line starting with '@'
+    is only treated as the start of a record if the line two
+    lines further on starts with '+', so quality strings which
+    happen to begin with '@' are not mistaken for headers.
+
+    Gzipped FASTQs can only be split if they have a valid
+    '.fqi' index (see 'build_fastq_index'), in which case they
+    are split into 'n' ranges of records; otherwise a single
+    chunk covering the whole file is returned.
+
+    Empty sections are dropped, so fewer than 'n' chunks may be
+    returned for small files (but there is always at least
+    one).
+
+    Arguments:
+      fastq: path to the FASTQ file
+      n: number of chunks to split the file into
+
+    Returns:
+      List: FastqChunk instances covering the whole of the
+        file, in order.
+    """
+    n = max(1,int(n))
+    if os.path.splitext(fastq)[1] == '.gz':
+        index = None
+        if n > 1 and os.path.exists(fastq+FASTQ_INDEX_EXT):
+            try:
+                index = FastqIndex(fastq)
+            except Exception as ex:
+                logging.warning("%s: ignoring index: %s" % (fastq,ex))
+        if index is None:
+            return [FastqChunk(fastq)]
+        return [FastqChunk(fastq,start,stop,indexed=True)
+                for start,stop in index.split(n)
+                if stop > start] or [FastqChunk(fastq,0,0,indexed=True)]
+    fsize = os.path.getsize(fastq)
+    bounds = [0]
+    with io.open(fastq,'rb') as fp:
+        for i in range(1,n):
+            offset = max(fsize*i//n,bounds[-1])
+            bounds.append(_find_record_start(fp,offset,fsize))
+    bounds.append(fsize)
+    return [FastqChunk(fastq,bounds[i],bounds[i+1])
+            for i in range(n)
+            if bounds[i+1] > bounds[i]] or [FastqChunk(fastq,0,0)]
+
+def _find_record_start(fp,offset,fsize):
+    """Internal: locate the first record starting at or after offset
+
+    Arguments:
+      fp: file object opened in binary mode
+      offset: byte offset to start searching from
+      fsize: size of the file
+
+    Returns:
+      Integer: offset of the start of the next record, or
+        'fsize' if there are no more records.
+    """
+    if offset <= 0:
+        return 0
+    size = CHUNK_SCAN_SIZE
+    while True:
+        # Start from the preceding byte, so that a record starting
+        # exactly at 'offset' is found
+        fp.seek(offset-1)
+        data = fp.read(size)
+        at_eof = (offset - 1 + len(data) >= fsize)
+        lines = data.split(b'\n')
+        if not at_eof:
+            # Final line may be incomplete
+            lines.pop()
+        if lines:
+            # Skip the partial line before the first newline
+            pos = len(lines[0]) + 1
+            for i in range(1,len(lines)-2):
+                if lines[i].startswith(b'@') and \
+                   lines[i+2].startswith(b'+'):
+                    return offset - 1 + pos
+                pos += len(lines[i]) + 1
+        if at_eof:
+            return fsize
+        # Not enough lines in the window, try a bigger one
+        size *= 2
+
+def parallel_map(func,fastq,nprocs=1,reducer=None,nchunks=None):
+    """Apply a function to sections of a FASTQ file in parallel
+
+    Splits the FASTQ using the 'chunks' function and calls
+    'func' on each FastqChunk in a pool of processes. The
+    results are returned in the order of the chunks in the
+    file, or combined using 'reducer' if this is supplied.
+
+    'func' must be a function defined at the top level of a
+    module (so that it can be passed to other processes).
+
+    Example: count reads per lane
+
+    >>> def count_lanes(chunk):
+    ...     counts = collections.Counter()
+    ...     for read in chunk.iter_reads(binary=True):
+    ...         counts[read.raw_seqid.split(b':')[3]] += 1
+    ...     return counts
+    >>> lanes = parallel_map(count_lanes,fastq,nprocs=4,
+    ...                      reducer=operator.add)
+
+    Arguments:
+      func: function to apply to each FastqChunk
+      fastq: path to the FASTQ file
+      nprocs: optional; number of processes to use (default:
+        1, i.e. run in the current process)
+      reducer: optional; function taking two results and
+        returning the combined result (used to reduce the
+        results to a single value via 'functools.reduce')
+      nchunks: optional; number of chunks to split the FASTQ
+        into (default: same as 'nprocs')
+
+    Returns:
+      List of results for each chunk (in order), or the reduced
+        result if 'reducer' was specified.
+    """
+    if nchunks is None:
+        nchunks = nprocs
+    fastq_chunks = chunks(fastq,nchunks)
+    if nprocs > 1 and len(fastq_chunks) > 1:
+        pool = Pool(min(nprocs,len(fastq_chunks)))
+        try:
+            results = pool.map(func,fastq_chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [func(chunk) for chunk in fastq_chunks]
+    if reducer is not None:
+        return functools.reduce(reducer,results)
+    return results
+
+def sniff_encoding(fastq=None,fp=None,subset=None,early_stop=True,
+                   blocksize=SNIFF_BLOCKSIZE):
+    """Determine the likely quality encoding of a FASTQ file
+
+    Scans the quality lines of the reads as raw bytes, in large
+    blocks, to find the range of quality characters; the range
+    is then compared with the ranges for each of the possible
+    encodings. The header format and sequence length are taken
+    from the first read.
+
+    As the range can only grow as more reads are examined, the
+    set of possible encodings can only shrink; by default the
+    scan stops as soon as only one (or no) encoding remains
+    possible (for example, as soon as a quality character lower
+    than ';' is seen the encoding must be 'Phred+33').
+
+    The minimum and maximum quality values in each block are
+    found using NumPy if it is available, otherwise via
+    'bytes.translate'.
+
+    Arguments:
+      fastq: path to the FASTQ file (can be gzipped)
+      fp: file-like object opened for reading in binary mode
+        (used instead of 'fastq')
+      subset: optional; if set then only examine (up to) this
+        number of reads from the start of the file
+      early_stop: optional; if False then examine all the reads
+        (or the subset) even after the encoding is determined
+      blocksize: optional; size of the blocks of data to read
+        (default: 1Mb)
+
+    Returns:
+      QualityEncoding: the results of the sniffing.
+    """
+    if fp is None:
+        fp_ = get_fastq_file_handle(fastq,'rb',threaded=True)
+    else:
+        fp_ = fp
+    header_format = None
+    seqlen = None
+    nreads = 0
+    qmin = None
+    qmax = None
+    complete = True
+    first_read = []
+    try:
+        nlines = 0
+        partial = b''
+        while True:
+            block = fp_.read(blocksize)
+            if block:
+                lines = (partial + block).split(b'\n')
+                partial = lines.pop()
+            elif partial:
+                # Final line with no trailing newline
+                lines = [partial]
+                partial = b''
+            else:
+                break
+            if seqlen is None:
+                # Get information from the first read
+                first_read.extend(lines[:4-len(first_read)])
+                if len(first_read) == 4:
+                    read = FastqRead(*[l.decode('utf-8')
+                                       for l in first_read])
+                    header_format = read.seqid.format
+                    if header_format is None and read.is_colorspace:
+                        header_format = 'colorspace'
+                    seqlen = read.seqlen
+            # Extract the quality lines
+            quals = lines[(3-nlines)%4::4]
+            nlines += len(lines)
+            if subset is not None:
+                quals = quals[:subset-nreads]
+            nreads += len(quals)
+            if quals:
+                data = b''.join(quals)
+                if b'\r' in data:
+                    data = b''.join([q.rstrip(b'\r') for q in quals])
+                if data:
+                    qmin,qmax = _update_min_max(data,qmin,qmax)
+            if subset is not None and nreads == subset:
+                break
+            if early_stop and qmin is not None:
+                encoding = QualityEncoding(min_qual=qmin,max_qual=qmax,
+                                           header_format=header_format)
+                if len(encoding.encodings) <= 1:
+                    complete = False
+                    break
+    finally:
+        if fp is None:
+            fp_.close()
+    return QualityEncoding(fastq=fastq,
+                           header_format=header_format,
+                           seqlen=seqlen,
+                           nreads=nreads,
+                           min_qual=qmin,
+                           max_qual=qmax,
+                           complete=complete)
+
+# Lookup of all byte values (for 'bytes.translate')
+_ALL_BYTES = bytes(bytearray(range(256)))
+
+def _update_min_max(data,qmin=None,qmax=None):
+    """Internal: update min and max byte values with new data
+
+    Arguments:
+      data: non-empty bytes
+      qmin: current minimum byte value (or None)
+      qmax: current maximum byte value (or None)
+
+    Returns:
+      Tuple: updated (qmin,qmax).
+    """
+    if numpy is not None:
+        arr = numpy.frombuffer(data,dtype=numpy.uint8)
+        dmin,dmax = int(arr.min()),int(arr.max())
+        if qmin is None:
+            return (dmin,dmax)
+        return (min(qmin,dmin),max(qmax,dmax))
+    if qmin is None:
+        # Start from the first byte
+        qmin = qmax = bytearray(data[:1])[0]
+    # Remove all bytes within the current range; anything left
+    # over extends the range
+    below = data.translate(None,_ALL_BYTES[qmin:])
+    if below:
+        qmin = min(bytearray(below))
+    above = data.translate(None,_ALL_BYTES[:qmax+1])
+    if above:
+        qmax = max(bytearray(above))
+    return (qmin,qmax)
+
+def fastqs_are_pair(fastq1=None,fastq2=None,verbose=True,fp1=None,fp2=None,
+                    fast=False):
     """Check that two FASTQs form an R1/R2 pair
 
+    By default the sequence identifiers for each pair of
+    reads are fully parsed and compared using the
+    'is_pair_of' method of the SequenceIdentifier class.
+
+    Alternatively a faster (but less stringent) 'fast' check
+    can be requested, where the raw sequence identifiers are
+    compared up to the first space (or up to the trailing
+    '/1' or '/2' for older Illumina formats), without creating
+    SequenceIdentifier objects (see the 'pair_key' function).
+
     Arguments:
       fastq1: first FASTQ
       fastq2: second FASTQ
+      verbose: if True (the default) then report progress
+        and any unpaired reads
+      fp1: file-like object opened for reading the first
+        FASTQ (instead of 'fastq1'); must be opened in binary
+        mode if 'fast' is True
+      fp2: file-like object opened for reading the second
+        FASTQ (instead of 'fastq2'); must be opened in binary
+        mode if 'fast' is True
+      fast: if True then perform fast check of the pairs
+        (default is to perform the full check)
 
     Returns:
       True if each read in fastq1 forms an R1/R2 pair with the equivalent
@@ -514,19 +2446,134 @@ def fastqs_are_pair(fastq1=None,fastq2=None,verbose=True,fp1=None,fp2=None):
       than the other).
 
     """
-    # Use izip_longest, which will return None if either of
-    # the fastqs is exhausted before the other
     i = 0
-    for r1,r2 in itertools.zip_longest(
-            FastqIterator(fastq_file=fastq1,fp=fp1),
-            FastqIterator(fastq_file=fastq2,fp=fp2)):
-        i += 1
-        if verbose:
-            if i%100000 == 0:
-                print("Examining pair #%d" % i)
-        if not r1.seqid.is_pair_of(r2.seqid):
+    try:
+        for r1,r2 in FastqPairIterator(fastq1=fastq1,fastq2=fastq2,
+                                       fp1=fp1,fp2=fp2,binary=fast):
+            i += 1
             if verbose:
-                print("Unpaired headers for read position #%d:" % i)
-                print("%s\n%s" % (r1.seqid,r2.seqid))
-            return False
+                if i%100000 == 0:
+                    print("Examining pair #%d" % i)
+            if fast:
+                paired = (pair_key(r1[0]) == pair_key(r2[0]))
+            else:
+                paired = r1.seqid.is_pair_of(r2.seqid)
+            if not paired:
+                if verbose:
+                    print("Unpaired headers for read position #%d:" % i)
+                    print("%s\n%s" % (r1.seqid,r2.seqid))
+                return False
+    except FastqPairError as ex:
+        if verbose:
+            print("Failed to check pair at read position #%d: %s" %
+                  (i+1,ex))
+        return False
     return True
+
+def pair_key(seqid):
+    """Return the part of a sequence identifier shared by a read pair
+
+    For Illumina 1.8+ format sequence identifiers this is the
+    part of the identifier up to the first space, e.g. for
+
+    @EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG
+
+    the key is '@EAS139:136:FC706VJ:2:2104:15343:197393'. For
+    earlier formats this is the part of the identifier before
+    the trailing '/1' or '/2' (otherwise the whole identifier
+    is returned).
+
+    Arguments:
+      seqid: the sequence identifier line (either as bytes
+        or as a string)
+
+    Returns:
+      Bytes (or string): the key for the sequence identifier.
+    """
+    if isinstance(seqid,bytes):
+        space,suffixes = b' ',(b'/1',b'/2')
+    else:
+        space,suffixes = ' ',('/1','/2')
+    i = seqid.find(space)
+    if i != -1:
+        return seqid[:i]
+    seqid = seqid.rstrip()
+    if seqid[-2:] in suffixes:
+        return seqid[:-2]
+    return seqid
+
+def build_fastq_index(fastq,interval=FASTQ_INDEX_INTERVAL,index_file=None):
+    """Create a random access index file for a FASTQ
+
+    Scans the FASTQ file and writes a compact binary index file
+    recording the offset of every Nth record in the uncompressed
+    data (and, for gzipped FASTQs, the offsets of each gzip
+    member in the compressed and uncompressed data). The index
+    is used by the FastqIndex class.
+
+    Arguments:
+      fastq: path to the FASTQ file (can be gzipped)
+      interval: optional; number of records between indexed
+        offsets (default: 1000)
+      index_file: optional; path to write the index file to
+        (defaults to the FASTQ path with '.fqi' appended)
+
+    Returns:
+      FastqIndex: the index for the FASTQ.
+    """
+    if interval < 1:
+        raise ValueError("Index interval must be a positive integer")
+    if index_file is None:
+        index_file = fastq + FASTQ_INDEX_EXT
+    st = os.stat(fastq)
+    compressed = (os.path.splitext(fastq)[1] == '.gz')
+    members = []
+    offsets = [0]
+    nlines = 0
+    pos = 0
+    interval_lines = 4*interval
+    with io.open(fastq,'rb') as fp:
+        if compressed:
+            blocks = _iter_gzip_blocks(fp,GZIP_BLOCKSIZE,members)
+        else:
+            blocks = iter(functools.partial(fp.read,GZIP_BLOCKSIZE),b'')
+        for block in blocks:
+            nblock = block.count(b'\n')
+            # Next line to be indexed after the first line in
+            # this block, relative to the line count at the start
+            # of the block (nb the line after the nth newline in
+            # the block has relative number n)
+            first = interval_lines - nlines%interval_lines
+            if first <= nblock:
+                # Offsets of the line starts after each newline
+                ends = []
+                end = 0
+                for line in block.split(b'\n'):
+                    end += len(line) + 1
+                    ends.append(end)
+                for i in range(first,nblock+1,interval_lines):
+                    offsets.append(pos + ends[i-1])
+            nlines += nblock
+            pos += len(block)
+    # Allow for missing trailing newline
+    if pos and nlines%4 == 3:
+        nlines += 1
+    if nlines%4 != 0:
+        raise Exception("%s: bad read count (not fastq file, or "
+                        "corrupted?)" % fastq)
+    nreads = nlines//4
+    # Remove any offset recorded for EOF
+    offsets = [o for o in offsets if o < pos]
+    with io.open(index_file,'wb') as fp:
+        fp.write(struct.pack(_FASTQ_INDEX_HEADER,
+                             FASTQ_INDEX_MAGIC,
+                             int(compressed),
+                             interval,
+                             nreads,
+                             st.st_size,
+                             st.st_mtime,
+                             len(offsets),
+                             len(members)))
+        fp.write(_pack_uint64_array(offsets))
+        fp.write(_pack_uint64_array([x for m in members for x in m]))
+    return FastqIndex(fastq,index_file=index_file)
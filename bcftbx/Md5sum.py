@@ -48,6 +48,7 @@ import os
 import io
 import logging
 import hashlib
+from .utils import scandir_walk
 
 #######################################################################
 # Modules constants
@@ -105,15 +106,14 @@ class Md5Checker(object):
           Yields the name and full path for each file under 'dirn'.
           
         """
-        for d in os.walk(dirn):
-            if os.path.islink(d[0]) and links != self.FOLLOW_LINKS:
+        for dir_entry,dirs,files in scandir_walk(dirn):
+            if links != self.FOLLOW_LINKS and dir_entry.is_symlink():
                 continue
-            for f in d[2]:
-                path = os.path.join(d[0],f)
-                if os.path.islink(path) and links != self.FOLLOW_LINKS:
+            for f in files:
+                if links != self.FOLLOW_LINKS and f.is_symlink():
                     continue
                 else:
-                    yield os.path.normpath(path)
+                    yield os.path.normpath(f.path)
 
     @classmethod
     def md5_walk(self,dirn,links=FOLLOW_LINKS):
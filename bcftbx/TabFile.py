@@ -192,6 +192,7 @@ TabFile object, for example for a comma-delimited file:
 from builtins import str
 import io
 import logging
+from . import BGZF
 
 class TabDataLine(object):
     """Class to store a line of data from a tab-delimited file
@@ -857,7 +858,7 @@ class TabFile(object):
         self.__data = sorted(self.__data,key=sort_func,reverse=reverse)
 
     def write(self,filen=None,fp=None,include_header=False,no_hash=False,
-              delimiter=None):
+              delimiter=None,bgzf=False):
         """Write the TabFile data to an output file
 
         One of either the 'filen' or 'fp' arguments must be given,
@@ -877,10 +878,15 @@ class TabFile(object):
             start of the header line in the output file.
           delimiter: (optional) delimiter to use when writing data values
             to file (defaults to the delimiter specified on input)
+          bgzf: (optional) if set to True then compress the named
+            output file in BGZF format (ignored if fp is specified)
         """
         if fp is None and filen is not None:
             # Open named file for writing
-            fp = io.open(filen,'wt')
+            if bgzf:
+                fp = BGZF.BgzfWriter(filen)
+            else:
+                fp = io.open(filen,'wt')
             close_fp = True
         else:
             close_fp = False
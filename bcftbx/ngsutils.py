@@ -19,6 +19,23 @@ Extracting reads from Fastq, cfasta and qual files:
 - getreads: fetch reads one-by-one from Fastq, cfasta or qual file
 - getreads_subset: fetch subset of reads specified by index
 - getreads_regexp: fetch subset of reads matching regular expression
+- getreads_hashed: fetch fraction of reads selected by hashing read names
+
+Sampling reads from Fastq, csfasta and qual files:
+
+- sample_reads: fetch random subset of N reads in a single pass
+
+Counting reads in Fastq, csfasta and qual files:
+
+- count_reads: return the number of reads in a file
+
+Matching index sequences to barcodes:
+
+- BarcodeIndex: assign index sequences to barcodes allowing mismatches
+
+Where a Fastq file has a '.fqi' index (see
+'FASTQFile.build_fastq_index') then this will be used to
+count and locate reads, rather than scanning the whole file.
 
 """
 
@@ -28,13 +45,312 @@ Extracting reads from Fastq, cfasta and qual files:
 
 import os
 import re
+import random
+import hashlib
+import struct
+import logging
+import functools
+from operator import itemgetter
+from multiprocessing import Pool
+from future.moves import itertools
 from .utils import getlines
+from .FASTQFile import FastqIterator
+from .FASTQFile import FastqIndex
+from .FASTQFile import FASTQ_INDEX_EXT
+from .FASTQFile import pair_key
+from .FASTQFile import chunks
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Number of chunks per process when searching Fastqs in parallel
+REGEX_CHUNKS_PER_PROCESS = 4
+
+# Blocks of Fastq data are only searched for the literal part of
+# a pattern if it occurs in fewer than 1 in this many records
+REGEX_PREFILTER_MAX_HITS = 8
+
+#######################################################################
+# Classes
+#######################################################################
+
+class BarcodeIndex(object):
+    """
+    Lookup table for assigning index sequences to barcodes
+
+    A BarcodeIndex holds every sequence which is within a
+    maximum number of mismatches of each of a set of barcodes
+    (i.e. the "mismatch neighbourhood" of each barcode) in a
+    dictionary, so that an index sequence from a read can be
+    assigned to a barcode with a single lookup, regardless
+    of the number of barcodes. For example:
+
+    >>> index = BarcodeIndex(max_mismatches=1)
+    >>> index.add("ACCTAG","PB1")
+    >>> index.add("GTTCAA","PB2")
+    >>> index.lookup("ACCTAC")
+    'PB1'
+
+    An index sequence matches a barcode if the first part of
+    the sequence (up to the length of the barcode) differs
+    from the barcode at no more than the maximum number of
+    positions. 'N' bases in the index sequence are treated
+    as mismatches (so 'ACCTAN' matches 'ACCTAG' with one
+    mismatch), and any characters which aren't in the
+    alphabet (for example a separator between two indexes)
+    must match exactly.
+
+    Dual-index barcodes can be added as a tuple of the i7 and
+    i5 sequences, in which case the mismatches are counted for
+    each index separately, and sequences are looked up using
+    the two indexes joined by the separator (default '+').
+    The neighbourhood of each index is stored separately
+    (shared between barcodes with the same index), and a
+    sequence is assigned to a barcode if each of its indexes
+    is in the neighbourhood of the corresponding index of the
+    barcode; so the memory required for dual-index barcodes
+    is the same as for single indexes, rather than for every
+    combination of the two neighbourhoods.
+
+    If a sequence is within the mismatch neighbourhood of more
+    than one barcode then it is assigned to the barcode which
+    was added first (i.e. the same as testing each barcode in
+    turn), and the collision is recorded in the 'collisions'
+    property as a tuple '(barcode,other_barcode,sequences)'.
+
+    Note that the number of sequences stored for each barcode
+    increases rapidly with the number of mismatches (e.g. for
+    an 8 base barcode there are 33 sequences within one
+    mismatch and 481 within two).
+
+    """
+    def __init__(self,barcodes=None,max_mismatches=0,separator='+',
+                 alphabet='ACGTN'):
+        """
+        Create a new BarcodeIndex
+
+        Arguments:
+          barcodes (list): optional, list of barcodes to add
+            to the index (see the 'add' method)
+          max_mismatches (int): maximum number of mismatches
+            allowed when matching an index sequence to a
+            barcode (for dual-index barcodes, the maximum for
+            each index; default is zero i.e. exact matches
+            only)
+          separator (str): separator used to join the indexes
+            of dual-index barcodes (default: '+')
+          alphabet (str): the characters which can be
+            substituted for mismatches (default: 'ACGTN')
+        """
+        self.max_mismatches = int(max_mismatches)
+        self.separator = separator
+        self.alphabet = alphabet
+        self.barcodes = []
+        self.collisions = []
+        self._values = []
+        self._index = {}
+        self._lengths = []
+        # Tables for dual-index barcodes, keyed by the index
+        # lengths; each table is a list with a dictionary for
+        # each index, mapping the neighbourhood sequences to a
+        # bitmask of the ranks of the matching barcodes
+        self._dual_index = {}
+        if barcodes:
+            for barcode in barcodes:
+                self.add(barcode)
+
+    def add(self,barcode,value=None):
+        """
+        Add a barcode to the index
+
+        Arguments:
+          barcode (str): barcode sequence, or a tuple with the
+            i7 and i5 index sequences for a dual-index barcode
+          value (object): optional, the value to return from
+            'lookup' for sequences matching this barcode
+            (defaults to the barcode itself)
+        """
+        rank = len(self.barcodes)
+        if isinstance(barcode,tuple):
+            collisions = self._add_dual_index(barcode,rank)
+            barcode = self.separator.join(barcode)
+        else:
+            collisions = self._add_single_index(barcode,rank)
+        if value is None:
+            value = barcode
+        self.barcodes.append(barcode)
+        self._values.append(value)
+        for other in sorted(collisions):
+            logging.warning("Barcodes '%s' and '%s' are within %d "
+                            "mismatch(es) of %d common sequence(s)"
+                            % (self.barcodes[other],barcode,
+                               self.max_mismatches,
+                               len(collisions[other])))
+            self.collisions.append((self.barcodes[other],barcode,
+                                    sorted(collisions[other])))
+
+    def _add_single_index(self,barcode,rank):
+        """
+        Internal: add the neighbourhood of a single index barcode
+
+        Returns a dictionary mapping the ranks of previously
+        added barcodes to lists of the sequences they share
+        with the new barcode.
+        """
+        length = len(barcode)
+        if length not in self._lengths:
+            self._lengths.append(length)
+        collisions = {}
+        index = self._index
+        for seq in self.neighbourhood(barcode):
+            other = index.setdefault(seq,rank)
+            if other != rank:
+                # Already claimed by another barcode
+                try:
+                    collisions[other].append(seq)
+                except KeyError:
+                    collisions[other] = [seq]
+        return collisions
+
+    def _add_dual_index(self,barcode,rank):
+        """
+        Internal: add the neighbourhoods of a dual-index barcode
+
+        Returns a dictionary mapping the ranks of previously
+        added barcodes to lists of the sequences they share
+        with the new barcode (where a sequence matches more
+        than one previous barcode, it is only listed for the
+        one added first).
+        """
+        key = tuple([len(seq) for seq in barcode])
+        try:
+            tables = self._dual_index[key]
+        except KeyError:
+            tables = [{} for seq in barcode]
+            self._dual_index[key] = tables
+        bit = 1 << rank
+        neighbourhoods = []
+        shared = -1
+        for seq,table in zip(barcode,tables):
+            neighbours = self.neighbourhood(seq)
+            mask = 0
+            for neighbour in neighbours:
+                other = table.get(neighbour,0)
+                mask |= other
+                table[neighbour] = other | bit
+            # Previous barcodes matching for all indexes
+            shared &= mask
+            neighbourhoods.append(neighbours)
+        collisions = {}
+        claimed = set()
+        while shared:
+            other = (shared & -shared).bit_length() - 1
+            shared &= shared - 1
+            other_bit = 1 << other
+            seqs = [self.separator.join(seqs) for seqs in
+                    itertools.product(
+                        *[[n for n in neighbours
+                           if table[n] & other_bit]
+                          for neighbours,table in zip(neighbourhoods,
+                                                      tables)])]
+            seqs = [seq for seq in seqs if seq not in claimed]
+            if seqs:
+                collisions[other] = seqs
+                claimed.update(seqs)
+        return collisions
+
+    def neighbourhood(self,seq):
+        """
+        Return all sequences within the mismatch limit of a sequence
+
+        Arguments:
+          seq (str): sequence to generate the neighbourhood of
+
+        Returns:
+          List: the sequence followed by all the sequences
+            which differ from it by between 1 and the maximum
+            number of mismatches.
+        """
+        neighbours = [seq]
+        positions = [i for i,c in enumerate(seq) if c in self.alphabet]
+        substitutions = dict([(c,[x for x in self.alphabet if x != c])
+                              for c in self.alphabet])
+        for n in range(1,self.max_mismatches+1):
+            for mismatched in itertools.combinations(positions,n):
+                for bases in itertools.product(
+                        *[substitutions[seq[i]] for i in mismatched]):
+                    neighbour = list(seq)
+                    for i,base in zip(mismatched,bases):
+                        neighbour[i] = base
+                    neighbours.append(''.join(neighbour))
+        return neighbours
+
+    def lookup(self,seq):
+        """
+        Return the value for the barcode matching a sequence
+
+        Arguments:
+          seq (str): index sequence to look up (sequences
+            longer than the barcodes are matched using the
+            first part of the sequence)
+
+        Returns:
+          Object: the value associated with the matching
+            barcode, or None if there is no match.
+        """
+        index = self._index
+        if len(self._lengths) == 1:
+            rank = index.get(seq[:self._lengths[0]])
+        else:
+            ranks = [index.get(seq[:n]) for n in self._lengths]
+            ranks = [r for r in ranks if r is not None]
+            rank = min(ranks) if ranks else None
+        if self._dual_index:
+            dual_rank = self._lookup_dual_index(seq)
+            if dual_rank is not None and (rank is None or dual_rank < rank):
+                rank = dual_rank
+        if rank is None:
+            return None
+        return self._values[rank]
+
+    def _lookup_dual_index(self,seq):
+        """
+        Internal: return rank of the first dual-index barcode matching seq
+        """
+        separator = self.separator
+        rank = None
+        for lengths,tables in self._dual_index.items():
+            mask = -1
+            start = 0
+            for i,(length,table) in enumerate(zip(lengths,tables)):
+                if i > 0:
+                    end = start + len(separator)
+                    if seq[start:end] != separator:
+                        mask = 0
+                        break
+                    start = end
+                mask &= table.get(seq[start:start+length],0)
+                if not mask:
+                    break
+                start += length
+            if mask:
+                r = (mask & -mask).bit_length() - 1
+                if rank is None or r < rank:
+                    rank = r
+        return rank
+
+    def __contains__(self,seq):
+        return self.lookup(seq) is not None
+
+    def __len__(self):
+        return len(self.barcodes)
 
 #######################################################################
 # Functions
 #######################################################################
 
-def getreads(filen):
+def getreads(filen,binary=False):
     """
     Return Fastq, csfasta or qual file reads one-by-one
 
@@ -60,6 +376,8 @@ def getreads(filen):
 
     Arguments:
       filen (str): path of the file to fetch reads from
+      binary (bool): if True then return the lines as
+        bytes rather than strings (see 'getlines')
 
     Yields:
       List: next read record from the file, as a list
@@ -73,11 +391,15 @@ def getreads(filen):
         read_size = 4
     elif ext in ('csfasta','qual'):
         read_size = 2
+    if binary:
+        comment = b'#'
+    else:
+        comment = '#'
     header = True
     read = []
-    for i,line in enumerate(getlines(filen),start=1):
+    for i,line in enumerate(getlines(filen,binary=binary),start=1):
         if header:
-            if line.startswith('#'):
+            if line.startswith(comment):
                 continue
             else:
                 header = False
@@ -89,6 +411,51 @@ def getreads(filen):
         raise Exception("Incomplete read found at file end: %s"
                         % read)
 
+def count_reads(filen):
+    """
+    Return the number of reads in a Fastq, csfasta or qual file
+
+    If the file is a Fastq with a valid '.fqi' index
+    then the number of reads is taken from the index;
+    otherwise the reads are counted by iterating through
+    the file using 'getreads'.
+
+    Arguments:
+      filen (str): path of the file to count reads in
+
+    Returns:
+      Integer: number of reads.
+    """
+    index = get_fastq_index(filen)
+    if index is not None:
+        return index.nreads
+    return sum(1 for r in getreads(filen))
+
+def get_fastq_index(filen):
+    """
+    Return the FastqIndex for a Fastq file, if one exists
+
+    Arguments:
+      filen (str): path of the file to get the index for
+
+    Returns:
+      FastqIndex: index for the file, or None if the file
+        is not a Fastq, or it doesn't have a '.fqi' index,
+        or the index is out of date.
+    """
+    fields = os.path.basename(filen).split('.')
+    if fields[-1] == 'gz':
+        fields = fields[:-1]
+    if fields[-1] not in ('fastq','fq'):
+        return None
+    if not os.path.exists(filen + FASTQ_INDEX_EXT):
+        return None
+    try:
+        return FastqIndex(filen)
+    except Exception as ex:
+        logging.warning("Ignoring index for %s: %s" % (filen,ex))
+        return None
+
 def getreads_subset(filen,indices):
     """
     Fetch subset of reads from Fastq, csfasta or qual file
@@ -107,6 +474,10 @@ def getreads_subset(filen,indices):
     this invisibly provided that the file extension is
     '.gz'.
 
+    If the file is a Fastq with a valid '.fqi' index then
+    the index is used to locate the reads, instead of
+    scanning through the whole file.
+
     Example usage (returns 1st, 3rd and 5th reads only):
 
     >>> for r in getreads_subset('illumina_R1.fq',(0,2,4)):
@@ -124,6 +495,15 @@ def getreads_subset(filen,indices):
     indices_.sort()
     if indices_[0] < 0:
         raise Exception("One or more requested read indices out of range")
+    index = get_fastq_index(filen)
+    if index is not None:
+        # Use the index to locate the reads
+        if indices_[-1] >= index.nreads:
+            raise Exception("One or more requested read indices out "
+                            "of range")
+        for read in index.iter_reads(indices_,binary=True):
+            yield [line.decode("UTF-8") for line in read]
+        return
     i = 0
     next_idx = indices_[i]
     for idx,read in enumerate(getreads(filen)):
@@ -139,7 +519,7 @@ def getreads_subset(filen,indices):
                 return
     raise Exception("One or more requested read indices out of range")
 
-def getreads_regex(filen,pattern):
+def getreads_regex(filen,pattern,nprocs=1):
     """
     Fetch matching reads from  Fastq, csfasta or qual file
 
@@ -149,12 +529,31 @@ def getreads_regex(filen,pattern):
     of lines.
 
     The subset compromises of reads which match the
-    supplied regular expression.
+    supplied regular expression, when it is applied to the
+    lines of the read joined together (without newlines).
 
     The file can be gzipped; this function should handle
     this invisibly provided that the file extension is
     '.gz'.
 
+    For Fastq files the search is performed on blocks of
+    raw data, with the lines of the records joined up in a
+    single operation; where possible a literal string which
+    must occur in every match is used to find candidate
+    reads (see '_regex_prefilter'), and only these reads are
+    checked against the full regular expression and
+    returned. Fastqs can also be searched in parallel by
+    specifying multiple processes, in which case the file
+    is divided into sections (see 'FASTQFile.chunks') and
+    the matching reads are returned in the original order.
+
+    Note that because Fastq data is searched as raw bytes,
+    the pattern is compiled as a bytes pattern (with any
+    flags from a precompiled pattern, other than re.UNICODE,
+    carried over). This means that classes such as '\\w' and
+    '\\d' only match ASCII characters, which is sufficient for
+    Fastq data.
+
     Example usage:
 
     >>> for r in getreads_regexp('illumina_R1.fq',"2102:3130"):
@@ -162,13 +561,429 @@ def getreads_regex(filen,pattern):
 
     Arguments:
       filen (str): path of the file to fetch reads from
-      pattern (list): Python regular expression pattern
+      pattern (str): Python regular expression pattern
+        (either a string, or a pattern object returned by
+        're.compile')
+      nprocs (int): optional, number of processes to use
+        when searching Fastq files (default: 1)
 
     Yields:
       List: next read record from the file, as a list
         of lines.
     """
+    fields = os.path.basename(filen).split('.')
+    if fields[-1] == 'gz':
+        fields = fields[:-1]
+    if fields[-1] in ('fastq','fq'):
+        # Search the raw data and only decode the matching
+        # records
+        nchunks = nprocs*REGEX_CHUNKS_PER_PROCESS if nprocs > 1 else 1
+        if hasattr(pattern,'pattern'):
+            flags = pattern.flags & ~re.UNICODE
+            pattern = pattern.pattern
+            if isinstance(pattern,bytes):
+                pattern = pattern.decode('utf-8')
+        else:
+            flags = 0
+        search = functools.partial(_getreads_regex_chunk,pattern=pattern,
+                                   flags=flags)
+        fastq_chunks = chunks(filen,nchunks)
+        if nprocs > 1 and len(fastq_chunks) > 1:
+            pool = Pool(min(nprocs,len(fastq_chunks)))
+            try:
+                for matches in pool.imap(search,fastq_chunks):
+                    for read in _split_raw_reads(matches):
+                        yield read
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for chunk in fastq_chunks:
+                for block in _iter_regex_blocks(chunk,pattern,flags):
+                    for read in _split_raw_reads(block):
+                        yield read
+        return
     regex = re.compile(pattern)
     for read in getreads(filen):
         if regex.search(''.join(read)):
             yield read
+
+def _regex_prefilter(pattern):
+    """
+    Internal: return literal string required by a regex pattern
+
+    Scans a regular expression pattern for runs of literal
+    characters which must appear in every match, and
+    returns the longest one. Literals inside groups are
+    included if the group is required (i.e. it isn't
+    followed by a quantifier allowing zero repeats), and
+    characters inside character sets or followed by an
+    optional quantifier are excluded.
+
+    Returns None for patterns which contain alternations,
+    inline flags or escape sequences which can't be
+    handled.
+
+    Arguments:
+      pattern (str): Python regular expression pattern
+
+    Returns:
+      Bytes: the longest required literal (encoded as
+        UTF-8), or None if no literal could be found.
+    """
+    if '|' in pattern or '(?' in pattern:
+        return None
+    literals = []
+    current = []
+    groups = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == '\\':
+            c = pattern[i:i+1]
+            i += 1
+            if not c or c.isdigit() or c in 'xuUN':
+                # Unsupported escape
+                return None
+            elif c.isalnum():
+                # Character class or anchor
+                literals.append(current)
+                current = []
+                continue
+        elif c == '[':
+            # Skip over the character set
+            literals.append(current)
+            current = []
+            if pattern[i:i+1] == '^':
+                i += 1
+            if pattern[i:i+1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+            continue
+        elif c in '*?{':
+            # Previous character is optional
+            if current:
+                current.pop()
+            literals.append(current)
+            current = []
+            if c == '{':
+                i = pattern.find('}',i) + 1
+                if i == 0:
+                    return None
+            continue
+        elif c in '+^$.':
+            literals.append(current)
+            current = []
+            continue
+        elif c == '(':
+            # Note where the literals for the group start
+            literals.append(current)
+            current = []
+            groups.append(len(literals))
+            continue
+        elif c == ')':
+            if not groups:
+                return None
+            start = groups.pop()
+            quantifier = pattern[i:i+1]
+            if quantifier in ('*','?') or pattern.startswith('{0',i) or \
+               pattern.startswith('{,',i):
+                # Group is optional so discard its literals
+                del literals[start:]
+                current = []
+            elif quantifier in ('+','{'):
+                # Group is repeated: the literal at the end of the
+                # final repeat continues after the quantifier
+                if quantifier == '{':
+                    i = pattern.find('}',i) + 1
+                    if i == 0:
+                        return None
+                else:
+                    i += 1
+                if pattern[i:i+1] in ('?','+'):
+                    i += 1
+            continue
+        current.append(c)
+    literals.append(current)
+    literal = max([''.join(l) for l in literals],key=len)
+    if not literal:
+        return None
+    return literal.encode('utf-8')
+
+def _iter_regex_blocks(chunk,pattern,flags=0):
+    """
+    Internal: yield raw data for Fastq reads matching a regex
+
+    Searches the raw data from a Fastq chunk for records
+    which match the supplied regular expression, when it is
+    applied to the lines of each record joined together
+    (i.e. the same as 'getreads_regex').
+
+    Where the pattern contains a required literal (see
+    '_regex_prefilter'), each block of data has its newlines
+    removed in a single operation and the resulting buffer is
+    scanned for the literal; each hit is mapped back to the
+    record which contains it, and only these records are
+    checked against the full regular expression. Otherwise
+    (or if the literal occurs in a large proportion of the
+    records in the block) the block is split into records
+    and the regular expression is applied to every record.
+
+    The prefilter isn't used if the flags include
+    re.IGNORECASE or re.VERBOSE.
+
+    Arguments:
+      chunk (FastqChunk): the section of the Fastq to search
+      pattern (str): Python regular expression pattern
+      flags (int): optional, flags to compile the pattern
+        with (must be valid for a bytes pattern)
+
+    Yields:
+      Bytes: raw data for the matching records from each
+        block.
+    """
+    regex = re.compile(pattern.encode('utf-8'),flags)
+    if flags & (re.IGNORECASE|re.VERBOSE):
+        literal = None
+    else:
+        literal = _regex_prefilter(pattern)
+    for block in chunk.iter_blocks():
+        if literal is not None:
+            joined = block.replace(b'\n',b'')
+            nhits = joined.count(literal)
+            if not nhits:
+                continue
+            if nhits*REGEX_PREFILTER_MAX_HITS < block.count(b'\n')//4:
+                # Only check the records containing the literal
+                matches = [block[start:end] for start,end in
+                           _iter_block_hits(block,joined,literal)
+                           if regex.search(
+                                   block[start:end].replace(b'\n',b''))]
+                if matches:
+                    yield b''.join(matches)
+                continue
+        # Check every record
+        lines = block.split(b'\n')
+        ilines = iter(lines)
+        records = map(b''.join,zip(ilines,ilines,ilines,ilines))
+        matches = [b'\n'.join(lines[4*i:4*i+4]) + b'\n'
+                   for i in itertools.compress(itertools.count(),
+                                               map(regex.search,records))]
+        if matches:
+            yield b''.join(matches)
+
+def _iter_block_hits(block,joined,literal):
+    """
+    Internal: locate the records containing a literal in raw Fastq data
+
+    The buffer obtained by removing the newlines from the
+    block of raw data is searched for the literal. The
+    position of each hit is mapped back to the raw data (by
+    counting the preceding newlines), and the limits of the
+    record containing it are returned. Searching then resumes
+    from the start of the next record, so each record is only
+    reported once.
+
+    Arguments:
+      block (bytes): raw data for one or more complete
+        Fastq records
+      joined (bytes): the raw data with the newlines removed
+      literal (bytes): the literal string to search for
+
+    Yields:
+      Tuple: (start,end) offsets of each record in the
+        block which contains the literal.
+    """
+    # Position to search from in the joined data, and
+    # corresponding offset and line number in the block
+    pos = 0
+    offset = 0
+    nlines = 0
+    while True:
+        j = joined.find(literal,pos)
+        if j < 0:
+            return
+        # Locate the raw offset i of the hit: this satisfies
+        # i = j + (number of newlines up to and including i)
+        i = j + nlines
+        counted = offset
+        n = nlines
+        while True:
+            n += block.count(b'\n',counted,i+1)
+            counted = i + 1
+            if j + n == i:
+                break
+            i = j + n
+        # Back up to the start of the record
+        start = i
+        for k in range(n%4+1):
+            start = block.rfind(b'\n',0,start)
+        start += 1
+        # Move forward to the end of the record
+        end = start
+        for k in range(4):
+            end = block.find(b'\n',end) + 1
+        yield (start,end)
+        offset = end
+        nlines = n - n%4 + 4
+        pos = offset - nlines
+
+def _getreads_regex_chunk(chunk,pattern,flags=0):
+    """
+    Internal: return raw data for reads in chunk matching regex
+    """
+    return b''.join(_iter_regex_blocks(chunk,pattern,flags))
+
+def _split_raw_reads(data):
+    """
+    Internal: split raw Fastq data into reads (as lists of lines)
+    """
+    lines = data.decode('utf-8').split('\n')
+    for i in range(0,len(lines)-1,4):
+        yield lines[i:i+4]
+
+def getreads_hashed(filen,fraction,seed=None):
+    """
+    Fetch a fraction of reads from Fastq, csfasta or qual file
+
+    This generator function iterates through a sequence
+    file (Fastq, csfasta or qual), and yields a subset of
+    read records. Each read is returned as a list of lines.
+
+    Reads are selected by hashing (MD5) the part of the
+    read name which is shared by the reads in a pair (see
+    'FASTQFile.pair_key') together with the seed, and
+    keeping reads where the hash falls below the requested
+    fraction. The selection for each read is therefore
+    independent of every other read, which means that:
+
+    - the same reads are selected from R1 and R2 files
+      (so the files can be processed separately, e.g. in
+      parallel), and
+    - the same seed always selects the same reads.
+
+    The number of reads selected will be close to (but not
+    exactly) the requested fraction of the total.
+
+    The file can be gzipped; this function should handle
+    this invisibly provided that the file extension is
+    '.gz'.
+
+    Example usage (returns approximately 10% of reads):
+
+    >>> for r in getreads_hashed('illumina_R1.fq',0.1,seed=1234):
+    >>> ... print(r)
+
+    Arguments:
+      filen (str): path of the file to fetch reads from
+      fraction (float): fraction of reads to select (from
+        0.0 to 1.0)
+      seed (str): optional, seed to combine with the read
+        names (different seeds select different subsets)
+
+    Yields:
+      List: next read record from the file, as a list
+        of lines.
+    """
+    if fraction < 0.0 or fraction > 1.0:
+        raise ValueError("Fraction must be between 0 and 1")
+    # Reads are selected if the hash (taking the first 8 bytes
+    # as a 64-bit big-endian integer) is less than the threshold;
+    # comparing the digests as bytes is equivalent (and faster)
+    if fraction == 1.0:
+        threshold = b'\xff'*17
+    else:
+        threshold = struct.pack('>Q',int(fraction*(1 << 64)))
+    # The hash is seeded by starting from a digest of the seed
+    if seed is None:
+        key = b''
+    else:
+        key = hashlib.sha256(str(seed).encode('utf-8')).digest()
+    hasher = hashlib.md5(key)
+    fields = os.path.basename(filen).split('.')
+    if fields[-1] == 'gz':
+        fields = fields[:-1]
+    if fields[-1] in ('fastq','fq'):
+        # Work with the raw Fastq records, and only decode
+        # the ones which are selected
+        for read in FastqIterator(filen,binary=True):
+            header = read[0]
+            i = header.find(b' ')
+            h = hasher.copy()
+            if i > 0:
+                # Equivalent to 'pair_key' (but faster)
+                h.update(header[1:i])
+            else:
+                h.update(pair_key(header[1:]))
+            if h.digest() < threshold:
+                yield read.data.decode('utf-8').split('\n')[:4]
+        return
+    for read in getreads(filen):
+        h = hasher.copy()
+        h.update(pair_key(read[0][1:]).encode('utf-8'))
+        if h.digest() < threshold:
+            yield read
+
+def sample_reads(filens,n,seed=None):
+    """
+    Fetch random subset of reads from Fastq, csfasta or qual files
+
+    Selects a random subset of N reads from one or more
+    sequence files (Fastq, csfasta or qual), using reservoir
+    sampling so that the data are only read once, and without
+    needing to know the number of reads in advance.
+
+    If multiple files are supplied then they must contain
+    corresponding reads in the same order (e.g. the R1 and
+    R2 Fastqs for paired-end data), and the same subset of
+    reads is returned from each.
+
+    Note that the selected reads are held in memory.
+
+    Example usage (sample 1000 read pairs from R1/R2 Fastqs):
+
+    >>> nreads,reads = sample_reads(('illumina_R1.fq',
+    ...                              'illumina_R2.fq'),1000)
+    >>> for r1,r2 in reads:
+    >>> ... print(r1,r2)
+
+    Arguments:
+      filens (list): list of paths of the files to fetch
+        reads from (or the path of a single file)
+      n (int): number of reads to select
+      seed (str): optional, seed for the random number
+        generator (using the same seed should select the
+        same subset)
+
+    Returns:
+      Tuple: (nreads,reads) where 'nreads' is the total
+        number of reads in each file and 'reads' is a list
+        of the selected reads (in the same order as in the
+        files); each item is a tuple containing the read
+        record from each file (as a list of lines). If 'n'
+        is greater than the number of reads then all the
+        reads are returned.
+    """
+    if isinstance(filens,str):
+        filens = (filens,)
+    rng = random.Random(seed)
+    reservoir = []
+    nreads = 0
+    for reads in itertools.zip_longest(*[getreads(f) for f in filens]):
+        if None in reads:
+            raise Exception("Inconsistent numbers of reads between "
+                            "files")
+        if nreads < n:
+            reservoir.append((nreads,reads))
+        else:
+            # Replace an existing read with probability
+            # n/(reads seen so far)
+            i = int(rng.random()*(nreads+1))
+            if i < n:
+                reservoir[i] = (nreads,reads)
+        nreads += 1
+    reservoir.sort(key=itemgetter(0))
+    return (nreads,[reads for i,reads in reservoir])
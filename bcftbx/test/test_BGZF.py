@@ -0,0 +1,176 @@
+#######################################################################
+# Tests for BGZF.py module
+#######################################################################
+from bcftbx.BGZF import *
+import unittest
+import io
+import os
+import tempfile
+import shutil
+import gzip
+import random
+import struct
+
+class TestBgzfBlocks(unittest.TestCase):
+    """Tests of the block-level BGZF functions
+    """
+    def test_compress_block(self):
+        """compress_block: block is valid gzip and BGZF
+        """
+        data = b"Some data\n"*100
+        block = compress_block(data)
+        self.assertEqual(block[:4],b'\x1f\x8b\x08\x04')
+        self.assertEqual(block[12:16],b'BC\x02\x00')
+        self.assertEqual(len(block),
+                         struct.unpack('<H',block[16:18])[0] + 1)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(block)).read(),
+                         data)
+        self.assertEqual(decompress_block(block),data)
+
+    def test_compress_block_incompressible_data(self):
+        """compress_block: handle incompressible data
+        """
+        data = bytes(bytearray([random.randint(0,255)
+                                for i in range(BGZF_BLOCK_SIZE)]))
+        block = compress_block(data)
+        self.assertTrue(len(block) <= BGZF_MAX_BLOCK_SIZE)
+        self.assertEqual(decompress_block(block),data)
+
+    def test_compress_block_too_much_data(self):
+        """compress_block: raise ValueError if data too large
+        """
+        self.assertRaises(ValueError,compress_block,
+                          b'x'*(BGZF_BLOCK_SIZE+1))
+
+    def test_compress_blocks(self):
+        """compress_blocks: data is split into multiple blocks
+        """
+        data = b"ACGT"*50000
+        blocks = compress_blocks(data)
+        self.assertEqual(blocks.count(b'\x1f\x8b\x08\x04'),4)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(blocks)).read(),
+                         data)
+
+    def test_eof_marker(self):
+        """BGZF_EOF: is an empty BGZF block
+        """
+        self.assertEqual(decompress_block(BGZF_EOF),b'')
+        self.assertEqual(compress_block(b'',compresslevel=6)[-8:],
+                         BGZF_EOF[-8:])
+
+    def test_virtual_offsets(self):
+        """make_virtual_offset and split_virtual_offset
+        """
+        voffset = make_virtual_offset(123456789,4321)
+        self.assertEqual(voffset,(123456789 << 16) | 4321)
+        self.assertEqual(split_virtual_offset(voffset),(123456789,4321))
+        self.assertRaises(ValueError,make_virtual_offset,0,65536)
+        self.assertRaises(ValueError,make_virtual_offset,-1,0)
+
+class TestBgzfFiles(unittest.TestCase):
+    """Tests of the BgzfWriter, BgzfReader and BgzfIndex classes
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestBgzfFiles')
+        # Test data spanning several blocks
+        self.data = b''.join([b"line %d\tACGTACGTACGT\n" % i
+                              for i in range(20000)])
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def _write_bgzf(self,name,nthreads=1):
+        # Write the test data to a BGZF file
+        filen = os.path.join(self.wd,name)
+        with BgzfWriter(filen,nthreads=nthreads) as fp:
+            fp.write(self.data[:1000])
+            fp.write(self.data[1000:].decode())
+        return filen
+
+    def test_bgzf_writer(self):
+        """BgzfWriter: output is valid gzip ending with EOF block
+        """
+        filen = self._write_bgzf('test.txt.gz')
+        self.assertTrue(is_bgzf_file(filen))
+        with io.open(filen,'rb') as fp:
+            self.assertTrue(fp.read().endswith(BGZF_EOF))
+        self.assertEqual(gzip.open(filen,'rb').read(),self.data)
+
+    def test_bgzf_writer_multiple_threads(self):
+        """BgzfWriter: output is the same using multiple threads
+        """
+        filen1 = self._write_bgzf('test1.txt.gz')
+        filen2 = self._write_bgzf('test2.txt.gz',nthreads=4)
+        self.assertEqual(io.open(filen1,'rb').read(),
+                         io.open(filen2,'rb').read())
+
+    def test_bgzf_writer_empty_file(self):
+        """BgzfWriter: write file with no data
+        """
+        filen = os.path.join(self.wd,'empty.gz')
+        BgzfWriter(filen).close()
+        self.assertEqual(io.open(filen,'rb').read(),BGZF_EOF)
+        self.assertEqual(gzip.open(filen,'rb').read(),b'')
+
+    def test_bgzf_reader(self):
+        """BgzfReader: read data and lines
+        """
+        filen = self._write_bgzf('test.txt.gz')
+        with BgzfReader(filen) as fp:
+            self.assertEqual(fp.read(10),self.data[:10])
+            self.assertEqual(fp.readline(),self.data[10:].split(b'\n')[0]+
+                             b'\n')
+        with BgzfReader(filen) as fp:
+            self.assertEqual([l for l in fp],
+                             io.BytesIO(self.data).readlines())
+        with BgzfReader(filen,nthreads=4) as fp:
+            self.assertEqual(fp.read(),self.data)
+            self.assertEqual(fp.read(),b'')
+
+    def test_bgzf_reader_non_bgzf_file(self):
+        """BgzfReader: raise exception for non-BGZF gzip file
+        """
+        filen = os.path.join(self.wd,'test.txt.gz')
+        with gzip.open(filen,'wb') as fp:
+            fp.write(self.data)
+        self.assertFalse(is_bgzf_file(filen))
+        self.assertRaises(Exception,BgzfReader(filen).read)
+
+    def test_bgzf_tell_and_seek(self):
+        """BgzfWriter/BgzfReader: seek to virtual offsets from tell
+        """
+        filen = os.path.join(self.wd,'test.txt.gz')
+        lines = io.BytesIO(self.data).readlines()
+        voffsets = []
+        with BgzfWriter(filen) as fp:
+            for line in lines:
+                voffsets.append(fp.tell())
+                fp.write(line)
+        with BgzfReader(filen) as fp:
+            for i in (0,1,5000,19999,2500):
+                fp.seek(voffsets[i])
+                self.assertEqual(fp.readline(),lines[i])
+            fp.seek(voffsets[100])
+            for line in lines[100:200]:
+                self.assertEqual(fp.tell(),voffsets[lines.index(line)])
+                fp.readline()
+
+    def test_build_bgzf_index(self):
+        """build_bgzf_index: locate positions in uncompressed data
+        """
+        filen = self._write_bgzf('test.txt.gz')
+        idx = build_bgzf_index(filen)
+        self.assertTrue(os.path.exists(filen+'.gzi'))
+        self.assertEqual(idx.blocks[0],(0,0))
+        self.assertEqual(idx.blocks[1][1],BGZF_BLOCK_SIZE)
+        self.assertEqual(len(idx),
+                         (len(self.data)+BGZF_BLOCK_SIZE-1)//BGZF_BLOCK_SIZE)
+        idx = BgzfIndex(filen)
+        with BgzfReader(filen) as fp:
+            for pos in (0,1,BGZF_BLOCK_SIZE-1,BGZF_BLOCK_SIZE,
+                        300000,len(self.data)-3):
+                fp.seek(idx.virtual_offset(pos))
+                self.assertEqual(fp.read(3),self.data[pos:pos+3])
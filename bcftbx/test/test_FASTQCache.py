@@ -0,0 +1,201 @@
+#######################################################################
+# Tests for FASTQCache.py module
+#######################################################################
+from builtins import str
+from bcftbx.FASTQCache import *
+from bcftbx.FASTQFile import FastqIterator
+import unittest
+import io
+import os
+import tempfile
+import shutil
+import gzip
+
+fastq_data = u"""@73D9FA:3:FC:1:1:7507:1000 1:N:0:
+NACAACCTGATTAGCGGCGTTGACAGATGTATCCAT
++
+#))))55445@@@@@C@@@@@@@@@:::::<<:::<
+@73D9FA:3:FC:1:1:15740:1000 1:N:0:
+NTCTTGCTGGTGGCGCCATGTCTAAATTGTTTGGAG
++
+#+.))/0200<<<<<:::::CC@@C@CC@@@22@@@
+@73D9FA:3:FC:1:1:8103:1000 1:N:0:
+NGACCGATTAGAGGCGTTTTATGATAATCCCAATGC
++
+#))))55445@@@@@C@@@@@@@@@:::::<<:::<
+@73D9FA:3:FC:1:1:7488:1000 1:N:0:
+NTGATTGTCCAGTTGCATTTTAGTAAGCTCTTTTTG
++
+#+.))/0200<<<<<:::::CC@@C@CC@@@22@@@
+@73D9FA:3:FC:1:1:6680:1000 1:N:0:
+NATAAATCACCTCACTTAAGTGGCTGGAGACAAATA
++
+#))))55445@@@@@C@@@@@@@@@:::::<<:::<
+"""
+
+fastq_data_mixed = u"""@read1 length=12
+ACGTNNacgtRY
++read1 length=12
+IIIIIIIIIIII
+@read2/1
+
++
+
+@read3#0/1
+GATTACA
++some other text
+%%%%%%%
+"""
+
+class TestFastqCache(unittest.TestCase):
+    """Tests of the FastqCache class and build_fastq_cache
+    """
+    def setUp(self):
+        # Skip the tests if numpy is not available
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("'numpy' not available")
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestFastqCache')
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def _make_fastq(self,name,data,gzipped=False):
+        # Create a FASTQ file
+        fastq = os.path.join(self.wd,name)
+        if gzipped:
+            with gzip.open(fastq,'wt') as fp:
+                fp.write(data)
+        else:
+            with io.open(fastq,'wt') as fp:
+                fp.write(data)
+        return fastq
+
+    def test_build_fastq_cache(self):
+        """build_fastq_cache: create cache file for FASTQ
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        cache = build_fastq_cache(fastq)
+        self.assertTrue(os.path.exists(fastq+'.fqc'))
+        self.assertFalse(os.path.exists(fastq+'.fqc.tmp'))
+        self.assertEqual(cache.cache_file,fastq+'.fqc')
+        self.assertEqual(cache.nreads,5)
+        self.assertEqual(cache.nblocks,1)
+        self.assertEqual(len(cache),5)
+        cache.close()
+
+    def test_build_fastq_cache_from_gzipped_fastq(self):
+        """build_fastq_cache: create cache file for gzipped FASTQ
+        """
+        fastq = self._make_fastq('test.fq.gz',fastq_data,gzipped=True)
+        cache_file = os.path.join(self.wd,'test.fqc')
+        with build_fastq_cache(fastq,cache_file=cache_file) as cache:
+            self.assertEqual(cache.cache_file,cache_file)
+            self.assertEqual(cache.nreads,5)
+        self.assertEqual(''.join([str(r)+'\n' for r in
+                                  FastqCache(cache_file)]),
+                         fastq_data)
+
+    def test_fastq_cache_round_trip(self):
+        """FastqCache: records match the original FASTQ
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        build_fastq_cache(fastq,block_size=2).close()
+        with FastqCache(fastq+'.fqc') as cache:
+            self.assertEqual(cache.nblocks,3)
+            reads = [r for r in cache]
+        expected = [r for r in FastqIterator(fastq)]
+        self.assertEqual(len(reads),len(expected))
+        for read,expected_read in zip(reads,expected):
+            self.assertTrue(isinstance(read,FastqRead))
+            self.assertEqual(str(read),str(expected_read))
+            self.assertEqual(read.seqid.flowcell_lane,
+                             expected_read.seqid.flowcell_lane)
+
+    def test_fastq_cache_round_trip_binary(self):
+        """FastqCache: raw records match the original FASTQ
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        build_fastq_cache(fastq,block_size=2).close()
+        with FastqCache(fastq+'.fqc',binary=True) as cache:
+            reads = [r for r in cache]
+        for read in reads:
+            self.assertTrue(isinstance(read,RawFastqRead))
+        self.assertEqual(b''.join([r.data for r in reads]),
+                         fastq_data.encode())
+
+    def test_fastq_cache_round_trip_mixed_records(self):
+        """FastqCache: handle non-ACGTN bases, empty reads and '+' lines
+        """
+        fastq = self._make_fastq('test.fq',fastq_data_mixed)
+        build_fastq_cache(fastq).close()
+        with FastqCache(fastq+'.fqc',binary=True) as cache:
+            self.assertEqual(b''.join([r.data for r in cache]),
+                             fastq_data_mixed.encode())
+        with FastqCache(fastq+'.fqc') as cache:
+            self.assertEqual(''.join([str(r)+'\n' for r in cache]),
+                             fastq_data_mixed)
+
+    def test_fastq_cache_next(self):
+        """FastqCache: iterate using 'next'
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        cache = build_fastq_cache(fastq,block_size=3)
+        self.assertEqual(str(next(cache)),'\n'.join(
+            fastq_data.split('\n')[0:4]))
+        self.assertEqual(str(next(cache)),'\n'.join(
+            fastq_data.split('\n')[4:8]))
+        self.assertEqual(len([r for r in cache]),5)
+        cache.close()
+
+    def test_fastq_cache_get_read(self):
+        """FastqCache: fetch individual records
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        cache = build_fastq_cache(fastq,block_size=2)
+        expected = [r for r in FastqIterator(fastq)]
+        for i in (4,0,3,2,1):
+            self.assertEqual(str(cache.get_read(i)),str(expected[i]))
+        self.assertRaises(IndexError,cache.get_read,5)
+        self.assertRaises(IndexError,cache.get_read,-1)
+        cache.close()
+        with FastqCache(fastq+'.fqc',binary=True) as cache:
+            self.assertEqual(cache.get_read(2).data,
+                             '\n'.join(fastq_data.split('\n')[8:12]+
+                                       ['']).encode())
+
+    def test_fastq_cache_iter_batches(self):
+        """FastqCache: iterate over FastqBatch objects
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        build_fastq_cache(fastq,block_size=2).close()
+        with FastqCache(fastq+'.fqc') as cache:
+            batches = [b for b in cache.iter_batches()]
+        self.assertEqual([len(b) for b in batches],[2,2,1])
+        expected = [r for r in FastqIterator(fastq,binary=True)]
+        for i in range(2):
+            read = expected[2+i]
+            self.assertEqual(batches[1].header(i),read[0].rstrip())
+            self.assertEqual(batches[1].sequence(i),read[1].rstrip())
+            self.assertEqual(batches[1].quality(i),read[3].rstrip())
+
+    def test_fastq_cache_empty_fastq(self):
+        """FastqCache: handle empty FASTQ
+        """
+        fastq = self._make_fastq('test.fq',u"")
+        with build_fastq_cache(fastq) as cache:
+            self.assertEqual(cache.nreads,0)
+            self.assertEqual(cache.nblocks,0)
+            self.assertEqual([r for r in cache],[])
+
+    def test_fastq_cache_not_a_cache_file(self):
+        """FastqCache: raise exception for non-cache file
+        """
+        fastq = self._make_fastq('test.fq',fastq_data)
+        self.assertRaises(Exception,FastqCache,fastq)
+        empty = self._make_fastq('empty.fq',u"")
+        self.assertRaises(Exception,FastqCache,empty)
@@ -4,6 +4,7 @@
 from builtins import str
 from bcftbx.FASTQFile import *
 import unittest
+import sys
 import io
 import os
 import tempfile
@@ -176,6 +177,181 @@ class TestFastqIterator(unittest.TestCase):
             self.assertEqual(read.quality,fastq_source.readline().rstrip('\n'))
         self.assertEqual(nreads,5)
 
+    def test_fastq_iterator_binary(self):
+        """Check iteration over small FASTQ file in binary mode
+        """
+        fp = io.BytesIO(fastq_data.encode())
+        fastq = FastqIterator(fp=fp,binary=True)
+        nreads = 0
+        fastq_source = io.StringIO(fastq_data)
+        for read in fastq:
+            nreads += 1
+            self.assertTrue(isinstance(read,RawFastqRead))
+            seqid = fastq_source.readline().rstrip('\n')
+            sequence = fastq_source.readline().rstrip('\n')
+            optid = fastq_source.readline().rstrip('\n')
+            quality = fastq_source.readline().rstrip('\n')
+            self.assertEqual(read.raw_seqid,seqid.encode())
+            self.assertEqual(read.sequence,sequence.encode())
+            self.assertEqual(read.optid,optid.encode())
+            self.assertEqual(read.quality,quality.encode())
+            self.assertEqual(read.data,
+                             ("%s\n%s\n%s\n%s\n" % (seqid,sequence,
+                                                    optid,quality)).encode())
+        self.assertEqual(nreads,5)
+
+    def test_fastq_iterator_binary_empty_sequence_small_buffer(self):
+        """Check binary iteration over FASTQ with 'empty' sequence (small buffer)
+        """
+        fp = io.BytesIO(fastq_empty_sequence.encode())
+        fastq = FastqIterator(fp=fp,bufsize=2,binary=True)
+        nreads = 0
+        fastq_source = io.StringIO(fastq_empty_sequence)
+        for read in fastq:
+            nreads += 1
+            self.assertEqual(read.raw_seqid,
+                             fastq_source.readline().rstrip('\n').encode())
+            self.assertEqual(read.sequence,
+                             fastq_source.readline().rstrip('\n').encode())
+            self.assertEqual(read.optid,
+                             fastq_source.readline().rstrip('\n').encode())
+            self.assertEqual(read.quality,
+                             fastq_source.readline().rstrip('\n').encode())
+        self.assertEqual(nreads,5)
+
+    def test_fastq_iterator_binary_no_trailing_newline(self):
+        """Check binary iteration when final record has no trailing newline
+        """
+        fp = io.BytesIO(fastq_data.rstrip('\n').encode())
+        reads = [r for r in FastqIterator(fp=fp,binary=True)]
+        self.assertEqual(len(reads),5)
+        self.assertEqual(reads[-1].quality,
+                         b"#--,,55777@@@@@@@CC@@C@@@@@@@@:::::<")
+
+    def test_fastq_iterator_binary_gzipped_file_from_disk(self):
+        """Check binary iteration over small gzipped FASTQ file from disk
+        """
+        self.fastq_in = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(self.fastq_in,'wb') as fp:
+            fp.write(fastq_data.encode())
+        fastq = FastqIterator(self.fastq_in,binary=True)
+        reads = [r.fastqread() for r in fastq]
+        expected = [r for r in FastqIterator(fp=io.StringIO(fastq_data))]
+        self.assertEqual(reads,expected)
+
+class TestRawFastqRead(unittest.TestCase):
+    """Tests of the RawFastqRead class
+    """
+
+    def test_rawfastqread(self):
+        """Check RawFastqRead gives access to the record data
+        """
+        data = (b"@HWI-ST1250:47:c0tr3acxx:4:1101:1283:2323 1:N:0:ACAGTGAT",
+                b"GGTGTCTTCA",
+                b"+",
+                b"=@@D;DDFFH")
+        read = RawFastqRead(data)
+        self.assertEqual(read.raw_seqid,
+                         b"@HWI-ST1250:47:c0tr3acxx:4:1101:1283:2323 1:N:0:ACAGTGAT")
+        self.assertEqual(read.sequence,b"GGTGTCTTCA")
+        self.assertEqual(read.optid,b"+")
+        self.assertEqual(read.quality,b"=@@D;DDFFH")
+        self.assertEqual(read.seqlen,10)
+        self.assertEqual(read.data,b'\n'.join(data)+b'\n')
+        if sys.version_info[0] > 2:
+            # 'bytes' is 'str' on Python 2
+            self.assertEqual(bytes(read),b'\n'.join(data)+b'\n')
+        self.assertEqual(read.seqid.index_sequence,'ACAGTGAT')
+        self.assertEqual(read.seqid.flowcell_lane,'4')
+        fastqread = read.fastqread()
+        self.assertTrue(isinstance(fastqread,FastqRead))
+        self.assertEqual(fastqread.sequence,"GGTGTCTTCA")
+        self.assertEqual(fastqread.maxquality,'H')
+        self.assertEqual(read,fastqread)
+
+    def test_rawfastqread_crlf(self):
+        """Check RawFastqRead strips carriage returns
+        """
+        read = RawFastqRead((b"@HWI-ST1250:47:c0tr3acxx:4:1101:1283:2323 "
+                             b"1:N:0:ACAGTGAT\r",
+                             b"GGTGTCTTCA\r",
+                             b"+\r",
+                             b"=@@D;DDFFH\r"))
+        self.assertEqual(read.raw_seqid,
+                         b"@HWI-ST1250:47:c0tr3acxx:4:1101:1283:2323 "
+                         b"1:N:0:ACAGTGAT")
+        self.assertEqual(read.sequence,b"GGTGTCTTCA")
+        self.assertEqual(read.optid,b"+")
+        self.assertEqual(read.quality,b"=@@D;DDFFH")
+        self.assertEqual(read.seqid.index_sequence,'ACAGTGAT')
+
+    def test_rawfastqread_colorspace(self):
+        """Check RawFastqRead handles colorspace sequence length
+        """
+        read = RawFastqRead((b"@1_14_622",b"T221.00330",b"+",b"BBA!>AA,B>"))
+        self.assertEqual(read.seqlen,9)
+
+class TestFastqBatchReader(unittest.TestCase):
+    """Tests of the FastqBatchReader class
+    """
+    def setUp(self):
+        # Skip the tests if numpy is not available
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("'numpy' not available")
+
+    def test_fastq_batch_reader(self):
+        """Check batched iteration over small FASTQ file
+        """
+        fp = io.BytesIO(fastq_empty_sequence.encode())
+        batches = [b for b in FastqBatchReader(fp=fp,batch_size=2)]
+        self.assertEqual([len(b) for b in batches],[2,2,1])
+        reads = [r for r in FastqIterator(
+            fp=io.StringIO(fastq_empty_sequence))]
+        for i,read in enumerate(reads):
+            batch = batches[i//2]
+            j = i%2
+            self.assertEqual(batch.header(j),str(read.seqid).encode())
+            self.assertEqual(batch.sequence(j),read.sequence.encode())
+            self.assertEqual(batch.quality(j),read.quality.encode())
+            self.assertEqual(batch.lengths[j],len(read.sequence))
+        # Second batch has an empty sequence
+        self.assertEqual(batches[1].sequences.shape,(2,36))
+        self.assertEqual(list(batches[1].lengths),[36,0])
+        self.assertEqual(batches[1].sequences[1].sum(),0)
+        self.assertEqual(batches[1].mask.sum(),36)
+
+    def test_fastq_batch_reader_arrays(self):
+        """Check FastqBatch arrays hold the expected data
+        """
+        fp = io.BytesIO(fastq_data.encode())
+        batches = [b for b in FastqBatchReader(fp=fp)]
+        self.assertEqual(len(batches),1)
+        batch = batches[0]
+        self.assertEqual(len(batch),5)
+        self.assertEqual(batch.sequences.shape,(5,36))
+        self.assertEqual(batch.qualities.shape,(5,36))
+        self.assertEqual(list(batch.header_offsets),
+                         [0,33,67,100,133,166])
+        self.assertEqual(chr(batch.qualities.max()),'C')
+        self.assertEqual(chr(batch.qualities[batch.mask].min()),'#')
+        self.assertEqual(list(batch.sequences[:,0]),[ord('N')]*5)
+
+    def test_fastq_batch_reader_gzipped_file_from_disk(self):
+        """Check batched iteration over gzipped FASTQ file from disk
+        """
+        wd = tempfile.mkdtemp(suffix='.TestFastqBatchReader')
+        try:
+            fastq_in = os.path.join(wd,'test.fq.gz')
+            with gzip.GzipFile(fastq_in,'wb') as fp:
+                fp.write(fastq_data.encode())
+            nreads = sum([len(b) for b in FastqBatchReader(fastq_in,
+                                                          batch_size=3)])
+            self.assertEqual(nreads,5)
+        finally:
+            shutil.rmtree(wd)
+
 class TestFastqRead(unittest.TestCase):
     """Tests of the FastqRead class
     """
@@ -364,6 +540,27 @@ class TestSequenceIdentifier(unittest.TestCase):
         # Check the format
         self.assertEqual(None,seqid.format)
 
+    def test_unrecognised_id_format_attributes(self):
+        """Check attributes of an unrecognised sequence identifier are None
+        """
+        seqid = SequenceIdentifier("@SEQID")
+        self.assertEqual(None,seqid.instrument_name)
+        self.assertEqual(None,seqid.pair_id)
+        self.assertEqual(None,seqid.index_sequence)
+
+    def test_update_attributes(self):
+        """Check that updated attributes are reflected in identifier string
+        """
+        seqid = SequenceIdentifier(
+            "@EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG\n")
+        seqid.instrument_name = 'NB500968'
+        seqid.index_sequence = 'GCCAAT'
+        self.assertEqual(str(seqid),
+                         "@NB500968:136:FC706VJ:2:2104:15343:197393 1:Y:18:GCCAAT")
+        seqid = SequenceIdentifier("@HWUSI-EAS100R:6:73:941:1973#0/1")
+        seqid.pair_id = '2'
+        self.assertEqual(str(seqid),"@HWUSI-EAS100R:6:73:941:1973#0/2")
+
     def test_is_pair_of(self):
         """Check that paired sequence identifiers are recognised as such
         """
@@ -388,6 +585,335 @@ class TestFastqAttributes(unittest.TestCase):
         attrs = FastqAttributes(fp=fp)
         self.assertEqual(attrs.nreads,5)
 
+class TestThreadedGzipReader(unittest.TestCase):
+    """Tests of the ThreadedGzipReader class and open_gzip_threaded
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestThreadedGzipReader')
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_threaded_gzip_reader(self):
+        """ThreadedGzipReader: read contents of gzipped file
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        fp = open_gzip_threaded(fastq_gz)
+        self.assertEqual(fp.read(),fastq_data.encode())
+        fp.close()
+
+    def test_threaded_gzip_reader_text_mode(self):
+        """ThreadedGzipReader: read contents of gzipped file as text
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        with open_gzip_threaded(fastq_gz,'rt') as fp:
+            self.assertEqual(fp.read(),fastq_data)
+
+    def test_threaded_gzip_reader_multiple_members(self):
+        """ThreadedGzipReader: read gzipped file with multiple members
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        with gzip.GzipFile(fastq_gz,'ab') as fp:
+            fp.write(fastq_data2.encode())
+        with open_gzip_threaded(fastq_gz,'rb',queue_depth=1,
+                                blocksize=16) as fp:
+            self.assertEqual(fp.read(),
+                             (fastq_data + fastq_data2).encode())
+
+    def test_threaded_gzip_reader_small_reads(self):
+        """ThreadedGzipReader: read gzipped file in small chunks
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        data = []
+        with open_gzip_threaded(fastq_gz,blocksize=32) as fp:
+            while True:
+                buf = fp.read(7)
+                if not buf:
+                    break
+                data.append(buf)
+        self.assertEqual(b''.join(data),fastq_data.encode())
+
+    def test_threaded_gzip_reader_truncated_file(self):
+        """ThreadedGzipReader: raise exception for truncated file
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        with open(fastq_gz,'rb') as fp:
+            data = fp.read()
+        with open(fastq_gz,'wb') as fp:
+            fp.write(data[:-20])
+        fp = open_gzip_threaded(fastq_gz)
+        self.assertRaises(EOFError,fp.read)
+        fp.close()
+
+    def test_threaded_gzip_reader_close_before_eof(self):
+        """ThreadedGzipReader: stop decompression when closed early
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            for i in range(100):
+                fp.write(fastq_data.encode())
+        reader = ThreadedGzipReader(fastq_gz,queue_depth=1,blocksize=64)
+        self.assertEqual(reader.read(1),b'@')
+        reader.close()
+        self.assertFalse(reader._thread.is_alive())
+
+    def test_get_fastq_file_handle_threaded(self):
+        """get_fastq_file_handle: returns threaded reader for gzipped FASTQ
+        """
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq_gz,'wb') as fp:
+            fp.write(fastq_data.encode())
+        fp = get_fastq_file_handle(fastq_gz,'rb',threaded=True)
+        self.assertTrue(isinstance(fp.raw,ThreadedGzipReader))
+        self.assertEqual(fp.read(),fastq_data.encode())
+        fp.close()
+        fp = get_fastq_file_handle(fastq_gz,'rb')
+        self.assertTrue(isinstance(fp,gzip.GzipFile))
+        self.assertEqual(fp.read(),fastq_data.encode())
+        fp.close()
+
+class TestFastqWriter(unittest.TestCase):
+    """Tests of the FastqWriter class
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestFastqWriter')
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_fastq_writer(self):
+        """Check writing FastqRead objects to uncompressed FASTQ
+        """
+        fastq_out = os.path.join(self.wd,'test.fq')
+        with FastqWriter(fastq_out) as fq:
+            for read in FastqIterator(fp=io.StringIO(fastq_data)):
+                fq.write(read)
+        self.assertEqual(io.open(fastq_out,'rt').read(),fastq_data)
+
+    def test_fastq_writer_raw_records(self):
+        """Check writing raw and string records
+        """
+        fp = io.BytesIO()
+        fq = FastqWriter(fp=fp,bufsize=100)
+        reads = [r for r in FastqIterator(fp=io.BytesIO(fastq_data.encode()),
+                                          binary=True)]
+        fq.write(reads[0])
+        fq.write(reads[1].data)
+        fq.write(reads[2].data.decode().rstrip('\n'))
+        fq.writelines(reads[3:])
+        fq.flush()
+        self.assertEqual(fp.getvalue(),fastq_data.encode())
+
+    def test_fastq_writer_write_data(self):
+        """Check writing data verbatim
+        """
+        fp = io.BytesIO()
+        fq = FastqWriter(fp=fp,compress=True,bufsize=100)
+        data = fastq_data.encode().rstrip(b'\n')
+        fq.write_data(data[:150])
+        fq.write_data(data[150:])
+        fq.close()
+        with gzip.GzipFile(fileobj=io.BytesIO(fp.getvalue())) as gz:
+            self.assertEqual(gz.read(),data)
+
+    def test_fastq_writer_gzipped(self):
+        """Check writing gzipped FASTQ
+        """
+        fastq_out = os.path.join(self.wd,'test.fq.gz')
+        with FastqWriter(fastq_out) as fq:
+            for read in FastqIterator(fp=io.StringIO(fastq_data)):
+                fq.write(read)
+        self.assertTrue(fq.compress)
+        self.assertEqual(gzip.open(fastq_out,'rt').read(),fastq_data)
+
+    def test_fastq_writer_gzipped_multiple_threads(self):
+        """Check writing gzipped FASTQ using multiple threads
+        """
+        fastq_out = os.path.join(self.wd,'test.fq.gz')
+        data = fastq_data*100
+        with FastqWriter(fastq_out,nthreads=4,bufsize=1000) as fq:
+            for read in FastqIterator(fp=io.StringIO(data)):
+                fq.write(read)
+        self.assertEqual(gzip.open(fastq_out,'rt').read(),data)
+        # Check output consists of multiple gzip members
+        with io.open(fastq_out,'rb') as fp:
+            self.assertTrue(fp.read().count(b'\x1f\x8b\x08') > 1)
+
+    def test_fastq_writer_bgzf(self):
+        """Check writing BGZF FASTQ using multiple threads
+        """
+        from bcftbx.BGZF import is_bgzf_file
+        fastq_out = os.path.join(self.wd,'test.fq.gz')
+        data = fastq_data*100
+        with FastqWriter(fastq_out,nthreads=4,bufsize=1000,
+                         bgzf=True) as fq:
+            for read in FastqIterator(fp=io.StringIO(data)):
+                fq.write(read)
+        self.assertTrue(fq.compress)
+        self.assertTrue(fq.bgzf)
+        self.assertTrue(is_bgzf_file(fastq_out))
+        self.assertEqual(gzip.open(fastq_out,'rt').read(),data)
+        # Check records can be located using an index
+        build_fastq_index(fastq_out,interval=7)
+        idx = FastqIndex(fastq_out)
+        self.assertEqual(str(idx.get_read(123)),
+                         str(list(FastqIterator(fp=io.StringIO(data)))[123]))
+
+    def test_fastq_writer_empty_gzipped_file(self):
+        """Check writing gzipped FASTQ with no reads
+        """
+        fastq_out = os.path.join(self.wd,'test.fq.gz')
+        FastqWriter(fastq_out).close()
+        self.assertTrue(os.path.getsize(fastq_out) > 0)
+        self.assertEqual(gzip.open(fastq_out,'rt').read(),'')
+
+    def test_fastq_writer_batches(self):
+        """Check writing FastqBatch objects
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("'numpy' not available")
+        fp = io.BytesIO()
+        with FastqWriter(fp=fp) as fq:
+            fq.writelines(FastqBatchReader(
+                fp=io.BytesIO(fastq_empty_sequence.encode()),
+                batch_size=2))
+            fq.flush()
+            self.assertEqual(fp.getvalue().decode(),fastq_empty_sequence)
+
+class TestFastqIndex(unittest.TestCase):
+    """Tests of the FastqIndex class and build_fastq_index function
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestFastqIndex')
+        self.reads = [r for r in FastqIterator(fp=io.StringIO(fastq_data))]
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def _check_index(self,fastq,interval):
+        # Build index and check that all access methods
+        # return the expected reads
+        index = build_fastq_index(fastq,interval=interval)
+        self.assertTrue(os.path.exists(fastq + '.fqi'))
+        index = FastqIndex(fastq)
+        self.assertEqual(index.nreads,5)
+        self.assertEqual(len(index),5)
+        self.assertEqual(index.interval,interval)
+        for i in range(5):
+            self.assertEqual(index.get_read(i),self.reads[i])
+        self.assertEqual(list(index.iter_range(1,4)),self.reads[1:4])
+        self.assertEqual(list(index.iter_range(3)),self.reads[3:])
+        self.assertEqual(list(index.iter_reads((4,0,2))),
+                         [self.reads[0],self.reads[2],self.reads[4]])
+        self.assertEqual([r.fastqread()
+                          for r in index.iter_range(0,5,binary=True)],
+                         self.reads)
+        self.assertRaises(IndexError,index.get_read,5)
+        return index
+
+    def test_fastq_index(self):
+        """FastqIndex: access reads in uncompressed FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(fastq_data)
+        for interval in (1,2,3,5,1000):
+            index = self._check_index(fastq,interval)
+            self.assertFalse(index.compressed)
+
+    def test_fastq_index_gzipped(self):
+        """FastqIndex: access reads in gzipped FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq,'wb') as fp:
+            fp.write(fastq_data.encode())
+        for interval in (1,2,1000):
+            index = self._check_index(fastq,interval)
+            self.assertTrue(index.compressed)
+
+    def test_fastq_index_gzipped_closes_files(self):
+        """FastqIndex: random access to gzipped FASTQ doesn't leak files
+        """
+        if not os.path.isdir('/proc/self/fd'):
+            raise unittest.SkipTest("can't count open file descriptors")
+        fastq = os.path.join(self.wd,'test.fq.gz')
+        with gzip.GzipFile(fastq,'wb') as fp:
+            fp.write(fastq_data.encode())
+        index = build_fastq_index(fastq,interval=1)
+        nfds = len(os.listdir('/proc/self/fd'))
+        for i in range(5):
+            self.assertEqual(index.get_read(i),self.reads[i])
+            self.assertEqual(list(index.iter_reads((i,))),[self.reads[i]])
+        self.assertEqual(len(os.listdir('/proc/self/fd')),nfds)
+
+    def test_fastq_index_gzipped_multiple_members(self):
+        """FastqIndex: access reads in multi-member gzipped FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq.gz')
+        # Split data into members at arbitrary points
+        data = fastq_data.encode()
+        for start,end in ((0,50),(50,200),(200,len(data))):
+            with gzip.GzipFile(fastq,'ab') as fp:
+                fp.write(data[start:end])
+        for interval in (1,2,1000):
+            index = self._check_index(fastq,interval)
+            self.assertEqual(len(index._members),3)
+
+    def test_fastq_index_split(self):
+        """FastqIndex: split reads into ranges
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(fastq_data)
+        index = build_fastq_index(fastq,interval=2)
+        self.assertEqual(index.split(1),[(0,5)])
+        self.assertEqual(index.split(2),[(0,2),(2,5)])
+        self.assertEqual(index.split(5),[(0,1),(1,2),(2,3),(3,4),(4,5)])
+        reads = []
+        for start,stop in index.split(3):
+            reads.extend(index.iter_range(start,stop))
+        self.assertEqual(reads,self.reads)
+
+    def test_fastq_index_out_of_date(self):
+        """FastqIndex: raise exception if index is out of date
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(fastq_data)
+        build_fastq_index(fastq)
+        with io.open(fastq,'at') as fp:
+            fp.write(fastq_data)
+        self.assertRaises(Exception,FastqIndex,fastq)
+
+    def test_fastq_index_bad_fastq(self):
+        """build_fastq_index: raise exception for truncated FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(u'\n'.join(fastq_data.split('\n')[:-3]))
+        self.assertRaises(Exception,build_fastq_index,fastq)
+
 class TestNReads(unittest.TestCase):
     """Tests of the nreads function
     """
@@ -422,6 +948,367 @@ class TestNReads(unittest.TestCase):
             fp.write(fastq_data.encode())
         self.assertEqual(nreads(self.fastq_in),5)
 
+    def test_nreads_from_binary_stream(self):
+        """nreads: check nreads from stream opened in binary mode
+        """
+        fp = io.BytesIO(fastq_data.encode())
+        self.assertEqual(nreads(fp=fp),5)
+
+class TestCountFastqReads(unittest.TestCase):
+    """Tests of the count_fastq_reads function
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestCountFastqReads')
+        self.fastq = os.path.join(self.wd,'test.fq')
+        with open(self.fastq,'w') as fp:
+            fp.write(fastq_data)
+        self.fastq_gz = os.path.join(self.wd,'test2.fq.gz')
+        with gzip.GzipFile(self.fastq_gz,'wb') as fp:
+            fp.write((fastq_data + fastq_data2).encode())
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_count_fastq_reads(self):
+        """count_fastq_reads: count reads in single FASTQ
+        """
+        counts = count_fastq_reads(self.fastq)
+        self.assertEqual(len(counts),1)
+        self.assertEqual(counts[0].fastq,self.fastq)
+        self.assertEqual(counts[0].nreads,5)
+        self.assertEqual(counts[0].nbytes,len(fastq_data))
+        self.assertTrue(counts[0].bytes_per_second > 0)
+
+    def test_count_fastq_reads_multiple_files(self):
+        """count_fastq_reads: count reads in multiple FASTQs
+        """
+        counts = count_fastq_reads([self.fastq,self.fastq_gz])
+        self.assertEqual([c.fastq for c in counts],
+                         [self.fastq,self.fastq_gz])
+        self.assertEqual([c.nreads for c in counts],[5,10])
+        self.assertEqual(counts[1].nbytes,
+                         len(fastq_data) + len(fastq_data2))
+
+    def test_count_fastq_reads_in_parallel(self):
+        """count_fastq_reads: count reads using multiple processes
+        """
+        counts = count_fastq_reads([self.fastq,self.fastq_gz,self.fastq],
+                                   nprocs=2,chunksize=100)
+        self.assertEqual([c.nreads for c in counts],[5,10,5])
+        self.assertEqual(counts[0].nbytes,len(fastq_data))
+
+    def test_count_fastq_reads_empty_file(self):
+        """count_fastq_reads: count reads in empty FASTQ
+        """
+        fastq = os.path.join(self.wd,'empty.fq')
+        with open(fastq,'w') as fp:
+            fp.write(u'')
+        self.assertEqual(count_fastq_reads(fastq,nprocs=2)[0].nreads,0)
+
+    def test_count_fastq_reads_bad_fastq(self):
+        """count_fastq_reads: raise exception for truncated FASTQ
+        """
+        fastq = os.path.join(self.wd,'bad.fq')
+        with open(fastq,'w') as fp:
+            fp.write(u'\n'.join(fastq_data.split('\n')[:-3]))
+        self.assertRaises(Exception,count_fastq_reads,fastq)
+
+class TestChunks(unittest.TestCase):
+    """Tests of the chunks function and FastqChunk class
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestChunks')
+        # Quality strings starting with '@' and an empty
+        # sequence make the boundaries harder to locate
+        self.fastq_data = u"".join(["@READ%d:1:FC:%d:1:1:1 1:N:0:\n"
+                                    "%s\n+\n%s\n" % (i,i%3+1,
+                                                        "ACGTN"[:i%6],
+                                                        "@@@@@"[:i%6])
+                                    for i in range(60)])
+        self.reads = [r for r in FastqIterator(
+            fp=io.StringIO(self.fastq_data))]
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_chunks(self):
+        """chunks: split uncompressed FASTQ at record boundaries
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data)
+        for n in (1,2,3,7,60,100):
+            fastq_chunks = chunks(fastq,n)
+            self.assertTrue(len(fastq_chunks) <= min(n,60))
+            if n < 10:
+                self.assertEqual(len(fastq_chunks),n)
+            self.assertEqual(fastq_chunks[0].start,0)
+            self.assertEqual(fastq_chunks[-1].end,os.path.getsize(fastq))
+            reads = []
+            for chunk in fastq_chunks:
+                self.assertFalse(chunk.indexed)
+                reads.extend([r for r in chunk])
+            self.assertEqual(reads,self.reads)
+
+    def test_chunks_binary_reads(self):
+        """chunks: iterate over chunks returning raw reads
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data)
+        reads = []
+        for chunk in chunks(fastq,4):
+            reads.extend([r.fastqread()
+                          for r in chunk.iter_reads(binary=True)])
+        self.assertEqual(reads,self.reads)
+
+    def test_chunks_iter_blocks(self):
+        """FastqChunk: iterate over blocks of complete records
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data)
+        build_fastq_index(fastq,interval=10)
+        fastq_gz = os.path.join(self.wd,'test.fq.gz')
+        with gzip.open(fastq_gz,'wt') as fp:
+            fp.write(self.fastq_data)
+        build_fastq_index(fastq_gz,interval=10)
+        for fq in (fastq,fastq_gz):
+            for n in (1,3):
+                blocks = []
+                for chunk in chunks(fq,n):
+                    blocks.extend([b for b in chunk.iter_blocks(blocksize=50)])
+                self.assertTrue(len(blocks) > n)
+                for block in blocks:
+                    self.assertTrue(block.startswith(b'@READ'))
+                    self.assertEqual(block.count(b'\n')%4,0)
+                self.assertEqual(b''.join(blocks),self.fastq_data.encode())
+
+    def test_chunks_iter_blocks_no_trailing_newline(self):
+        """FastqChunk: blocks end with newline if final one is missing
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        with io.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data.rstrip())
+        self.assertEqual(b''.join(FastqChunk(fastq).iter_blocks()),
+                         self.fastq_data.encode())
+
+    def test_chunks_empty_file(self):
+        """chunks: handle empty FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq')
+        io.open(fastq,'wt').close()
+        fastq_chunks = chunks(fastq,4)
+        self.assertEqual(len(fastq_chunks),1)
+        self.assertEqual([r for r in fastq_chunks[0]],[])
+
+    def test_chunks_gzipped(self):
+        """chunks: gzipped FASTQ without index is not split
+        """
+        fastq = os.path.join(self.wd,'test.fq.gz')
+        with gzip.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data)
+        fastq_chunks = chunks(fastq,4)
+        self.assertEqual(len(fastq_chunks),1)
+        self.assertEqual([r for r in fastq_chunks[0]],self.reads)
+
+    def test_chunks_gzipped_with_index(self):
+        """chunks: split indexed gzipped FASTQ
+        """
+        fastq = os.path.join(self.wd,'test.fq.gz')
+        with gzip.open(fastq,'wt') as fp:
+            fp.write(self.fastq_data)
+        build_fastq_index(fastq,interval=10)
+        fastq_chunks = chunks(fastq,4)
+        self.assertEqual(len(fastq_chunks),4)
+        reads = []
+        for chunk in fastq_chunks:
+            self.assertTrue(chunk.indexed)
+            reads.extend([r for r in chunk])
+        self.assertEqual(reads,self.reads)
+
+def _count_lanes(chunk):
+    # Helper for parallel_map tests
+    lanes = {}
+    for read in chunk.iter_reads(binary=True):
+        lane = int(read.raw_seqid.split(b':')[3])
+        lanes[lane] = lanes.get(lane,0) + 1
+    return lanes
+
+def _merge_counts(counts1,counts2):
+    # Helper for parallel_map tests
+    counts = dict(counts1)
+    for lane in counts2:
+        counts[lane] = counts.get(lane,0) + counts2[lane]
+    return counts
+
+class TestParallelMap(unittest.TestCase):
+    """Tests of the parallel_map function
+    """
+    def setUp(self):
+        # Temporary working dir
+        self.wd = tempfile.mkdtemp(suffix='.TestParallelMap')
+        self.fastq = os.path.join(self.wd,'test.fq')
+        with io.open(self.fastq,'wt') as fp:
+            for i in range(100):
+                fp.write(u"@READ%d:1:FC:%d:1:1:1 1:N:0:\nACGT\n+\n@@@@\n"
+                         % (i,i%4+1))
+
+    def tearDown(self):
+        # Remove temporary working dir
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+
+    def test_parallel_map(self):
+        """parallel_map: returns results for each chunk
+        """
+        results = parallel_map(_count_lanes,self.fastq,nchunks=4)
+        self.assertEqual(len(results),4)
+        self.assertEqual(sum([sum(r.values()) for r in results]),100)
+
+    def test_parallel_map_with_reducer(self):
+        """parallel_map: reduces results from multiple processes
+        """
+        for nprocs in (1,4):
+            self.assertEqual(parallel_map(_count_lanes,self.fastq,
+                                          nprocs=nprocs,
+                                          reducer=_merge_counts),
+                             { 1: 25, 2: 25, 3: 25, 4: 25 })
+
+class TestSniffEncoding(unittest.TestCase):
+    """Tests of the sniff_encoding function
+    """
+    def test_sniff_encoding_phred33(self):
+        """sniff_encoding: identify Phred+33 encoded data
+        """
+        result = sniff_encoding(fp=io.BytesIO(fastq_data.encode()))
+        self.assertEqual(result.header_format,'illumina18')
+        self.assertEqual(result.seqlen,36)
+        self.assertEqual(result.min_qual,ord('#'))
+        self.assertEqual(result.max_qual,ord('C'))
+        self.assertEqual(result.encodings,['Phred+33'])
+        self.assertEqual(result.encoding,'Phred+33')
+        self.assertEqual(result.galaxy_type,'fastqsanger')
+        self.assertEqual(result.confidence,'high')
+
+    def test_sniff_encoding_phred64(self):
+        """sniff_encoding: identify Phred+64 encoded data
+        """
+        data = u"@HWUSI-EAS100R:6:73:941:1973#0/1\nACGTN\n+\nhh@Bh\n"
+        result = sniff_encoding(fp=io.BytesIO(data.encode()))
+        self.assertEqual(result.header_format,'illumina')
+        self.assertEqual(result.encodings,['Phred+64','Solexa+64'])
+        self.assertEqual(result.galaxy_types,['fastqillumina',
+                                              'fastqsolexa'])
+        self.assertEqual(result.encoding,'Phred+64')
+        self.assertEqual(result.confidence,'low')
+
+    def test_sniff_encoding_colorspace(self):
+        """sniff_encoding: identify colorspace data
+        """
+        data = u"@1_14_622\nT221.00330\n+\nBBA!>AA,B>\n"
+        result = sniff_encoding(fp=io.BytesIO(data.encode()))
+        self.assertEqual(result.header_format,'colorspace')
+        self.assertEqual(result.seqlen,9)
+        self.assertEqual(result.encodings,['Phred+33'])
+        self.assertEqual(result.galaxy_type,'fastqcssanger')
+
+    def test_sniff_encoding_early_stop(self):
+        """sniff_encoding: stop once encoding is determined
+        """
+        data = fastq_data*100
+        result = sniff_encoding(fp=io.BytesIO(data.encode()),
+                                blocksize=1000)
+        self.assertFalse(result.complete)
+        self.assertTrue(result.nreads < 500)
+        self.assertEqual(result.encoding,'Phred+33')
+        result = sniff_encoding(fp=io.BytesIO(data.encode()),
+                                blocksize=1000,early_stop=False)
+        self.assertTrue(result.complete)
+        self.assertEqual(result.nreads,500)
+
+    def test_sniff_encoding_subset(self):
+        """sniff_encoding: only examine a subset of reads
+        """
+        result = sniff_encoding(fp=io.BytesIO(fastq_data.encode()),
+                                subset=2,early_stop=False,blocksize=10)
+        self.assertEqual(result.nreads,2)
+        self.assertEqual(result.min_qual,ord('#'))
+        self.assertEqual(result.max_qual,ord('C'))
+
+    def test_sniff_encoding_without_numpy(self):
+        """sniff_encoding: get same result without numpy
+        """
+        import bcftbx.FASTQFile
+        result = sniff_encoding(fp=io.BytesIO(fastq_data.encode()),
+                                early_stop=False,blocksize=100)
+        numpy_ = bcftbx.FASTQFile.numpy
+        try:
+            bcftbx.FASTQFile.numpy = None
+            result2 = sniff_encoding(fp=io.BytesIO(fastq_data.encode()),
+                                     early_stop=False,blocksize=100)
+        finally:
+            bcftbx.FASTQFile.numpy = numpy_
+        self.assertEqual((result.min_qual,result.max_qual),
+                         (result2.min_qual,result2.max_qual))
+
+    def test_sniff_encoding_gzipped_file_from_disk(self):
+        """sniff_encoding: handle gzipped FASTQ from disk
+        """
+        wd = tempfile.mkdtemp(suffix='.TestSniffEncoding')
+        try:
+            fastq_in = os.path.join(wd,'test.fq.gz')
+            with gzip.open(fastq_in,'wt') as fp:
+                fp.write(fastq_data)
+            result = sniff_encoding(fastq_in)
+            self.assertEqual(result.fastq,fastq_in)
+            self.assertEqual(result.encoding,'Phred+33')
+        finally:
+            shutil.rmtree(wd)
+
+class TestFastqPairIterator(unittest.TestCase):
+    """Tests of the FastqPairIterator class
+    """
+
+    def test_fastq_pair_iterator(self):
+        """Check iteration over pair of FASTQs
+        """
+        fp1 = io.StringIO(fastq_data)
+        fp2 = io.StringIO(fastq_data2)
+        reads1 = [r for r in FastqIterator(fp=io.StringIO(fastq_data))]
+        reads2 = [r for r in FastqIterator(fp=io.StringIO(fastq_data2))]
+        pairs = [p for p in FastqPairIterator(fp1=fp1,fp2=fp2)]
+        self.assertEqual(len(pairs),5)
+        for i,(r1,r2) in enumerate(pairs):
+            self.assertTrue(isinstance(r1,FastqRead))
+            self.assertEqual(r1,reads1[i])
+            self.assertEqual(r2,reads2[i])
+
+    def test_fastq_pair_iterator_binary(self):
+        """Check iteration over pair of FASTQs in binary mode
+        """
+        fp1 = io.BytesIO(fastq_data.encode())
+        fp2 = io.BytesIO(fastq_data2.encode())
+        pairs = [p for p in FastqPairIterator(fp1=fp1,fp2=fp2,binary=True)]
+        self.assertEqual(len(pairs),5)
+        for r1,r2 in pairs:
+            self.assertTrue(isinstance(r1,RawFastqRead))
+            self.assertTrue(r1.seqid.is_pair_of(r2.seqid))
+
+    def test_fastq_pair_iterator_different_lengths(self):
+        """Check iteration over FASTQs with different numbers of reads
+        """
+        fp1 = io.StringIO(fastq_data)
+        fp2 = io.StringIO(u'\n'.join(fastq_data2.split('\n')[:8]))
+        pairs = FastqPairIterator(fp1=fp1,fp2=fp2)
+        self.assertRaises(Exception,list,pairs)
+
 class TestFastqsArePair(unittest.TestCase):
     """Tests of the fastqs_are_pair function
     """
@@ -433,6 +1320,69 @@ class TestFastqsArePair(unittest.TestCase):
         fp2 = io.StringIO(fastq_data2)
         self.assertTrue(fastqs_are_pair(fp1=fp1,fp2=fp2,verbose=False))
 
+    def test_fastqs_are_pair_fast(self):
+        """Check that fastq pair is recognised as such using fast check
+        """
+        fp1 = io.BytesIO(fastq_data.encode())
+        fp2 = io.BytesIO(fastq_data2.encode())
+        self.assertTrue(fastqs_are_pair(fp1=fp1,fp2=fp2,verbose=False,
+                                        fast=True))
+
+    def test_fastqs_are_not_pair(self):
+        """Check that mismatched fastqs are not recognised as pair
+        """
+        fastq_data3 = fastq_data2.replace(":8103:",":8104:")
+        for fast in (False,True):
+            fp1 = io.BytesIO(fastq_data.encode())
+            fp2 = io.BytesIO(fastq_data3.encode())
+            if not fast:
+                fp1 = io.TextIOWrapper(fp1)
+                fp2 = io.TextIOWrapper(fp2)
+            self.assertFalse(fastqs_are_pair(fp1=fp1,fp2=fp2,
+                                             verbose=False,fast=fast))
+
+    def test_fastqs_are_not_pair_different_lengths(self):
+        """Check that fastqs with different numbers of reads are not pair
+        """
+        fp1 = io.StringIO(fastq_data)
+        fp2 = io.StringIO(u'\n'.join(fastq_data2.split('\n')[:8]))
+        self.assertFalse(fastqs_are_pair(fp1=fp1,fp2=fp2,verbose=False))
+
+    def test_fastqs_are_pair_raises_errors(self):
+        """Check that errors other than different numbers of reads are raised
+        """
+        fp1 = io.StringIO(fastq_data)
+        self.assertRaises(IOError,fastqs_are_pair,
+                          fp1=fp1,fastq2="/nonexistent/file.fq",
+                          verbose=False)
+
+class TestPairKey(unittest.TestCase):
+    """Tests of the pair_key function
+    """
+
+    def test_pair_key_illumina18(self):
+        """pair_key: handle Illumina 1.8+ sequence identifiers
+        """
+        self.assertEqual(
+            pair_key(b"@EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG"),
+            b"@EAS139:136:FC706VJ:2:2104:15343:197393")
+        self.assertEqual(
+            pair_key("@EAS139:136:FC706VJ:2:2104:15343:197393 2:N:18:ATCACG"),
+            "@EAS139:136:FC706VJ:2:2104:15343:197393")
+
+    def test_pair_key_illumina(self):
+        """pair_key: handle older Illumina sequence identifiers
+        """
+        self.assertEqual(pair_key(b"@HWUSI-EAS100R:6:73:941:1973#0/1\n"),
+                         b"@HWUSI-EAS100R:6:73:941:1973#0")
+        self.assertEqual(pair_key("@HWUSI-EAS100R:6:73:941:1973#0/2"),
+                         "@HWUSI-EAS100R:6:73:941:1973#0")
+
+    def test_pair_key_other(self):
+        """pair_key: handle unrecognised sequence identifiers
+        """
+        self.assertEqual(pair_key(b"@SEQID"),b"@SEQID")
+
 #######################################################################
 # Main program
 #######################################################################
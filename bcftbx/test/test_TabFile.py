@@ -8,6 +8,8 @@ import unittest
 import tempfile
 import os
 import shutil
+import gzip
+from bcftbx.BGZF import is_bgzf_file
 
 # Import long int for Python3 backwards
 # compatibility with Python2
@@ -84,6 +86,16 @@ chr2\t1234\t5678\t6.8
         with io.open(out_file,'rt') as fp:
             self.assertEqual(fp.read(),self.header+self.data)
 
+    def test_write_data_to_bgzf_file(self):
+        """Write data to BGZF file
+        """
+        tabfile = TabFile(fp=self.fp,first_line_is_header=True)
+        out_file = os.path.join(self.working_dir,"test.tsv.gz")
+        tabfile.write(filen=out_file,include_header=True,bgzf=True)
+        self.assertTrue(is_bgzf_file(out_file))
+        with gzip.open(out_file,'rt') as fp:
+            self.assertEqual(fp.read(),self.header+self.data)
+
     def test_load_data_with_header(self):
         """Create and load Tabfile using first line as header
         """
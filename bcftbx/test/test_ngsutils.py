@@ -2,12 +2,16 @@
 # Tests for ngsutils.py module
 #######################################################################
 import unittest
+import re
+import random
 import os
 import io
 import tempfile
 import shutil
 import gzip
 from bcftbx.ngsutils import *
+from bcftbx.ngsutils import _regex_prefilter
+from bcftbx.FASTQFile import build_fastq_index
 from builtins import range
 
 class TestGetreadsFunction(unittest.TestCase):
@@ -112,6 +116,18 @@ T1.311202211102.331233332113.23332233002223222312.2
                                     2)]
         for r1,r2 in zip(reference_reads,qual_reads):
             self.assertEqual(r1,r2)
+    def test_getreads_binary(self):
+        """getreads: read records as bytes
+        """
+        # Make an example file
+        example_csfasta = os.path.join(self.wd,"example.csfasta")
+        with io.open(example_csfasta,'wt') as fp:
+            fp.write(self.example_csfasta_data)
+        # Read lines
+        csfasta_reads = list(getreads(example_csfasta,binary=True))
+        reference_reads = [[l.encode() for l in r]
+                           for r in getreads(example_csfasta)]
+        self.assertEqual(csfasta_reads,reference_reads)
 
 class TestGetreadsSubsetFunction(unittest.TestCase):
     """Tests for the 'getreads_subset' function
@@ -173,6 +189,59 @@ AAF#FJJJJJJJJJJJ
             failed = False
         self.assertFalse(failed,"Exception not raised")
 
+    def test_getreads_subset_fastq_with_index(self):
+        """getreads: get subset of reads from indexed Fastq file
+        """
+        # Make an example file with an index
+        example_fastq = os.path.join(self.wd,"example.fastq.gz")
+        with gzip.open(example_fastq,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        build_fastq_index(example_fastq,interval=1)
+        # Get subset
+        fastq_reads = list(getreads_subset(example_fastq,
+                                           indices=(2,0)))
+        reference_reads = [self.example_fastq_data.split('\n')[i:i+4]
+                           for i in (0,8)]
+        self.assertEqual(fastq_reads,reference_reads)
+        # Out of range
+        self.assertRaises(Exception,
+                          list,
+                          getreads_subset(example_fastq,indices=(0,3)))
+
+class TestCountReadsFunction(unittest.TestCase):
+    """Tests for the 'count_reads' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.example_fastq_data = u"""@K00311:43:HL3LWBBXX:8:1101:21440:1121 1:N:0:CNATGT
+GCCNGACAGCAGAAAT
++
+AAF#FJJJJJJJJJJJ
+@K00311:43:HL3LWBBXX:8:1101:21460:1121 1:N:0:CNATGT
+GGGNGTCATTGATCAT
++
+AAF#FJJJJJJJJJJJ
+"""
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_count_reads_fastq(self):
+        """count_reads: count reads in Fastq file
+        """
+        example_fastq = os.path.join(self.wd,"example.fastq")
+        with io.open(example_fastq,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        self.assertEqual(count_reads(example_fastq),2)
+        self.assertEqual(get_fastq_index(example_fastq),None)
+    def test_count_reads_fastq_with_index(self):
+        """count_reads: count reads in indexed Fastq file
+        """
+        example_fastq = os.path.join(self.wd,"example.fastq")
+        with io.open(example_fastq,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        build_fastq_index(example_fastq)
+        self.assertEqual(get_fastq_index(example_fastq).nreads,2)
+        self.assertEqual(count_reads(example_fastq),2)
+
 class TestGetreadsRegexpFunction(unittest.TestCase):
     """Tests for the 'getreads_regex' function
     """
@@ -207,3 +276,287 @@ AAF#FJJJJJJJJJJJ
                            for i in (0,)]
         for r1,r2 in zip(reference_reads,fastq_reads):
             self.assertEqual(r1,r2)
+    def test_getreads_regexp_fastq_patterns(self):
+        """getreads_regex: patterns are applied to joined lines of reads
+        """
+        # Make example files
+        example_fastq = os.path.join(self.wd,"example.fastq")
+        with io.open(example_fastq,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        example_fastq_gz = os.path.join(self.wd,"example.fastq.gz")
+        with gzip.open(example_fastq_gz,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        reads = [self.example_fastq_data.split('\n')[i:i+4]
+                 for i in (0,4,8)]
+        for pattern,expected in ((":1101:21460:",(1,)),
+                                 ("^([^:]*:){3}8:",(0,1,2)),
+                                 ("CAT\\+AAF",(1,)),
+                                 ("CNATGTC+N[AT]",(2,)),
+                                 ("(GGGN|CCCN)",(1,2)),
+                                 ("^@K00311.*TCAT",(1,)),
+                                 ("ZZZ",()),):
+            for fastq in (example_fastq,example_fastq_gz):
+                self.assertEqual(list(getreads_regex(fastq,pattern)),
+                                 [reads[i] for i in expected])
+    def test_getreads_regexp_fastq_compiled_patterns(self):
+        """getreads_regex: handle precompiled patterns and flags
+        """
+        # Make an example file
+        example_fastq = os.path.join(self.wd,"example.fastq")
+        with io.open(example_fastq,'wt') as fp:
+            fp.write(self.example_fastq_data)
+        reads = [self.example_fastq_data.split('\n')[i:i+4]
+                 for i in (0,4,8)]
+        for pattern,expected in ((re.compile(":1101:21460:"),(1,)),
+                                 (re.compile("gggn",re.IGNORECASE),(1,)),
+                                 (re.compile("gggn"),()),
+                                 (re.compile(r"CCC N  # comment",
+                                             re.VERBOSE),(2,)),
+                                 (re.compile(b":21805:"),(2,)),):
+            self.assertEqual(list(getreads_regex(example_fastq,pattern)),
+                             [reads[i] for i in expected])
+    def test_getreads_regexp_fastq_multiple_processes(self):
+        """getreads_regex: get matching reads using multiple processes
+        """
+        # Make an example file
+        example_fastq = os.path.join(self.wd,"example.fastq")
+        with io.open(example_fastq,'wt') as fp:
+            for i in range(100):
+                fp.write(self.example_fastq_data)
+        reads = [r for r in getreads(example_fastq)
+                 if ":21805:" in r[0]]
+        self.assertEqual(len(reads),100)
+        self.assertEqual(list(getreads_regex(example_fastq,":21805:",
+                                             nprocs=3)),
+                         reads)
+    def test_regex_prefilter(self):
+        """_regex_prefilter: extract required literal from pattern
+        """
+        self.assertEqual(_regex_prefilter(":1101:21440:1121"),
+                         b":1101:21440:1121")
+        self.assertEqual(_regex_prefilter("^([^:]*:){3}8:"),b":8:")
+        self.assertEqual(_regex_prefilter("(ABC)?DE"),b"DE")
+        self.assertEqual(_regex_prefilter("ACG?T\\.[AC]+GGGA"),b"GGGA")
+        self.assertEqual(_regex_prefilter("AB(CDEF)?\\d"),b"AB")
+        self.assertEqual(_regex_prefilter("AC|GT"),None)
+        self.assertEqual(_regex_prefilter("(?i)ACGT"),None)
+        self.assertEqual(_regex_prefilter("[ACGT]*"),None)
+
+class TestGetreadsHashedFunction(unittest.TestCase):
+    """Tests for the 'getreads_hashed' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        # Make R1/R2 Fastqs
+        self.r1 = os.path.join(self.wd,"example_R1.fastq")
+        self.r2 = os.path.join(self.wd,"example_R2.fastq")
+        for fq,read in ((self.r1,'1'),(self.r2,'2')):
+            with io.open(fq,'wt') as fp:
+                for i in range(1000):
+                    fp.write(u"@K00311:43:HL3LWBBXX:8:1101:%d:1121 "
+                             "%s:N:0:CNATGT\nGCCNGACAGC\n+\nAAF#FJJJJJ\n"
+                             % (i,read))
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_getreads_hashed_fraction(self):
+        """getreads_hashed: get approximate fraction of reads
+        """
+        reads = list(getreads_hashed(self.r1,0.25))
+        self.assertTrue(200 < len(reads) < 300)
+        self.assertEqual(list(getreads_hashed(self.r1,0.0)),[])
+        self.assertEqual(len(list(getreads_hashed(self.r1,1.0))),1000)
+        self.assertRaises(ValueError,list,getreads_hashed(self.r1,1.5))
+    def test_getreads_hashed_pairs(self):
+        """getreads_hashed: same reads are selected from R1 and R2
+        """
+        reads1 = list(getreads_hashed(self.r1,0.1,seed=1234))
+        reads2 = list(getreads_hashed(self.r2,0.1,seed=1234))
+        self.assertEqual([r[0].split()[0] for r in reads1],
+                         [r[0].split()[0] for r in reads2])
+    def test_getreads_hashed_seed(self):
+        """getreads_hashed: seed determines reads selected
+        """
+        reads1 = list(getreads_hashed(self.r1,0.1,seed=1234))
+        self.assertEqual(list(getreads_hashed(self.r1,0.1,seed=1234)),
+                         reads1)
+        self.assertNotEqual(list(getreads_hashed(self.r1,0.1,seed=5678)),
+                            reads1)
+
+class TestSampleReadsFunction(unittest.TestCase):
+    """Tests for the 'sample_reads' function
+    """
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        # Make R1/R2 Fastqs
+        self.r1 = os.path.join(self.wd,"example_R1.fastq")
+        self.r2 = os.path.join(self.wd,"example_R2.fastq")
+        for fq,read in ((self.r1,'1'),(self.r2,'2')):
+            with io.open(fq,'wt') as fp:
+                for i in range(100):
+                    fp.write(u"@K00311:43:HL3LWBBXX:8:1101:%d:1121 "
+                             "%s:N:0:CNATGT\nGCCNGACAGC\n+\nAAF#FJJJJJ\n"
+                             % (i,read))
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_sample_reads(self):
+        """sample_reads: get random subset of reads from single file
+        """
+        nreads,reads = sample_reads(self.r1,10,seed=1234)
+        self.assertEqual(nreads,100)
+        self.assertEqual(len(reads),10)
+        # Reads are in file order
+        indices = [int(r[0][0].split(':')[5]) for r in reads]
+        self.assertEqual(indices,sorted(indices))
+        self.assertEqual(len(set(indices)),10)
+        # Same seed gives same subset
+        self.assertEqual(sample_reads(self.r1,10,seed=1234),
+                         (nreads,reads))
+    def test_sample_reads_pairs(self):
+        """sample_reads: get same random subset of reads from R1/R2
+        """
+        nreads,reads = sample_reads((self.r1,self.r2),10)
+        self.assertEqual(nreads,100)
+        self.assertEqual(len(reads),10)
+        for r1,r2 in reads:
+            self.assertEqual(r1[0].split()[0],r2[0].split()[0])
+            self.assertEqual(r1[0].split()[1][0],'1')
+            self.assertEqual(r2[0].split()[1][0],'2')
+    def test_sample_reads_subset_larger_than_file(self):
+        """sample_reads: return all reads if subset larger than file
+        """
+        nreads,reads = sample_reads((self.r1,self.r2),1000)
+        self.assertEqual(nreads,100)
+        self.assertEqual(len(reads),100)
+        self.assertEqual([r[0] for r in reads],
+                         list(getreads(self.r1)))
+    def test_sample_reads_inconsistent_files(self):
+        """sample_reads: raise exception for different read counts
+        """
+        with io.open(self.r2,'at') as fp:
+            fp.write(u"@extra 2:N:0:CNATGT\nGCCNGACAGC\n+\nAAF#FJJJJJ\n")
+        self.assertRaises(Exception,sample_reads,(self.r1,self.r2),10)
+
+class TestBarcodeIndex(unittest.TestCase):
+    """Tests for the 'BarcodeIndex' class
+    """
+    def test_barcode_index_exact_matches(self):
+        """BarcodeIndex: look up barcodes with no mismatches
+        """
+        index = BarcodeIndex(("ACCTAG","GTTCAA"))
+        self.assertEqual(len(index),2)
+        self.assertEqual(index.lookup("ACCTAG"),"ACCTAG")
+        self.assertEqual(index.lookup("GTTCAA"),"GTTCAA")
+        self.assertEqual(index.lookup("ACCTAC"),None)
+        self.assertEqual(index.lookup("ACCTAGTT"),"ACCTAG")
+        self.assertEqual(index.lookup("ACCTA"),None)
+        self.assertTrue("GTTCAA" in index)
+        self.assertFalse("GTTCAT" in index)
+        self.assertEqual(index.collisions,[])
+
+    def test_barcode_index_mismatches(self):
+        """BarcodeIndex: look up barcodes allowing mismatches
+        """
+        index = BarcodeIndex(max_mismatches=1)
+        index.add("ACCTAG","PB1")
+        index.add("GTTCAA","PB2")
+        self.assertEqual(index.lookup("ACCTAG"),"PB1")
+        self.assertEqual(index.lookup("ACCTAC"),"PB1")
+        self.assertEqual(index.lookup("TCCTAG"),"PB1")
+        self.assertEqual(index.lookup("ACGTAC"),None)
+        self.assertEqual(index.lookup("GTTCTT"),None)
+        self.assertEqual(len(index.neighbourhood("ACCTAG")),1+6*4)
+        index = BarcodeIndex(("ACCTAG",),max_mismatches=2)
+        self.assertEqual(index.lookup("ACGTAC"),"ACCTAG")
+        self.assertEqual(index.lookup("TCGTAC"),None)
+
+    def test_barcode_index_handle_n(self):
+        """BarcodeIndex: 'N' bases count as mismatches
+        """
+        index = BarcodeIndex(("ACCTAG",))
+        self.assertEqual(index.lookup("ACCTAN"),None)
+        index = BarcodeIndex(("ACCTAG",),max_mismatches=1)
+        self.assertEqual(index.lookup("ACCTAN"),"ACCTAG")
+        self.assertEqual(index.lookup("NCCTAN"),None)
+
+    def test_barcode_index_dual_index(self):
+        """BarcodeIndex: mismatches are counted for each index
+        """
+        index = BarcodeIndex(max_mismatches=1)
+        index.add(("ACCTAG","TTAGGC"),"PB1")
+        index.add(("ACCTAG","CGATGT"),"PB2")
+        self.assertEqual(index.barcodes,["ACCTAG+TTAGGC","ACCTAG+CGATGT"])
+        self.assertEqual(index.lookup("ACCTAG+TTAGGC"),"PB1")
+        self.assertEqual(index.lookup("ACCTAC+TTAGGA"),"PB1")
+        self.assertEqual(index.lookup("ACCTAG+CGATGN"),"PB2")
+        self.assertEqual(index.lookup("ACCTAG+TTAGCA"),None)
+        self.assertEqual(index.lookup("ACCTAGTTAGGC"),None)
+
+    def test_barcode_index_dual_index_matches_exhaustive_check(self):
+        """BarcodeIndex: dual-index lookups match exhaustive comparison
+        """
+        rng = random.Random(1234)
+        def random_seq(n,alphabet="ACGT"):
+            return ''.join([rng.choice(alphabet) for i in range(n)])
+        def mismatches(seq,barcode):
+            return sum([1 for x,y in zip(seq,barcode) if x != y])
+        i7s = [random_seq(6) for i in range(4)]
+        barcodes = [(rng.choice(i7s),random_seq(6)) for i in range(12)]
+        for max_mismatches in (0,1,2):
+            index = BarcodeIndex(max_mismatches=max_mismatches)
+            for barcode in barcodes:
+                index.add(barcode)
+            for i in range(2000):
+                i7,i5 = rng.choice(barcodes)
+                i7 = ''.join([rng.choice("ACGTN") if rng.random() < 0.2
+                              else c for c in i7])
+                i5 = ''.join([rng.choice("ACGTN") if rng.random() < 0.2
+                              else c for c in i5])
+                seq = "%s+%s" % (i7,i5)
+                expected = None
+                for barcode in barcodes:
+                    if mismatches(i7,barcode[0]) <= max_mismatches and \
+                       mismatches(i5,barcode[1]) <= max_mismatches:
+                        expected = '+'.join(barcode)
+                        break
+                self.assertEqual(index.lookup(seq),expected,seq)
+
+    def test_barcode_index_dual_index_collisions(self):
+        """BarcodeIndex: detect collisions between dual-index barcodes
+        """
+        index = BarcodeIndex(max_mismatches=1)
+        index.add(("ACCTAG","TTAGGC"),"PB1")
+        index.add(("ACCTAG","TTAGGA"),"PB2")
+        index.add(("GTTCAA","TTAGGA"),"PB3")
+        self.assertEqual(len(index.collisions),1)
+        barcode,other_barcode,seqs = index.collisions[0]
+        self.assertEqual((barcode,other_barcode),
+                         ("ACCTAG+TTAGGC","ACCTAG+TTAGGA"))
+        self.assertEqual(len(seqs),25*5)
+        self.assertTrue("ACCTAC+TTAGGN" in seqs)
+        self.assertEqual(index.lookup("ACCTAC+TTAGGN"),"PB1")
+        self.assertEqual(index.lookup("ACCTAC+TTAGTA"),"PB2")
+        self.assertEqual(index.lookup("GTTCAT+TTAGGA"),"PB3")
+
+    def test_barcode_index_different_lengths(self):
+        """BarcodeIndex: handle barcodes with different lengths
+        """
+        index = BarcodeIndex(("ACCTAGGT","GTTCAA"),max_mismatches=1)
+        self.assertEqual(index.lookup("ACCTAGGA"),"ACCTAGGT")
+        self.assertEqual(index.lookup("GTTCAAGA"),"GTTCAA")
+        self.assertEqual(index.lookup("ACCTAG"),None)
+
+    def test_barcode_index_collisions(self):
+        """BarcodeIndex: detect and resolve collisions between barcodes
+        """
+        index = BarcodeIndex(max_mismatches=1)
+        index.add("ACCTAG","PB1")
+        index.add("ACCTTG","PB2")
+        index.add("GTTCAA","PB3")
+        self.assertEqual(index.collisions,
+                         [("ACCTAG","ACCTTG",
+                           ["ACCTAG","ACCTCG","ACCTGG","ACCTNG",
+                            "ACCTTG"])])
+        # First barcode added takes priority
+        self.assertEqual(index.lookup("ACCTTG"),"PB1")
+        self.assertEqual(index.lookup("ACCTCG"),"PB1")
+        self.assertEqual(index.lookup("ACCTTC"),"PB2")
@@ -11,6 +11,9 @@ import pickle
 from . import mock_data
 from .mock_data import ExampleDirSpiders
 from bcftbx.utils import *
+from bcftbx.BGZF import is_bgzf_file
+from bcftbx.BGZF import BgzfWriter
+from bcftbx.BGZF import BGZF_EOF
 
 class TestAttributeDictionary(unittest.TestCase):
     """Tests for the AttributeDictionary class
@@ -164,6 +167,39 @@ AAF#FJJJJJJJJJJJ
         lines = getlines(example_file)
         for l1,l2 in zip(self.example_text.split('\n'),lines):
             self.assertEqual(l1,l2)
+    def test_getlines_binary(self):
+        """getlines: read lines as bytes
+        """
+        for name in ("example.txt","example.txt.gz"):
+            example_file = os.path.join(self.wd,name)
+            if name.endswith('.gz'):
+                fp = gzip.open(example_file,'wt')
+            else:
+                fp = io.open(example_file,'wt')
+            with fp:
+                fp.write(self.example_text)
+            self.assertEqual(list(getlines(example_file,binary=True)),
+                             self.example_text.encode().split(b'\n')[:-1])
+    def test_getlines_blank_lines_and_no_final_newline(self):
+        """getlines: handle blank lines and missing final newline
+        """
+        text = u"line 1\n\nline 3\n" + u"x"*250000 + u"\n\n\u00e9\nlast"
+        for name in ("example.txt","example.txt.gz"):
+            example_file = os.path.join(self.wd,name)
+            if name.endswith('.gz'):
+                fp = gzip.open(example_file,'wb')
+            else:
+                fp = io.open(example_file,'wb')
+            with fp:
+                fp.write(text.encode('utf-8'))
+            self.assertEqual(list(getlines(example_file)),text.split('\n'))
+    def test_getlines_empty_file(self):
+        """getlines: handle empty file
+        """
+        example_file = os.path.join(self.wd,"example.txt")
+        io.open(example_file,'wt').close()
+        self.assertEqual(list(getlines(example_file)),[])
+        self.assertEqual(list(getlines(example_file,binary=True)),[])
 
 class TestPathInfo(unittest.TestCase):
     """Unit tests for the PathInfo utility class
@@ -424,6 +460,48 @@ class TestPathInfo(unittest.TestCase):
         self.assertEqual(path.gid,new_gid,"Failed to reset group to %s (%s)" %
                          (new_gid,get_group_from_gid(new_gid)))
 
+    def test_refresh(self):
+        """PathInfo.refresh updates the cached information
+
+        """
+        path = PathInfo(self.example_dir.path("new_file.txt"))
+        self.assertFalse(path.exists)
+        self.example_dir.add_file("new_file.txt")
+        self.assertFalse(path.exists)
+        path.refresh()
+        self.assertTrue(path.exists)
+        self.assertTrue(path.is_file)
+        os.chmod(path.path,0o640)
+        self.assertTrue(path.is_group_readable)
+        os.chmod(path.path,0o600)
+        self.assertTrue(path.is_group_readable)
+        path.refresh()
+        self.assertFalse(path.is_group_readable)
+
+    def test_scan(self):
+        """PathInfo.scan returns PathInfo objects for directory contents
+
+        """
+        d = self.example_dir
+        paths = [p for p in PathInfo.scan(d.dirn)]
+        self.assertEqual(sorted([p.path for p in paths]),
+                         sorted([os.path.join(d.dirn,f)
+                                 for f in os.listdir(d.dirn)]))
+        paths = [p for p in PathInfo.scan(d.dirn,recursive=True)]
+        self.assertEqual(sorted([p.path for p in paths]),
+                         sorted(d.filelist(include_links=True,
+                                           include_dirs=True)))
+        for p in paths:
+            self.assertTrue(isinstance(p,PathInfo))
+            expected = PathInfo(p.path)
+            for attr in ("exists","is_link","is_file","is_dir",
+                         "is_readable","is_group_readable",
+                         "is_group_writable","is_executable",
+                         "uid","gid","user","group","mtime"):
+                self.assertEqual(getattr(p,attr),getattr(expected,attr),
+                                 "%s: '%s' differs" % (p.path,attr))
+
+
 class TestUserAndGroupNameFunctions(unittest.TestCase):
     """Tests for the functions fetching user and group names and IDs
 
@@ -477,6 +555,116 @@ class TestUserAndGroupNameFunctions(unittest.TestCase):
         self.assertEqual(get_group_from_gid('root'),None)
         self.assertEqual(get_gid_from_group('0'),None)
 
+class TestPathEntry(unittest.TestCase):
+    """Tests for the PathEntry class
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLinks()
+        self.example_dir.create_directory()
+        self.wd = self.example_dir.dirn
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+
+    def test_path_entry(self):
+        """PathEntry: reports file types and caches stat results
+        """
+        for name in ("spider.txt","web","itsy-bitsy.txt","web2",
+                     "broken.txt"):
+            path = self.example_dir.path(name)
+            entry = PathEntry(path)
+            self.assertEqual(entry.path,path)
+            self.assertEqual(entry.name,name)
+            self.assertEqual(entry.is_symlink(),os.path.islink(path))
+            self.assertEqual(entry.is_dir(),os.path.isdir(path))
+            self.assertEqual(entry.is_file(),os.path.isfile(path))
+            self.assertEqual(entry.is_dir(follow_symlinks=False),
+                             os.path.isdir(path) and
+                             not os.path.islink(path))
+            self.assertEqual(entry.inode(),os.lstat(path).st_ino)
+            self.assertTrue(entry.stat(follow_symlinks=False) is
+                            entry.stat(follow_symlinks=False))
+        self.assertRaises(OSError,PathEntry(self.example_dir.path(
+            "broken.txt")).stat)
+
+class TestScandirWalkFunction(unittest.TestCase):
+    """Tests for the 'scandir_walk' function
+
+    """
+    def setUp(self):
+        self.example_dir = ExampleDirLinks()
+        self.example_dir.create_directory()
+        self.wd = self.example_dir.dirn
+
+    def tearDown(self):
+        self.example_dir.delete_directory()
+
+    def _walk(self,**kws):
+        # Convert scandir_walk output to os.walk format
+        return [(d.path,[e.name for e in dirs],[e.name for e in files])
+                for d,dirs,files in scandir_walk(self.wd,**kws)]
+
+    def test_scandir_walk(self):
+        """scandir_walk: yields same directories as os.walk
+        """
+        expected = [d for d in os.walk(self.wd)]
+        self.assertEqual(self._walk(),expected)
+        self.assertEqual(self._walk(nthreads=4),expected)
+
+    def test_scandir_walk_follow_links(self):
+        """scandir_walk: follows links to directories
+        """
+        expected = [d for d in os.walk(self.wd,followlinks=True)]
+        self.assertEqual(self._walk(followlinks=True),expected)
+        self.assertEqual(self._walk(followlinks=True,nthreads=2),
+                         expected)
+
+    def test_scandir_walk_entries(self):
+        """scandir_walk: yields entries for directories and files
+        """
+        for d,dirs,files in scandir_walk(self.wd):
+            self.assertEqual(d.is_symlink(),os.path.islink(d.path))
+            for e in dirs:
+                self.assertTrue(os.path.isdir(e.path))
+                self.assertEqual(e.path,os.path.join(d.path,e.name))
+            for e in files:
+                self.assertFalse(os.path.isdir(e.path))
+                self.assertEqual(e.is_symlink(),os.path.islink(e.path))
+
+    def test_scandir_walk_prune_directories(self):
+        """scandir_walk: removing entries from 'dirs' prunes the walk
+        """
+        for nthreads in (1,4):
+            visited = []
+            for d,dirs,files in scandir_walk(self.wd,nthreads=nthreads):
+                visited.append(d.path)
+                dirs[:] = [e for e in dirs if e.name != "web"]
+            self.assertEqual(visited,[self.wd])
+
+    def test_scandir_walk_no_scandir(self):
+        """scandir_walk: works without 'os.scandir' (i.e. Python 2)
+        """
+        expected = [d for d in os.walk(self.wd)]
+        expected_links = [d for d in os.walk(self.wd,followlinks=True)]
+        scandir = getattr(os,'scandir',None)
+        if scandir is not None:
+            del os.scandir
+        try:
+            self.assertEqual(self._walk(),expected)
+            self.assertEqual(self._walk(followlinks=True,nthreads=2),
+                             expected_links)
+        finally:
+            if scandir is not None:
+                os.scandir = scandir
+
+    def test_scandir_walk_missing_directory(self):
+        """scandir_walk: skips directories which can't be read
+        """
+        self.assertEqual(list(scandir_walk(os.path.join(self.wd,
+                                                        "missing"))),
+                         [])
+
 class TestWalkFunction(unittest.TestCase):
     """Unit tests for the 'walk' function
 
@@ -1067,6 +1255,132 @@ NATAAATCACCTCACTTAAGTGGCTGGAGACAAATA
         merged_fastq_data = gzip.open(self.merged_fastq,'rt').read()
         self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
 
+    def test_concatenate_fastq_files_bgzf(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False,
+                                bgzf=True)
+        self.assertTrue(is_bgzf_file(self.merged_fastq))
+        merged_fastq_data = gzip.open(self.merged_fastq,'rt').read()
+        self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
+
+    def test_concatenate_fastq_files_gzipped_copies_members(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False)
+        # Output should be the gzipped inputs appended together
+        with io.open(self.merged_fastq,'rb') as fp:
+            merged_fastq_data = fp.read()
+        self.assertEqual(merged_fastq_data,
+                         io.open(self.fastq1,'rb').read()+
+                         io.open(self.fastq2,'rb').read())
+
+    def test_concatenate_fastq_files_gzipped_to_uncompressed(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2],
+                                overwrite=True,
+                                verbose=False)
+        with io.open(self.merged_fastq,'rt') as fp:
+            merged_fastq_data = fp.read()
+        self.assertEqual(merged_fastq_data,self.fastq_data1+self.fastq_data2)
+
+    def test_concatenate_fastq_files_mixed_to_gzipped(self):
+        self.fastq1 = "concat.unittest.1.fastq"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        for nthreads in (1,2):
+            concatenate_fastq_files(self.merged_fastq,
+                                    [self.fastq1,self.fastq2,self.fastq1],
+                                    overwrite=True,
+                                    verbose=False,
+                                    nthreads=nthreads)
+            merged_fastq_data = gzip.open(self.merged_fastq,'rt').read()
+            self.assertEqual(merged_fastq_data,
+                             self.fastq_data1+self.fastq_data2+
+                             self.fastq_data1)
+
+    def test_concatenate_fastq_files_bgzf_copies_bgzf_input(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq"
+        with BgzfWriter(self.fastq1) as fp:
+            fp.write(self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        concatenate_fastq_files(self.merged_fastq,
+                                [self.fastq1,self.fastq2,self.fastq1],
+                                overwrite=True,
+                                verbose=False,
+                                bgzf=True)
+        self.assertTrue(is_bgzf_file(self.merged_fastq))
+        with io.open(self.merged_fastq,'rb') as fp:
+            data = fp.read()
+        bgzf_data1 = io.open(self.fastq1,'rb').read()[:-len(BGZF_EOF)]
+        self.assertTrue(data.startswith(bgzf_data1))
+        self.assertTrue(data.endswith(bgzf_data1+BGZF_EOF))
+        self.assertEqual(data.count(BGZF_EOF),1)
+        merged_fastq_data = gzip.open(self.merged_fastq,'rt').read()
+        self.assertEqual(merged_fastq_data,
+                         self.fastq_data1+self.fastq_data2+
+                         self.fastq_data1)
+
+    def test_concatenate_fastq_files_no_trailing_newline(self):
+        # Inputs are concatenated verbatim whatever the output format
+        self.fastq1 = "concat.unittest.1.fastq"
+        self.fastq2 = "concat.unittest.2.fastq"
+        self.make_fastq_file(self.fastq1,self.fastq_data1.rstrip('\n'))
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        expected = self.fastq_data1.rstrip('\n')+self.fastq_data2
+        for merged_fastq,bgzf in (("concat.unittest.merged.fastq",False),
+                                  ("concat.unittest.merged.fastq.gz",False),
+                                  ("concat.unittest.merged.fastq.gz",True)):
+            self.merged_fastq = merged_fastq
+            concatenate_fastq_files(self.merged_fastq,
+                                    [self.fastq1,self.fastq2],
+                                    overwrite=True,
+                                    verbose=False,
+                                    bgzf=bgzf)
+            if merged_fastq.endswith('.gz'):
+                merged_fastq_data = gzip.open(self.merged_fastq,'rt').read()
+            else:
+                with io.open(self.merged_fastq,'rt') as fp:
+                    merged_fastq_data = fp.read()
+                os.remove(self.merged_fastq)
+            self.assertEqual(merged_fastq_data,expected)
+
+    def test_concatenate_fastq_files_missing_input(self):
+        self.fastq1 = "concat.unittest.1.fastq.gz"
+        self.fastq2 = "concat.unittest.2.fastq.gz"
+        self.make_fastq_file(self.fastq1,self.fastq_data1)
+        self.make_fastq_file(self.fastq2,self.fastq_data2)
+        self.merged_fastq = "concat.unittest.merged.fastq.gz"
+        self.assertRaises(OSError,
+                          concatenate_fastq_files,
+                          self.merged_fastq,
+                          [self.fastq1,"concat.unittest.missing.fastq.gz"],
+                          verbose=False)
+        self.assertFalse(os.path.exists(self.merged_fastq))
+        self.assertFalse(os.path.exists(self.merged_fastq+'.part'))
+        self.make_fastq_file(self.merged_fastq,u"")
+
 class TestFindProgram(unittest.TestCase):
     """Unit tests for find_program function
 
@@ -41,6 +41,8 @@ File system wrappers and utilities:
   get_group_from_gid
   get_gid_from_group
   get_hostname
+  PathEntry
+  scandir_walk
   walk
   list_dirs
   strip_ext
@@ -82,7 +84,6 @@ import os
 import io
 import logging
 import string
-import gzip
 import shutil
 import copy
 import stat
@@ -91,7 +92,9 @@ import grp
 import datetime
 import re
 import socket
+import mmap
 from builtins import range
+from multiprocessing.pool import ThreadPool
 
 #######################################################################
 # Module constants
@@ -208,7 +211,7 @@ class OrderedDictionary(object):
 # File reading utilities
 #######################################################################
 
-def getlines(filen):
+def getlines(filen,binary=False):
     """
     Fetch lines from a file and return them one by one
 
@@ -226,48 +229,108 @@ def getlines(filen):
     >>> for line in getlines(filen):
     >>> ...
 
+    Uncompressed files are memory-mapped, and the lines are
+    split from blocks of the mapped data (so the data isn't
+    first copied into a read buffer and then appended to any
+    partial line left over from the previous block). By
+    default each block is decoded as a whole before being
+    split into lines; if 'binary' is True then the lines are
+    returned as undecoded bytes, which avoids the decoding
+    altogether for callers which don't need text.
+
     The file can be gzipped; this function should handle
     this invisibly provided that the file extension is
-    '.gz'.
+    '.gz' (in which case decompression is performed in a
+    background thread, see 'FASTQFile.open_gzip_threaded').
 
     Arguments:
       filen (str): path of the file to read lines from
+      binary (bool): if True then return lines as bytes
+        (default is to return lines as strings)
 
     Yields:
       String: next line of text from the file, with any
         newline character removed.
     """
     if filen.split('.')[-1] == 'gz':
-        open_ = gzip.open
+        from .FASTQFile import open_gzip_threaded
+        blocks = _iter_line_blocks(open_gzip_threaded(filen,'rb'))
     else:
-        open_ = io.open
-    # Read in data in chunks
-    buf = ''
-    lines = []
-    with open_(filen,'rb') as fp:
+        blocks = _iter_mapped_line_blocks(filen)
+    if binary:
+        newline = b'\n'
+    else:
+        newline = '\n'
+    for block in blocks:
+        if not binary:
+            block = block.decode("UTF-8")
+        lines = block.split(newline)
+        if not lines[-1]:
+            # Drop the empty string after the final newline
+            lines.pop()
+        for line in lines:
+            yield line
+
+def _iter_mapped_line_blocks(filen,blocksize=CHUNKSIZE):
+    """
+    Internal: yield blocks of whole lines from a memory-mapped file
+
+    Each block is a bytes object ending with a newline (except
+    possibly the last block, if the file doesn't end with a
+    newline). Files which can't be memory-mapped (e.g. empty
+    files) are read using '_iter_line_blocks' instead.
+
+    Arguments:
+      filen (str): path of the file to read
+      blocksize (int): approximate size of each block
+    """
+    with io.open(filen,'rb') as fp:
+        try:
+            mm = mmap.mmap(fp.fileno(),0,access=mmap.ACCESS_READ)
+        except (ValueError,EnvironmentError):
+            for block in _iter_line_blocks(fp,blocksize):
+                yield block
+            return
+        try:
+            size = len(mm)
+            pos = 0
+            while pos < size:
+                end = mm.rfind(b'\n',pos,pos+blocksize) + 1
+                if end <= pos:
+                    # No newline in the block, so extend it to
+                    # the end of the line (or of the file)
+                    end = mm.find(b'\n',pos+blocksize) + 1 or size
+                yield mm[pos:end]
+                pos = end
+        finally:
+            mm.close()
+
+def _iter_line_blocks(fp,blocksize=CHUNKSIZE):
+    """
+    Internal: yield blocks of whole lines from a file-like object
+
+    Each block is a bytes object ending with a newline (except
+    possibly the last block, if the data don't end with a
+    newline).
+
+    Arguments:
+      fp (File): file-like object opened for reading bytes
+      blocksize (int): size of the data to read at a time
+    """
+    tail = b''
+    with fp:
         while True:
-            # Grab a chunk of data
-            data = fp.read(CHUNKSIZE).decode("UTF-8")
-            # Check for EOF
+            data = fp.read(blocksize)
             if not data:
-                break
-            # Add to buffer and split into lines
-            buf = buf + data
-            if buf[0] == '\n':
-                buf = buf[1:]
-            if buf[-1] != '\n':
-                i = buf.rfind('\n')
-                if i == -1:
-                    continue
-                else:
-                    lines = buf[:i].split('\n')
-                    buf = buf[i+1:]
-            else:
-                lines = buf[:-1].split('\n')
-                buf = ''
-            # Return the lines one at a time
-            for line in lines:
-                yield line
+                if tail:
+                    yield tail
+                return
+            if tail:
+                data = tail + data
+            end = data.rfind(b'\n') + 1
+            tail = data[end:]
+            if end:
+                yield data[:end]
 
 #######################################################################
 # File system wrappers and utilities
@@ -285,7 +348,25 @@ class PathInfo(object):
     readable by members of the same group, who is the owner and
     what group does it belong to, when was it last modified etc.
 
+    The properties are derived from a single 'os.lstat' of the
+    path, which is made when the object is created and is then
+    cached; use the 'refresh' method to update the information
+    if the path may have changed since. User and group names
+    are looked up once per UID/GID and cached for all PathInfo
+    instances.
+
+    Use the 'scan' method to create PathInfo objects for the
+    contents of a directory, e.g.
+
+    >>> for p in PathInfo.scan('/data/run',recursive=True):
+    ...     if not p.is_group_readable:
+    ...         print(p)
+
     """
+    # Cached user and group names (shared by all instances)
+    _user_names = {}
+    _group_names = {}
+
     def __init__(self,path,basedir=None):
         """Create a new PathInfo object
 
@@ -301,6 +382,47 @@ class PathInfo(object):
             self.__path = os.path.join(self.__basedir,path)
         else:
             self.__path = path
+        self.refresh()
+
+    @classmethod
+    def scan(cls,dirn,recursive=False,nthreads=1):
+        """Create PathInfo objects for the contents of a directory
+
+        Generator which yields a PathInfo object for each
+        entry in 'dirn' (and, if 'recursive' is True, for each
+        entry in its subdirectories; see 'scandir_walk'). The
+        objects are populated from the stat information held
+        by the 'os.DirEntry' objects returned by the directory
+        scan, rather than by examining each path separately.
+
+        Note that the top-level directory itself is not
+        included.
+
+        Arguments:
+          dirn: path of the directory to scan
+          recursive: if True then also scan subdirectories
+            (links to directories are not followed)
+          nthreads: number of threads to use for listing
+            directories when scanning recursively (default: 1)
+
+        """
+        for dir_entry,dirs,files in scandir_walk(dirn,nthreads=nthreads):
+            for entry in dirs + files:
+                info = cls.__new__(cls)
+                info.__basedir = None
+                info.__path = entry.path
+                try:
+                    info.__st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    info.__st = None
+                yield info
+            if not recursive:
+                return
+
+    def refresh(self):
+        """Update the cached stat information for the path
+
+        """
         try:
             self.__st = os.lstat(self.__path)
         except OSError:
@@ -436,7 +558,12 @@ class PathInfo(object):
         """
         if self.__st is None:
             return None
-        user = get_user_from_uid(self.uid)
+        uid = self.uid
+        try:
+            user = self._user_names[uid]
+        except KeyError:
+            user = get_user_from_uid(uid)
+            self._user_names[uid] = user
         if user is not None:
             return user
         else:
@@ -470,7 +597,12 @@ class PathInfo(object):
         """
         if self.__st is None:
             return None
-        group = get_group_from_gid(self.gid)
+        gid = self.gid
+        try:
+            group = self._group_names[gid]
+        except KeyError:
+            group = get_group_from_gid(gid)
+            self._group_names[gid] = group
         if group is not None:
             return group
         else:
@@ -480,38 +612,38 @@ class PathInfo(object):
     def exists(self):
         """Return True if the path refers to an existing location
 
-        Note that this is a wrapper to os.path.lexists so it reports
-        the existence of symbolic links rather than their targets.
+        Note that (as with os.path.lexists) this reports the
+        existence of symbolic links rather than their targets.
 
         """
-        return os.path.lexists(self.__path)
+        return self.__st is not None
 
     @property
     def is_link(self):
         """Return True if path refers to a symbolic link
 
         """
-        return os.path.islink(self.__path)
+        if self.__st is None:
+            return False
+        return stat.S_ISLNK(self.__st.st_mode)
 
     @property
     def is_file(self):
         """Return True if path refers to a file
 
         """
-        if not self.is_link:
-            return os.path.isfile(self.__path)
-        else:
+        if self.__st is None:
             return False
+        return stat.S_ISREG(self.__st.st_mode)
 
     @property
     def is_dir(self):
         """Return True if path refers to a directory
 
         """
-        if not self.is_link:
-            return os.path.isdir(self.__path)
-        else:
+        if self.__st is None:
             return False
+        return stat.S_ISDIR(self.__st.st_mode)
 
     @property
     def is_executable(self):
@@ -579,10 +711,7 @@ class PathInfo(object):
         # performing the operation is not root
         os.lchown(self.__path,user,group)
         # Update the stat information
-        try:
-            self.__st = os.lstat(self.__path)
-        except OSError:
-            self.__st = None
+        self.refresh()
 
     def __repr__(self):
         """Implements the built-in __repr__ function
@@ -863,11 +992,231 @@ def get_hostname():
     """
     return socket.getfqdn()
 
-def walk(dirn,include_dirs=True,pattern=None):
+class PathEntry(object):
+    """
+    Lightweight file system entry with cached stat results
+
+    Provides the same interface as the 'os.DirEntry' objects
+    returned by 'os.scandir' (i.e. the 'name' and 'path'
+    attributes, and the 'is_dir', 'is_file', 'is_symlink',
+    'stat' and 'inode' methods), for paths which weren't
+    obtained by scanning a directory (for example the
+    top-level directory passed to 'scandir_walk').
+
+    The results of 'os.lstat' and 'os.stat' are only
+    fetched when first needed, and are then cached for
+    subsequent calls.
+
+    Arguments:
+      path (str): path to the file system entry
+    """
+    __slots__ = ('name','path','_stat','_lstat')
+
+    def __init__(self,path):
+        self.path = path
+        self.name = os.path.basename(path.rstrip(os.sep)) or path
+        self._stat = None
+        self._lstat = None
+
+    def stat(self,follow_symlinks=True):
+        """
+        Return the (cached) stat result for the entry
+
+        Arguments:
+          follow_symlinks (bool): if False then return the
+            result of 'os.lstat' (default is to follow links,
+            as for 'os.stat')
+        """
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        if not follow_symlinks:
+            return self._lstat
+        if self._stat is None:
+            if stat.S_ISLNK(self._lstat.st_mode):
+                self._stat = os.stat(self.path)
+            else:
+                self._stat = self._lstat
+        return self._stat
+
+    def is_symlink(self):
+        """
+        Return True if the entry is a symbolic link
+        """
+        try:
+            return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+        except OSError:
+            return False
+
+    def is_dir(self,follow_symlinks=True):
+        """
+        Return True if the entry is (or points to) a directory
+        """
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self,follow_symlinks=True):
+        """
+        Return True if the entry is (or points to) a file
+        """
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def inode(self):
+        """
+        Return the inode number of the entry
+        """
+        return self.stat(follow_symlinks=False).st_ino
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return "<PathEntry '%s'>" % self.path
+
+def scandir_walk(dirn,followlinks=False,nthreads=1):
+    """
+    Traverse a directory structure using 'os.scandir'
+
+    This generator function works in a similar way to
+    'os.walk' (top-down), except that for each directory
+    it yields a tuple '(dir_entry,dirs,files)' where:
+
+    - 'dir_entry' is the entry for the directory itself
+      (a 'PathEntry' instance for the top-level directory,
+      otherwise the 'os.DirEntry' from the scan of its
+      parent)
+    - 'dirs' and 'files' are lists of 'os.DirEntry'
+      objects for the subdirectories and files (or of
+      'PathEntry' objects, if 'os.scandir' isn't available)
+
+    The entries carry the file types from the directory
+    scan, and cache the results of their 'stat' method, so
+    checks such as 'is_symlink' and 'is_dir' don't
+    usually require additional system calls for each
+    path.
+
+    As with 'os.walk': symbolic links to directories are
+    included in 'dirs' but are only descended into if
+    'followlinks' is True; directories which can't be read
+    are skipped; and removing entries from 'dirs' before
+    the next iteration prevents those subdirectories from
+    being traversed.
+
+    If 'nthreads' is greater than one then subdirectories
+    waiting to be visited (and their subdirectories) are
+    listed ahead of time in a pool of threads, which hides
+    some of the latency of metadata operations on networked
+    file systems. The number of listings held in advance
+    is limited, and the directories are still yielded in
+    the same order.
+
+    Arguments:
+      dirn (str): top-level directory to start traversal
+        from
+      followlinks (bool): if True then also traverse
+        directories pointed to by symbolic links (default
+        is not to follow links)
+      nthreads (int): number of threads to use for
+        listing directories (default: 1)
+
+    Yields:
+      Tuple: (dir_entry,dirs,files) for each directory.
+    """
+    if nthreads > 1:
+        pool = ThreadPool(nthreads)
+        prefetch = 4*nthreads
+    else:
+        pool = None
+    # Stack of [entry,pending_listing] pairs
+    stack = [[PathEntry(dirn),None]]
+    # Listings started for subdirectories of directories
+    # which haven't been yielded yet
+    pending = {}
+    try:
+        while stack:
+            dir_entry,listing = stack.pop()
+            if listing is None:
+                listing = _scan_dir(dir_entry.path)
+            else:
+                listing = listing.get()
+            if listing is None:
+                continue
+            dirs,files = listing
+            all_dirs = list(dirs)
+            yield (dir_entry,dirs,files)
+            for d in reversed(dirs):
+                if followlinks or not d.is_symlink():
+                    stack.append([d,pending.pop(d.path,None)])
+            if pool is None:
+                continue
+            for d in all_dirs:
+                # Discard listings for pruned directories
+                pending.pop(d.path,None)
+            # Start listing the next directories, and the
+            # subdirectories of those already listed
+            for item in stack[-prefetch:]:
+                if item[1] is None:
+                    item[1] = pool.apply_async(_scan_dir,
+                                               (item[0].path,))
+                elif len(pending) < prefetch and item[1].ready():
+                    listing = item[1].get()
+                    if listing is None:
+                        continue
+                    for d in listing[0]:
+                        if len(pending) >= prefetch:
+                            break
+                        if d.path not in pending and \
+                           (followlinks or not d.is_symlink()):
+                            pending[d.path] = pool.apply_async(
+                                _scan_dir,(d.path,))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def _scan_dir(dirn):
+    """
+    Internal: list the subdirectories and files in a directory
+
+    Returns a tuple '(dirs,files)' of lists of 'os.DirEntry'
+    objects, or None if the directory couldn't be read.
+
+    If 'os.scandir' isn't available (i.e. Python 2) then the
+    directory is listed using 'os.listdir' instead, and the
+    lists contain 'PathEntry' objects.
+
+    Arguments:
+      dirn (str): path of the directory to list
+    """
+    dirs = []
+    files = []
+    try:
+        if hasattr(os,'scandir'):
+            entries = os.scandir(dirn)
+        else:
+            entries = [PathEntry(os.path.join(dirn,name))
+                       for name in os.listdir(dirn)]
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry)
+            else:
+                files.append(entry)
+    except OSError:
+        return None
+    return (dirs,files)
+
+def walk(dirn,include_dirs=True,pattern=None,nthreads=1):
     """Traverse the directory, subdirectories and files
 
     Essentially this 'walk' function is a convenience wrapper
-    for the 'os.walk' function.
+    for the 'scandir_walk' function.
 
     Arguments:
       dirn: top-level directory to start traversal from
@@ -877,6 +1226,8 @@ def walk(dirn,include_dirs=True,pattern=None):
         pattern which restricts the set of yielded files and
         directories to a subset of those which match the
         pattern
+      nthreads: number of threads to use for listing
+        directories (default: 1)
         
     """
     if pattern is not None:
@@ -884,16 +1235,14 @@ def walk(dirn,include_dirs=True,pattern=None):
     if include_dirs:
         if pattern is None or matcher.match(dirn):
             yield dirn
-    for dirpath,dirnames,filenames in os.walk(dirn):
+    for dir_entry,dirs,files in scandir_walk(dirn,nthreads=nthreads):
         if include_dirs:
-            for d in dirnames:
-                d1 = os.path.join(dirpath,d)
-                if pattern is None or matcher.match(d1):
-                    yield d1
-        for f in filenames:
-            f1 = os.path.join(dirpath,f)
-            if pattern is None or matcher.match(f1):
-                yield f1
+            for d in dirs:
+                if pattern is None or matcher.match(d.path):
+                    yield d.path
+        for f in files:
+            if pattern is None or matcher.match(f.path):
+                yield f.path
 
 def list_dirs(parent,matches=None,startswith=None):
     """Return list of subdirectories relative to 'parent'
@@ -1059,7 +1408,7 @@ class Symlink(object):
         """
         return self._path
 
-def links(dirn):
+def links(dirn,nthreads=1):
     """Traverse and return all symbolic links in under a directory
 
     Given a starting directory, traverses the structure underneath
@@ -1067,22 +1416,22 @@ def links(dirn):
 
     Arguments:
       dirn: name of the top-level directory
+      nthreads: number of threads to use for listing directories
+        (default: 1)
 
     Returns:
       Yields the name and full path for each symbolic link under 'dirn'.
 
     """
-    for d in os.walk(dirn):
-        if os.path.islink(d[0]):
-            yield d[0]
-        for sd in d[1]:
-            path = os.path.join(d[0],sd)
-            if os.path.islink(path):
-                yield path
-        for f in d[2]:
-            path = os.path.join(d[0],f)
-            if os.path.islink(path):
-                yield path
+    for dir_entry,dirs,files in scandir_walk(dirn,nthreads=nthreads):
+        if dir_entry.is_symlink():
+            yield dir_entry.path
+        for d in dirs:
+            if d.is_symlink():
+                yield d.path
+        for f in files:
+            if f.is_symlink():
+                yield f.path
 
 #######################################################################
 # Sample/library name utilities
@@ -1251,74 +1600,167 @@ def name_matches(name,pattern):
 #######################################################################
 
 def concatenate_fastq_files(merged_fastq,fastq_files,bufsize=10240,
-                            overwrite=False,verbose=True):
+                            overwrite=False,verbose=True,bgzf=False,
+                            nthreads=1):
     """Create a single FASTQ file by concatenating one or more FASTQs
 
     Given a list or tuple of FASTQ files (which can be compressed or
     uncompressed or a combination), creates a single output FASTQ by
     concatenating the contents.
 
+    Inputs which are already in the same format as the output are
+    copied byte-for-byte without being decompressed (a gzip file
+    can consist of multiple concatenated gzip 'members', so the
+    gzipped inputs can simply be appended to a gzipped output),
+    using 'os.copy_file_range' or 'os.sendfile' where available so
+    that the data doesn't need to pass through Python. Only inputs
+    in a different format are decompressed and/or compressed.
+
     Arguments:
       merged_fastq: name of output FASTQ file (mustn't exist beforehand)
       fastq_files:  list of FASTQ files to concatenate
       bufsize: (optional) size of buffer to use for copying data
+        from gzipped inputs to uncompressed output
       overwrite: (optional) if True then overwrite the output file if it
         already exists (otherwise raise OSError); default is False
       verbose: (optional) if True then report operations to stdout,
         otherwise operate quietly
+      bgzf: (optional) if True then write the output in BGZF
+        format (which is also valid gzip); default is False. Only
+        inputs which are already in BGZF format are copied
+        without recompressing
+      nthreads: (optional) number of threads to use for
+        compressing inputs which aren't already compressed in
+        the output format (default: 1)
 
     """
+    from . import BGZF
+    from .FASTQFile import FastqWriter
+    from .FASTQFile import WRITER_BUFSIZE as FASTQ_WRITER_BUFSIZE
+    from .FASTQFile import open_gzip_threaded
     if verbose: print("Creating merged fastq file '%s'" % merged_fastq)
     # Check that initial file doesn't exist
     if os.path.exists(merged_fastq) and not overwrite:
         raise OSError("Target file '%s' already exists, stopping" %
                       merged_fastq)
+    # Check that the inputs exist
+    for fastq in fastq_files:
+        if not os.path.exists(fastq):
+            raise OSError("'%s' not found, stopping" % fastq)
     # Create temporary name
     merged_fastq_part = merged_fastq+'.part'
+    # Output compression
+    compress = (bgzf or is_gzipped_file(merged_fastq))
     # Open for writing
-    if is_gzipped_file(merged_fastq):
-        if is_gzipped_file(fastq_files[0]):
-            # Copy first file in list directly and open for append
-            if verbose: print("Copying %s" % fastq_files[0])
-            shutil.copy(fastq_files[0],merged_fastq_part)
-            first_file = 1
-            fq_merged = gzip.GzipFile(merged_fastq_part,'ab')
-        else:
-            # Open for write
-            first_file = 0
-            fq_merged = gzip.GzipFile(merged_fastq_part,'wb')
-    else:
-        if not is_gzipped_file(fastq_files[0]):
-            if verbose: print("Copying %s" % fastq_files[0])
-            # Copy first file in list directly and open for append
-            shutil.copy(fastq_files[0],merged_fastq_part)
-            first_file = 1
-            fq_merged = io.open(merged_fastq_part,'ab')
-        else:
-            # Assume regular file
-            first_file = 1
-            fq_merged = io.open(merged_fastq_part,'wb')
-    # For each fastq, read data and append to output - simples!
-    for fastq in fastq_files[first_file:]:
-        if verbose: print("Adding records from %s" % fastq)
-        # Check it exists
-        if not os.path.exists(fastq):
-            raise OSError("'%s' not found, stopping" % fastq)
-        # Open file for reading
-        if not is_gzipped_file(fastq):
-            fq = io.open(fastq,'rb')
-        else:
-            fq = gzip.GzipFile(fastq,'rb')
-        # Read and append data
-        while True:
-            data = fq.read(10240)
-            if not data: break
-            fq_merged.write(data)
-        fq.close()
+    fp = io.open(merged_fastq_part,'wb')
+    writer = None
+    try:
+        if bgzf:
+            # Always need a writer for the BGZF EOF marker
+            writer = FastqWriter(fp=fp,compress=True,bgzf=True,
+                                 nthreads=nthreads)
+        for fastq in fastq_files:
+            if not compress:
+                # Uncompressed output
+                if not is_gzipped_file(fastq):
+                    if verbose: print("Copying %s" % fastq)
+                    _copy_file_data(fastq,fp)
+                else:
+                    if verbose: print("Decompressing %s" % fastq)
+                    with open_gzip_threaded(fastq,'rb') as fq:
+                        shutil.copyfileobj(fq,fp,length=bufsize)
+            elif is_gzipped_file(fastq) and \
+                 (not bgzf or BGZF.is_bgzf_file(fastq)):
+                # Compressed input in the same format as the
+                # output: copy the raw data
+                if verbose: print("Copying %s" % fastq)
+                if writer is not None:
+                    writer.flush()
+                size = os.path.getsize(fastq)
+                if bgzf:
+                    # Drop the EOF marker from the input
+                    with io.open(fastq,'rb') as fq:
+                        fq.seek(max(0,size-len(BGZF.BGZF_EOF)))
+                        if fq.read() == BGZF.BGZF_EOF:
+                            size -= len(BGZF.BGZF_EOF)
+                _copy_file_data(fastq,fp,size)
+            else:
+                # Recompress the data
+                if verbose: print("Compressing %s" % fastq)
+                if writer is None:
+                    writer = FastqWriter(fp=fp,compress=True,
+                                         nthreads=nthreads)
+                if is_gzipped_file(fastq):
+                    fq = open_gzip_threaded(fastq,'rb')
+                else:
+                    fq = io.open(fastq,'rb')
+                with fq:
+                    # Copy the data verbatim (i.e. no newline is
+                    # added if the input doesn't end with one)
+                    while True:
+                        data = fq.read(FASTQ_WRITER_BUFSIZE)
+                        if not data:
+                            break
+                        writer.write_data(data)
+                writer.flush()
+        if writer is not None:
+            writer.close()
+        elif compress and not fastq_files:
+            # Write an empty gzip member
+            FastqWriter(fp=fp,compress=True).close()
+    finally:
+        fp.close()
     # Finished, clean up
-    fq_merged.close()
     os.rename(merged_fastq_part,merged_fastq)
 
+def _copy_file_data(filen,fp,size=None):
+    """Internal: append data from a file to an open file
+
+    Uses 'os.copy_file_range' (or 'os.sendfile') if possible,
+    so that the data is copied by the kernel without passing
+    through Python; otherwise falls back to reading and
+    writing the data.
+
+    Arguments:
+      filen: path of the file to copy data from
+      fp: file object opened for writing in binary mode
+        (any buffered data is flushed first)
+      size: (optional) number of bytes to copy from the start
+        of the file (default is to copy the whole file)
+
+    """
+    if size is None:
+        size = os.path.getsize(filen)
+    fp.flush()
+    with io.open(filen,'rb') as fq:
+        fd_in = fq.fileno()
+        fd_out = fp.fileno()
+        for copy_data in (getattr(os,'copy_file_range',None),
+                          getattr(os,'sendfile',None)):
+            if copy_data is None:
+                continue
+            try:
+                while size > 0:
+                    if copy_data is os.sendfile:
+                        n = copy_data(fd_out,fd_in,None,min(size,2**30))
+                    else:
+                        n = copy_data(fd_in,fd_out,min(size,2**30))
+                    if n == 0:
+                        break
+                    size -= n
+                return
+            except OSError:
+                # Not supported for these files (e.g. copying
+                # between filesystems on older kernels), so try
+                # the next method from the current position
+                continue
+        while size > 0:
+            data = fq.read(min(size,CHUNKSIZE*10))
+            if not data:
+                break
+            fp.write(data)
+            size -= len(data)
+
 #######################################################################
 # Text manipulations
 #######################################################################
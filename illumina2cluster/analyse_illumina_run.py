@@ -9,7 +9,7 @@ Provides functionality for analysing data from an Illumina sequencer run.
 
 """
 
-__version__ = "0.2.2"
+__version__ = "0.2.4"
 
 #######################################################################
 # Import modules
@@ -30,6 +30,7 @@ sys.path.append(SHARE_DIR)
 import bcftbx.IlluminaData as IlluminaData
 import bcftbx.FASTQFile as FASTQFile
 import bcftbx.utils as bcf_utils
+from bcftbx.cmdparse import add_nprocessors_option
 
 #######################################################################
 # Main program
@@ -38,11 +39,12 @@ import bcftbx.utils as bcf_utils
 if __name__ == "__main__":
     # Create command line parser
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Utility for performing various checks and "
         "operations on Illumina data. 'illumina_data_dir' is the "
         "top-level directory containing the 'Unaligned' directory "
         "with the fastq.gz files.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
     p.add_argument("--report",action="store_true",dest="report",
                    help="report sample names and number of samples for "
                    "each project")
@@ -70,12 +72,16 @@ if __name__ == "__main__":
     p.add_argument("--stats",action="store_true",dest="stats",
                    help="Report statistics (read counts etc) for fastq "
                    "files")
+    add_nprocessors_option(p,1)
     p.add_argument('illumina_data_dir',
                    help="top-level directory containing the 'Unaligned' "
                    "directory with the fastq.gz files")
     # Parse command line
     args = p.parse_args()
 
+    # Number of processors for counting reads
+    nprocessors = int(args.nprocessors)
+
     # Get data directory name
     illumina_analysis_dir = os.path.abspath(args.illumina_data_dir)
 
@@ -130,14 +136,15 @@ if __name__ == "__main__":
             # Report statistics for fastq files
             if args.stats:
                 # Print number of reads for each file, and file size
-                for sample in project.samples:
-                    for fastq in sample.fastq:
-                        fq = os.path.join(sample.dirn,fastq)
-                        nreads = FASTQFile.nreads(fq)
-                        fsize = os.path.getsize(fq)
-                        print("%s\t%s\t%d" % (fastq,
-                                              bcf_utils.format_file_size(fsize),
-                                              nreads))
+                fastqs = [os.path.join(sample.dirn,fastq)
+                          for sample in project.samples
+                          for fastq in sample.fastq]
+                for count in FASTQFile.count_fastq_reads(fastqs,
+                                                         nprocs=nprocessors):
+                    fsize = os.path.getsize(count.fastq)
+                    print("%s\t%s\t%d" % (os.path.basename(count.fastq),
+                                          bcf_utils.format_file_size(fsize),
+                                          count.nreads))
             print("")
 
     # Summary: short report suitable for logging file
@@ -147,14 +154,15 @@ if __name__ == "__main__":
     # Print number of undetermined reads
     if args.stats and illumina_data.undetermined is not None:
         print("Undetermined indices")
-        for lane in illumina_data.undetermined.samples:
-            for fastq in lane.fastq:
-                fq = os.path.join(lane.dirn,fastq)
-                nreads = FASTQFile.nreads(fq)
-                fsize = os.path.getsize(fq)
-                print("%s\t%s\t%d" % (fastq,
-                                      bcf_utils.format_file_size(fsize),
-                                      nreads))
+        fastqs = [os.path.join(lane.dirn,fastq)
+                  for lane in illumina_data.undetermined.samples
+                  for fastq in lane.fastq]
+        for count in FASTQFile.count_fastq_reads(fastqs,
+                                                 nprocs=nprocessors):
+            fsize = os.path.getsize(count.fastq)
+            print("%s\t%s\t%d" % (os.path.basename(count.fastq),
+                                  bcf_utils.format_file_size(fsize),
+                                  count.nreads))
 
     # Copy fastq.gz files to the current directory
     if args.copy_pattern is not None:
@@ -209,7 +217,8 @@ if __name__ == "__main__":
                     bcf_utils.concatenate_fastq_files(fastq_merged,
                                                       sample.fastq_subset(read_number=read,
                                                                           full_path=True),
-                                                      bufsize=1024*1024)
+                                                      bufsize=1024*1024,
+                                                      nthreads=nprocessors)
 
 
                     
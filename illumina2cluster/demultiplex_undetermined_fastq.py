@@ -25,13 +25,15 @@ sequencing run.
 # Import modules that this module depends on
 #######################################################################
 
-__version__ = "0.1.2"
+__version__ = "0.2.0"
 
 from builtins import str
 import os
-import io
 import sys
+import io
+import shutil
 import argparse
+from multiprocessing import Pool
 
 # Put .. onto Python search path for modules
 SHARE_DIR = os.path.abspath(
@@ -40,6 +42,9 @@ SHARE_DIR = os.path.abspath(
 sys.path.append(SHARE_DIR)
 import bcftbx.IlluminaData as IlluminaData
 import bcftbx.FASTQFile as FASTQFile
+import bcftbx.BGZF as BGZF
+from bcftbx.ngsutils import BarcodeIndex
+from bcftbx.cmdparse import add_nprocessors_option
 
 #######################################################################
 # Class definitions
@@ -103,7 +108,8 @@ class BarcodeMatcher(object):
 # Module Functions
 #######################################################################
 
-def demultiplex_fastq(fastq_file,barcodes,nmismatches):
+def demultiplex_fastq(fastq_file,barcodes,nmismatches,compress=False,
+                      nprocs=1,nthreads=1):
     """Perform demultiplexing of a FASTQ file
 
     Demultiplex reads in a FASTQ file given information about a set of 
@@ -112,19 +118,37 @@ def demultiplex_fastq(fastq_file,barcodes,nmismatches):
     Produces a file for each barcode, plus another for 'unbinned'
     reads.
 
+    Index sequences are assigned to barcodes using a BarcodeIndex
+    (so each read only needs a single lookup); where an index
+    sequence matches more than one barcode, the read is assigned
+    to the barcode which appears first in the list.
+
+    If more than one process is requested then the FASTQ is split
+    into sections (see 'FASTQFile.chunks') which are demultiplexed
+    in parallel, and the outputs for each section are concatenated
+    in order. Compressed outputs are written in BGZF format, where
+    the data are always divided into the same blocks, so the
+    outputs are identical to those from a single process.
+
     Arguments:
       fastq_file: FASTQ file to be demultiplexed (can be gzipped)
       barcodes: list of barcode sequences to use for demultiplexing
       nmismatches: maxiumum number of mismatched bases allowed when
         testing whether barcode sequences match
+      compress: if True then write gzipped (BGZF) output files
+        (default is to write uncompressed files)
+      nprocs: number of processes to use (default: 1)
+      nthreads: number of threads to use for compressing each
+        output file (default: 1)
 
     Returns:
-      No return value
+      Dictionary mapping each barcode index sequence (plus
+        'unbinned') to the number of reads assigned to it.
     """
     # Start
     print("Processing %s" % fastq_file)
     info = IlluminaData.IlluminaFastq(fastq_file)
-    # Set up output files
+    # Set up output file names
     output_files = {}
     # Weed out barcodes that aren't associated with this lane
     local_barcodes = []
@@ -137,42 +161,241 @@ def demultiplex_fastq(fastq_file,barcodes,nmismatches):
                                                            info.lane_number,
                                                            info.read_number,
                                                            info.set_number)
+        if compress:
+            output_file_name += ".gz"
         print("\t%s\t%s" % (barcode['index'],output_file_name))
         if os.path.exists(output_file_name):
-            print("\t%s: already exists,exiting" % output_file_name)
-            sys.exit(1)
-        output_files[barcode['index']] = io.open(output_file_name,'wt')
+            raise Exception("%s: already exists" % output_file_name)
+        output_files[barcode['index']] = output_file_name
     # Check if there's anything to do
     if len(local_barcodes) == 0:
-        return
+        return {}
     # Also make a file for unbinned reads
     unbinned_file_name = "unbinned_L%03d_R%d_%03d.fastq" % (info.lane_number,
                                                             info.read_number,
                                                             info.set_number)
+    if compress:
+        unbinned_file_name += ".gz"
     if os.path.exists(unbinned_file_name):
-        print("\t%s: already exists,exiting" % unbinned_file_name)
-        sys.exit(1)
-    output_files['unbinned'] = io.open(unbinned_file_name,'wt')
+        raise Exception("%s: already exists" % unbinned_file_name)
+    output_files['unbinned'] = unbinned_file_name
     # Process reads
-    nreads = 0
-    for read in FASTQFile.FastqIterator(fastq_file):
-        nreads += 1
-        matched_read = False
-        this_barcode = read.seqid.index_sequence
-        for barcode in local_barcodes:
-            if barcode['matcher'].match(this_barcode,nmismatches):
-                ##print("Matched %s against %s" % (this_barcode,barcodes[barcode]['name']))
-                output_files[barcode['index']].write(str(read)+'\n')
-                matched_read = True
-                break
-        # Put in unbinned if no match
-        if not matched_read:
-            output_files['unbinned'].write(str(read)+'\n')
-        ##if nreads > 100: break
-    # Close files
-    for barcode in local_barcodes:
-        output_files[barcode['index']].close()
+    indexes = [barcode['index'] for barcode in local_barcodes]
+    fastq_chunks = FASTQFile.chunks(fastq_file,nprocs)
+    if len(fastq_chunks) == 1:
+        counts = demultiplex_chunk(fastq_chunks[0],indexes,nmismatches,
+                                   output_files,compress=compress,
+                                   nthreads=nthreads)
+    else:
+        # Demultiplex each section into temporary uncompressed
+        # files, then concatenate them in order
+        tasks = []
+        for i,chunk in enumerate(fastq_chunks):
+            part_files = dict([(index,"%s.%d.part" % (output_files[index],i))
+                               for index in output_files])
+            tasks.append((chunk,indexes,nmismatches,part_files))
+        pool = Pool(min(nprocs,len(tasks)))
+        try:
+            results = pool.map(_demultiplex_chunk_task,tasks)
+        finally:
+            pool.close()
+            pool.join()
+        counts = dict([(index,sum([r[index] for r in results]))
+                       for index in output_files])
+        for index in output_files:
+            if compress:
+                fp = BGZF.BgzfWriter(output_files[index],nthreads=nthreads)
+            else:
+                fp = io.open(output_files[index],'wb')
+            with fp:
+                for task in tasks:
+                    part_file = task[3][index]
+                    with io.open(part_file,'rb') as fpart:
+                        shutil.copyfileobj(fpart,fp,
+                                           length=FASTQFile.WRITER_BUFSIZE)
+                    os.remove(part_file)
+    nreads = sum(counts.values())
     print("\tMatched %d reads for %s" % (nreads,os.path.basename(fastq_file)))
+    return counts
+
+def demultiplex_chunk(chunk,indexes,nmismatches,output_files,
+                      compress=False,nthreads=1):
+    """Demultiplex the reads in a section of a FASTQ file
+
+    Arguments:
+      chunk: FASTQFile.FastqChunk for the section of the FASTQ
+      indexes: list of barcode index sequences (in order of
+        priority)
+      nmismatches: maxiumum number of mismatched bases allowed when
+        testing whether barcode sequences match
+      output_files: dictionary mapping each index sequence (plus
+        'unbinned') to the name of the file to write the matching
+        reads to
+      compress: if True then write gzipped (BGZF) output files
+        (default is to write uncompressed files)
+      nthreads: number of threads to use for compressing each
+        output file (default: 1)
+
+    Returns:
+      Dictionary mapping each barcode index sequence (plus
+        'unbinned') to the number of reads assigned to it.
+    """
+    # Build the lookup for the barcodes
+    index = BarcodeIndex(max_mismatches=nmismatches)
+    for barcode in indexes:
+        index.add(barcode)
+    lookup = index.lookup
+    # Open the outputs
+    outputs = {}
+    for barcode in output_files:
+        if compress:
+            outputs[barcode] = BGZF.BgzfWriter(output_files[barcode],
+                                               nthreads=nthreads)
+        else:
+            outputs[barcode] = FASTQFile.FastqWriter(output_files[barcode])
+    counts = dict([(barcode,0) for barcode in output_files])
+    # Process reads
+    for read in chunk.iter_reads():
+        barcode = lookup(read.seqid.index_sequence)
+        if barcode is None:
+            # Put in unbinned if no match
+            barcode = 'unbinned'
+        outputs[barcode].write("%s\n" % read)
+        counts[barcode] += 1
+    # Close files
+    for output in outputs.values():
+        output.close()
+    return counts
+
+def _demultiplex_chunk_task(args):
+    """Internal: run 'demultiplex_chunk' in a worker process
+
+    Arguments:
+      args: tuple with the arguments for 'demultiplex_chunk'
+    """
+    return demultiplex_chunk(*args)
+
+def _demultiplex_fastq_task(args):
+    """Internal: run 'demultiplex_fastq' in a worker process
+
+    Arguments:
+      args: tuple with the arguments for 'demultiplex_fastq'
+    """
+    return demultiplex_fastq(*args)
+
+def report_summary(results,barcodes,fp=sys.stdout):
+    """Write a summary table of reads assigned to each barcode
+
+    The table has one line for each barcode in each lane (plus
+    one for the unbinned reads in each lane), with the number of
+    reads assigned from each read (i.e. R1, R2 etc).
+
+    Arguments:
+      results: list of tuples (lane,read_number,counts), where
+        'counts' is the dictionary returned from
+        'demultiplex_fastq' for each FASTQ file
+      barcodes: list of barcodes used for demultiplexing
+      fp: file-like object to write the table to (default:
+        stdout)
+    """
+    read_numbers = sorted(set([r[1] for r in results]))
+    lanes = sorted(set([r[0] for r in results]))
+    totals = {}
+    for lane,read_number,counts in results:
+        for index in counts:
+            key = (lane,index,read_number)
+            totals[key] = totals.get(key,0) + counts[index]
+    fp.write("#Lane\tName\tIndex\t%s\n" %
+             '\t'.join(["R%s" % r for r in read_numbers]))
+    for lane in lanes:
+        rows = [(barcode['name'],barcode['index'])
+                for barcode in barcodes if barcode['lane'] == lane]
+        if not rows:
+            continue
+        rows.append(('unbinned',''))
+        for name,index in rows:
+            key = index if name != 'unbinned' else 'unbinned'
+            fp.write("%s\t%s\t%s\t%s\n" %
+                     (lane,name,index,
+                      '\t'.join([str(totals.get((lane,key,r),0))
+                                 for r in read_numbers])))
+
+#######################################################################
+# Tests
+#######################################################################
+
+import unittest
+import tempfile
+
+class TestDemultiplexFastq(unittest.TestCase):
+    def setUp(self):
+        # Temporary working dir (outputs are written to the
+        # current directory)
+        self.wd = tempfile.mkdtemp()
+        self.pwd = os.getcwd()
+        os.chdir(self.wd)
+        # Test FASTQ
+        self.fastq = os.path.join(self.wd,
+                                  "lane1_Undetermined_L001_R1_001.fastq")
+        with io.open(self.fastq,'wt') as fp:
+            for i,index in enumerate(("ACAGTG","GCCAAT","ACAGTC",
+                                      "TTTTTT","GCCNAT","ACTTGA")*50):
+                fp.write(u"@K00311:43:HL3LWBBXX:1:1101:%d:1121 1:N:0:%s\n"
+                         "GCCNGACAGCAGAAAT\n+\nAAF#FJJJJJJJJJJJ\n" %
+                         (i,index))
+        self.barcodes = [{ 'name': 'PB1', 'index': 'ACAGTG', 'lane': 1 },
+                         { 'name': 'PB2', 'index': 'GCCAAT', 'lane': 1 },
+                         { 'name': 'PB3', 'index': 'ACTTGA', 'lane': 2 }]
+
+    def tearDown(self):
+        os.chdir(self.pwd)
+        shutil.rmtree(self.wd)
+
+    def _read_outputs(self):
+        # Return the contents of the output files
+        outputs = {}
+        for f in os.listdir(self.wd):
+            if f != os.path.basename(self.fastq):
+                with io.open(os.path.join(self.wd,f),'rb') as fp:
+                    outputs[f] = fp.read()
+                os.remove(os.path.join(self.wd,f))
+        return outputs
+
+    def test_demultiplex_fastq(self):
+        counts = demultiplex_fastq(self.fastq,self.barcodes,1)
+        self.assertEqual(counts,{ 'ACAGTG': 100,
+                                  'GCCAAT': 100,
+                                  'unbinned': 100 })
+        outputs = self._read_outputs()
+        self.assertEqual(sorted(outputs.keys()),
+                         ["PB1_ACAGTG_L001_R1_001.fastq",
+                          "PB2_GCCAAT_L001_R1_001.fastq",
+                          "unbinned_L001_R1_001.fastq"])
+        self.assertEqual(outputs["PB1_ACAGTG_L001_R1_001.fastq"].count(
+            b"1:N:0:ACAGTC\n"),50)
+
+    def test_demultiplex_fastq_multiple_processes(self):
+        for compress in (False,True):
+            counts = demultiplex_fastq(self.fastq,self.barcodes,1,
+                                       compress=compress)
+            expected = self._read_outputs()
+            counts_parallel = demultiplex_fastq(self.fastq,self.barcodes,1,
+                                                compress=compress,nprocs=3)
+            self.assertEqual(counts_parallel,counts)
+            self.assertEqual(self._read_outputs(),expected)
+
+    def test_report_summary(self):
+        fp = io.StringIO()
+        report_summary([(1,1,{ 'ACAGTG': 100, 'GCCAAT': 80,
+                               'unbinned': 20 }),
+                        (1,2,{ 'ACAGTG': 100, 'GCCAAT': 80,
+                               'unbinned': 20 })],
+                       self.barcodes,fp=fp)
+        self.assertEqual(fp.getvalue(),
+                         u"#Lane\tName\tIndex\tR1\tR2\n"
+                         "1\tPB1\tACAGTG\t100\t100\n"
+                         "1\tPB2\tGCCAAT\t80\t80\n"
+                         "1\tunbinned\t\t20\t20\n")
 
 #######################################################################
 # Main program
@@ -182,7 +405,6 @@ if __name__ == "__main__":
 
     # Create command line parser
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Reassign reads with undetermined index sequences. "
         "(i.e. barcodes). DIR is the name (including any leading path) "
         "of the 'Undetermined_indices' directory produced by CASAVA, "
@@ -198,6 +420,19 @@ if __name__ == "__main__":
                    help="specify SampleSheet.csv file to read barcodes, "
                    "sample names and lane assignments from (as an alternative "
                    "to --barcode).")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument("-m","--mismatches",action="store",dest="mismatches",
+                   type=int,default=1,
+                   help="maximum number of mismatched bases allowed when "
+                   "matching index sequences to barcodes (default: 1)")
+    p.add_argument("-z","--gzip",action="store_true",dest="gzip",
+                   help="write gzipped (BGZF) output FASTQs")
+    p.add_argument("-t","--threads",action="store",dest="threads",
+                   type=int,default=1,
+                   help="number of threads to use for compressing each "
+                   "output FASTQ (default: 1; only used with --gzip)")
+    add_nprocessors_option(p,1)
     p.add_argument('undetermined_dir',metavar="DIR",
                    help="path to the 'Undetermined_indices' directory "
                    "produced by CASAVA")
@@ -237,10 +472,42 @@ if __name__ == "__main__":
     # Collect input files
     p = IlluminaData.IlluminaProject(undetermined_dir)
 
-    # Loop over "samples" and match barcodes
+    fastqs = []
     for s in p.samples:
         for fq in s.fastq:
-            fastq = os.path.join(s.dirn,fq)
-            demultiplex_fastq(fastq,barcodes,1)
+            fastqs.append(os.path.join(s.dirn,fq))
+
+    # Loop over "samples" and match barcodes
+    nprocs = int(args.nprocessors)
+    try:
+        if nprocs > 1 and len(fastqs) >= nprocs:
+            # Process multiple FASTQs in parallel
+            pool = Pool(nprocs)
+            try:
+                results = pool.map(_demultiplex_fastq_task,
+                                   [(fastq,barcodes,args.mismatches,
+                                     args.gzip,1,args.threads)
+                                    for fastq in fastqs])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            # Process FASTQs one at a time (splitting each
+            # between multiple processes, if requested)
+            results = [demultiplex_fastq(fastq,barcodes,args.mismatches,
+                                         compress=args.gzip,nprocs=nprocs,
+                                         nthreads=args.threads)
+                       for fastq in fastqs]
+    except Exception as ex:
+        print("%s, exiting" % ex)
+        sys.exit(1)
+
+    # Report the number of reads assigned to each barcode
+    print("Summary:")
+    report_summary([(IlluminaData.IlluminaFastq(fastq).lane_number,
+                     IlluminaData.IlluminaFastq(fastq).read_number,
+                     counts)
+                    for fastq,counts in zip(fastqs,results)],
+                   barcodes)
     print("Finished")
 
@@ -14,17 +14,39 @@
 Count and report the barcode/index sequences (AKA tags) in one or more
 Fastq file from an Illumina sequencer.
 
+The counts can be saved to a TSV or JSON file (using --save-counts)
+and reloaded later (using --load-counts), for example to rerun the
+report with a different cutoff without reading the Fastqs again.
+
 """
 
 #######################################################################
 # Import modules that this module depends on
 #######################################################################
 
-__version__ = "0.1.2"
+__version__ = "0.2.0"
 
 import sys
+import io
+import os
+import json
+import heapq
 import argparse
+import itertools
+from collections import Counter
+from multiprocessing import Pool
 import bcftbx.FASTQFile as FASTQFile
+from bcftbx.ngsutils import BarcodeIndex
+from bcftbx.cmdparse import add_nprocessors_option
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Number of reads whose headers are counted as a single batch
+# (and merged into the bounded summary, when only the top
+# sequences are kept)
+TOP_K_BATCH_SIZE = 1000000
 
 #######################################################################
 # Class definitions
@@ -33,12 +55,24 @@ import bcftbx.FASTQFile as FASTQFile
 class Barcodes(object):
     """Class for counting index sequences in Fastq files
 
+    Sequences which match within a number of mismatches are
+    found using the 'group' method. Rather than comparing the
+    target sequence against every other sequence, this looks
+    up each sequence in the mismatch neighbourhood of the
+    target (i.e. all the sequences which differ from it by
+    no more than the allowed number of mismatches), so the
+    cost doesn't depend on how many distinct sequences have
+    been loaded.
+
     """
     def __init__(self):
         """Create a new Barcodes instance
 
         """
         self._counts = {}
+        self._lengths = None
+        self._alphabet = None
+        self._prefixes = {}
 
     def load(self,fastq=None,fp=None):
         """Read in fastq data and collect index sequence info
@@ -58,6 +92,111 @@ class Barcodes(object):
                 self._counts[seq] = 1
             else:
                 self._counts[seq] += 1
+        # Reset the lookup data used by 'group'
+        self._reset()
+
+    def load_fastqs(self,fastqs,nprocs=1,top_k=None):
+        """Count index sequences from multiple Fastq files
+
+        Unlike 'load', the index sequences are taken directly
+        from the raw read headers (see 'count_index_sequences').
+        The Fastqs are counted in parallel if more than one
+        process is specified, and the counts are merged.
+
+        Arguments:
+          fastqs: list of Fastq files to count index sequences
+            from (can be gzipped)
+          nprocs: number of processes to use (default: 1)
+          top_k: if set then only keep (approximate) counts for
+            this number of most common sequences (see
+            'count_index_sequences')
+
+        """
+        tasks = [(fastq,top_k) for fastq in fastqs]
+        if nprocs > 1 and len(tasks) > 1:
+            pool = Pool(min(nprocs,len(tasks)))
+            try:
+                results = pool.map(_count_index_sequences_task,tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_count_index_sequences_task(t) for t in tasks]
+        counts = Counter(self._counts)
+        for result in results:
+            counts.update(result)
+        if top_k is not None:
+            counts = dict(counts.most_common(top_k))
+        self.add_counts(counts,reset=True)
+
+    def add_counts(self,counts,reset=False):
+        """Add counts for index sequences
+
+        Arguments:
+          counts: dictionary mapping index sequences to
+            the number of times they occur
+          reset: if True then replace the existing counts
+            (default is to add to the existing counts)
+
+        """
+        if reset:
+            self._counts = {}
+        for seq in counts:
+            try:
+                self._counts[seq] += counts[seq]
+            except KeyError:
+                self._counts[seq] = counts[seq]
+        self._reset()
+
+    def save_counts(self,filen):
+        """Write the index sequence counts to a file
+
+        If the file name ends with '.json' then the counts
+        are written as a JSON object; otherwise they are
+        written as tab-delimited sequence and count pairs,
+        from most to least common.
+
+        Arguments:
+          filen: path of the file to write
+
+        """
+        with io.open(filen,'wt') as fp:
+            if filen.endswith('.json'):
+                fp.write(u"%s\n" % json.dumps(self._counts,sort_keys=True))
+            else:
+                fp.write(u"#Index sequence\tCount\n")
+                for seq in self.ranked():
+                    fp.write(u"%s\t%d\n" % (seq,self._counts[seq]))
+
+    def load_counts(self,filen):
+        """Read in index sequence counts from a file
+
+        The counts are added to any existing counts. The file
+        should have been written by 'save_counts'.
+
+        Arguments:
+          filen: path of the file to read
+
+        """
+        with io.open(filen,'rt') as fp:
+            if filen.endswith('.json'):
+                counts = json.load(fp)
+            else:
+                counts = {}
+                for line in fp:
+                    if line.startswith('#') or not line.strip():
+                        continue
+                    seq,count = line.rstrip('\n').split('\t')
+                    counts[seq] = int(count)
+        self.add_counts(counts)
+
+    def _reset(self):
+        """Internal: reset the lookup data used by 'group'
+
+        """
+        self._lengths = None
+        self._alphabet = None
+        self._prefixes = {}
 
     def sequences(self):
         """Return list of barcode sequences
@@ -69,6 +208,22 @@ class Barcodes(object):
         unique = sorted(list(self._counts.keys()))
         return unique
 
+    def ranked(self,min_count=0):
+        """Return list of sequences ordered by count
+
+        Returns a list of the index sequences, sorted from
+        most to least common (sequences with the same count
+        are sorted into alphabetical order).
+
+        Arguments:
+          min_count: if set then only sequences which occur
+            at least this many times are returned
+
+        """
+        counts = self._counts
+        seqs = [s for s in counts if counts[s] >= min_count]
+        return sorted(seqs,key=lambda s: (-counts[s],s))
+
     def count_for(self,*seqs):
         """Return count for list of sequences
 
@@ -98,17 +253,219 @@ class Barcodes(object):
         return as a list.
 
         """
-        grp = []
-        for s in self.sequences():
-            if s not in grp and sequences_match(s,seq,max_mismatches):
-                grp.append(s)
+        if max_mismatches == 0:
+            return [seq] if seq in self._counts else []
+        if self._lengths is None:
+            self._lengths = sorted(set([len(s) for s in self._counts]))
+            self._alphabet = set(''.join(self._counts))
+        alphabet = ''.join(sorted(self._alphabet.union(seq)))
+        index = BarcodeIndex(max_mismatches=max_mismatches,
+                             alphabet=alphabet)
+        neighbourhoods = {}
+        candidates = set()
+        for length in self._lengths:
+            # Sequences of different lengths are compared over
+            # the length of the shorter one (see 'sequences_match')
+            n = min(length,len(seq))
+            try:
+                neighbours = neighbourhoods[n]
+            except KeyError:
+                neighbours = index.neighbourhood(seq[:n])
+                neighbourhoods[n] = neighbours
+            if length == n:
+                candidates.update([s for s in neighbours
+                                   if s in self._counts])
+            else:
+                prefixes = self._prefix_table(length,n)
+                for s in neighbours:
+                    candidates.update(prefixes.get(s,()))
+        grp = [s for s in candidates
+               if sequences_match(s,seq,max_mismatches)]
         grp.sort()
         return grp
 
+    def _prefix_table(self,length,n):
+        """Internal: map prefixes to sequences of a given length
+
+        Returns a dictionary where the keys are the first 'n'
+        bases of the sequences with the specified length, and
+        the values are lists of the matching sequences.
+
+        """
+        try:
+            return self._prefixes[(length,n)]
+        except KeyError:
+            pass
+        prefixes = {}
+        for s in self._counts:
+            if len(s) == length:
+                prefixes.setdefault(s[:n],[]).append(s)
+        self._prefixes[(length,n)] = prefixes
+        return prefixes
+
+class SpaceSaving(object):
+    """Bounded-memory counter for the most common items in a stream
+
+    Implements the 'Space-Saving' algorithm (Metwally et al,
+    2005): at most 'k' items are counted, and when a new item
+    arrives and the counter is full, it replaces the item with
+    the lowest count and inherits that count (which is recorded
+    as the maximum possible overestimate for the new item).
+
+    Any item which occurs more than N/k times in a stream of N
+    items is guaranteed to be counted, and the counts are never
+    less than the true counts. For example:
+
+    >>> top = SpaceSaving(100)
+    >>> top.update(seqs)
+    >>> top.most_common(10)
+
+    """
+    def __init__(self,k):
+        """Create a new SpaceSaving instance
+
+        Arguments:
+          k: maximum number of items to count
+
+        """
+        self.k = int(k)
+        self._counts = {}
+        self._errors = {}
+        self._heap = []
+
+    def add(self,item,count=1):
+        """Add one or more occurrences of an item
+
+        Arguments:
+          item: item to count
+          count: number of occurrences (default: 1)
+
+        """
+        counts = self._counts
+        if item in counts:
+            counts[item] += count
+            return
+        if len(counts) < self.k:
+            counts[item] = count
+            self._errors[item] = 0
+            heapq.heappush(self._heap,(count,item))
+            return
+        # Evict the item with the lowest count; entries in the
+        # heap are updated lazily, so skip any which are stale
+        heap = self._heap
+        while True:
+            min_count,min_item = heap[0]
+            if counts[min_item] == min_count:
+                break
+            heapq.heapreplace(heap,(counts[min_item],min_item))
+        heapq.heapreplace(heap,(min_count+count,item))
+        del counts[min_item]
+        del self._errors[min_item]
+        counts[item] = min_count + count
+        self._errors[item] = min_count
+
+    def update(self,items):
+        """Add occurrences of multiple items
+
+        Arguments:
+          items: either an iterable of items, or a dictionary
+            mapping items to counts
+
+        """
+        if isinstance(items,dict):
+            for item in items:
+                self.add(item,items[item])
+        else:
+            for item in items:
+                self.add(item)
+
+    def error(self,item):
+        """Return the maximum overestimate of the count for an item
+
+        """
+        return self._errors.get(item,0)
+
+    def most_common(self,n=None):
+        """Return list of (item,count) pairs from most to least common
+
+        Arguments:
+          n: if set then only return this many items
+
+        """
+        items = sorted(self._counts.items(),key=lambda x: (-x[1],x[0]))
+        if n is not None:
+            items = items[:n]
+        return items
+
+    def __getitem__(self,item):
+        return self._counts.get(item,0)
+
+    def __contains__(self,item):
+        return item in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
 #######################################################################
 # Functions
 #######################################################################
 
+def count_index_sequences(fastq,top_k=None):
+    """Count the index sequences in a Fastq file
+
+    The index sequence for each read is taken directly from
+    the raw header lines (for example 'ATCACG' in
+    '@EAS139:136:FC706VJ:2:2104:15343:197393 1:Y:18:ATCACG'),
+    by matching blocks of headers against the Illumina 1.8+
+    identifier format (the same as used for the
+    'index_sequence' property of 'SequenceIdentifier'),
+    without the overhead of creating a read object for each
+    record. Reads with headers in other formats don't have
+    an index sequence and so aren't counted.
+
+    If 'top_k' is set then the counts are held in a
+    'SpaceSaving' summary, so only (approximate) counts for
+    the most common sequences are returned; the memory used
+    is then bounded regardless of the number of distinct
+    sequences in the Fastq.
+
+    Arguments:
+      fastq: path of the Fastq file to read (can be gzipped)
+      top_k: if set then only count this many sequences
+
+    Returns:
+      Dictionary: maps index sequences to counts.
+
+    """
+    regex = FASTQFile.RE_ILLUMINA18_INDEX_SEQUENCE
+    if top_k is None:
+        summary = Counter()
+    else:
+        summary = SpaceSaving(top_k)
+    with FASTQFile.get_fastq_file_handle(fastq,'rb',threaded=True) as fp:
+        headers = itertools.islice(fp,0,None,4)
+        while True:
+            # Count batches of reads exactly (and if using a
+            # bounded summary, merge each batch into it)
+            batch = b''.join(itertools.islice(headers,TOP_K_BATCH_SIZE))
+            if not batch:
+                break
+            summary.update(Counter(regex.findall(batch)))
+    if top_k is not None:
+        summary = dict(summary.most_common())
+    counts = {}
+    for seq in summary:
+        seq_ = seq.rstrip().decode()
+        counts[seq_] = counts.get(seq_,0) + summary[seq]
+    return counts
+
+def _count_index_sequences_task(args):
+    """Internal: run 'count_index_sequences' in a worker process
+
+    """
+    return count_index_sequences(*args)
+
+
 def sequences_match(seq1,seq2,max_mismatches=0):
     """Determine whether two sequences match with specified tolerance
 
@@ -134,24 +491,45 @@ def sequences_match(seq1,seq2,max_mismatches=0):
                 return False
     return True
 
-def main(fastqs,cutoff):
+def main(fastqs,cutoff,counts_files=None,save_counts=None,nprocs=1,
+         top_k=None):
     """Main program
 
     Arguments:
       fastqs: list of FASTQ files to read sequences from
       cutoff: set the minimum number of reads that a barcode must appear in
         before it is reported
+      counts_files: optional list of files with counts from
+        previous runs (written by 'save_counts') to add in
+      save_counts: optional file to write the counts to
+      nprocs: number of processes to use to count the FASTQs
+      top_k: if set then only keep counts for this many of the
+        most common barcode sequences
 
     """
     barcodes = Barcodes()
-    for fastq_file in fastqs:
-        print("Reading in data from %s" % fastq_file)
-        barcodes.load(fastq=fastq_file)
-    print("Total # barcode sequences: %d" % len(barcodes.sequences()))
+    if counts_files:
+        for counts_file in counts_files:
+            print("Reading in counts from %s" % counts_file)
+            barcodes.load_counts(counts_file)
+    if fastqs:
+        for fastq_file in fastqs:
+            print("Reading in data from %s" % fastq_file)
+        barcodes.load_fastqs(fastqs,nprocs=nprocs,top_k=top_k)
+    if save_counts:
+        print("Writing counts to %s" % save_counts)
+        barcodes.save_counts(save_counts)
+    seqs = barcodes.sequences()
+    print("Total # barcode sequences: %d" % len(seqs))
     print("Determining top barcode sequences")
-    ordered_seqs = sorted(barcodes.sequences(),
-                          cmp=lambda x,y: cmp(barcodes.count_for(y),
-                                              barcodes.count_for(x)))
+    # Only sequences which meet the cutoff are reported (plus the
+    # first which doesn't), so only these need to be grouped
+    ordered_seqs = barcodes.ranked(min_count=cutoff)
+    remainder = [s for s in seqs if barcodes.count_for(s) < cutoff]
+    if remainder:
+        ordered_seqs.append(min(remainder,
+                                key=lambda s: -barcodes.count_for(s)))
+    ranks = dict([(seq,i) for i,seq in enumerate(ordered_seqs)])
     print("Rank = position after sorting from most to least common")
     print("Index sequence = the barcode sequence")
     print("Count = number of reads with this exact index sequence")
@@ -162,11 +540,12 @@ def main(fastqs,cutoff):
     for i,seq in enumerate(ordered_seqs):
         n_exact = barcodes.count_for(seq)
         n_1mismatch = barcodes.count_for(*barcodes.group(seq,1))
-        n_2mismatch = barcodes.count_for(*barcodes.group(seq,2))
-        match_seqs = []
-        for i1,seq1 in enumerate(ordered_seqs[:i]):
-            if sequences_match(seq,seq1,2):
-                match_seqs.append("%d:'%s'" % (i1+1,seq1))
+        group = barcodes.group(seq,2)
+        n_2mismatch = barcodes.count_for(*group)
+        match_seqs = sorted([ranks[seq1] for seq1 in group
+                             if ranks.get(seq1,i) < i])
+        match_seqs = ["%d:'%s'" % (i1+1,ordered_seqs[i1])
+                      for i1 in match_seqs]
         print("%d\t%s\t%d\t%d\t%d\t[%s]" % (i+1,seq,
                                             n_exact,n_1mismatch,n_2mismatch,
                                             ','.join(match_seqs)))
@@ -181,6 +560,10 @@ def main(fastqs,cutoff):
 
 import unittest
 import io
+import gzip
+import random
+import shutil
+import tempfile
 
 class TestBarcodes(unittest.TestCase):
     def test_barcodes(self):
@@ -211,6 +594,143 @@ GAAACGCGGCACAGA
         self.assertEqual(b.group('GTCNNCAT',max_mismatches=2),['GTCNNCAT'])
         group = b.group('CCGTCCAT')
         self.assertEqual(b.count_for(*group),2)
+    def test_barcodes_ranked(self):
+        b = Barcodes()
+        b._counts = { 'AAAA': 2, 'CCCC': 5, 'GGGG': 2, 'TTTT': 1 }
+        self.assertEqual(b.ranked(),['CCCC','AAAA','GGGG','TTTT'])
+        self.assertEqual(b.ranked(min_count=2),['CCCC','AAAA','GGGG'])
+        self.assertEqual(b.ranked(min_count=6),[])
+    def test_barcodes_group_matches_exhaustive_search(self):
+        # Compare against checking every sequence in turn,
+        # including sequences with Ns and of different lengths
+        import random
+        random.seed(12345)
+        b = Barcodes()
+        for i in range(2000):
+            seq = ''.join([random.choice('ACGTN' if i%10 == 0 else 'ACGT')
+                           for j in range(random.choice((6,6,6,5,7)))])
+            b._counts[seq] = b._counts.get(seq,0) + 1
+        seqs = b.sequences()
+        for seq in seqs[::20] + ['ACGTAC','ACNNAC','ACG','ACGTACGT']:
+            for max_mismatches in (0,1,2):
+                self.assertEqual(b.group(seq,max_mismatches),
+                                 [s for s in seqs
+                                  if sequences_match(s,seq,
+                                                     max_mismatches)])
+
+class TestBarcodesCounts(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp(suffix='.TestBarcodesCounts')
+        random.seed(54321)
+        self.indexes = ['CCGTCCAT','GTCNNCAT','CCGTGCAT','AGGTCTAG+TTCA']
+        self.fastqs = []
+        for i in range(3):
+            fastq = os.path.join(self.wd,"test%d.fastq" % i)
+            if i == 2:
+                fastq += ".gz"
+                fp = gzip.open(fastq,'wt')
+            else:
+                fp = io.open(fastq,'wt')
+            with fp:
+                for j in range(500):
+                    index = random.choice(self.indexes[:j%4+1])
+                    fp.write(u"@HWI-700511R:233:C446JACXX:6:1101:%d:%d "
+                             "1:N:0:%s\nACGT\n+\nIIII\n" % (i,j,index))
+            self.fastqs.append(fastq)
+    def tearDown(self):
+        if os.path.isdir(self.wd):
+            shutil.rmtree(self.wd)
+    def _expected_counts(self,fastqs):
+        b = Barcodes()
+        for fastq in fastqs:
+            b.load(fastq=fastq)
+        return b._counts
+    def test_count_index_sequences(self):
+        for fastq in self.fastqs:
+            self.assertEqual(count_index_sequences(fastq),
+                             self._expected_counts([fastq]))
+    def test_count_index_sequences_non_illumina18_headers(self):
+        fastq = os.path.join(self.wd,"test_sra.fastq")
+        with io.open(fastq,'wt') as fp:
+            fp.write(u"@SRR001666.1 071112_SLXA-EAS1_s_7:5:1:817:345 "
+                     "length=4\nACGT\n+\nIIII\n"
+                     "@HWUSI-EAS100R:6:73:941:1973#0/1\nACGT\n+\nIIII\n"
+                     "@HWI-700511R:233:C446JACXX:6:1101:1:1 "
+                     "1:N:0:CCGTCCAT\r\nACGT\n+\nIIII\n")
+        self.assertEqual(count_index_sequences(fastq),{ 'CCGTCCAT': 1 })
+        self.assertEqual(count_index_sequences(fastq,top_k=2),
+                         { 'CCGTCCAT': 1 })
+    def test_count_index_sequences_top_k(self):
+        counts = self._expected_counts(self.fastqs[:1])
+        top = count_index_sequences(self.fastqs[0],top_k=2)
+        self.assertEqual(len(top),2)
+        # Only the most common sequence occurs in more than
+        # half of the reads, so is guaranteed to be present
+        self.assertTrue('CCGTCCAT' in top)
+        self.assertTrue(counts['CCGTCCAT'] > 250)
+        for seq in top:
+            self.assertTrue(top[seq] >= counts[seq])
+    def test_load_fastqs(self):
+        expected = self._expected_counts(self.fastqs)
+        for nprocs in (1,2):
+            b = Barcodes()
+            b.load_fastqs(self.fastqs,nprocs=nprocs)
+            self.assertEqual(b._counts,expected)
+            self.assertEqual(b.group('CCGTCCAT'),['CCGTCCAT','CCGTGCAT'])
+    def test_save_and_load_counts(self):
+        b = Barcodes()
+        b.load_fastqs(self.fastqs)
+        for name in ('counts.tsv','counts.json'):
+            counts_file = os.path.join(self.wd,name)
+            b.save_counts(counts_file)
+            b2 = Barcodes()
+            b2.load_counts(counts_file)
+            self.assertEqual(b2._counts,b._counts)
+            b2.load_counts(counts_file)
+            self.assertEqual(b2.count_for('CCGTCCAT'),
+                             2*b.count_for('CCGTCCAT'))
+        with io.open(os.path.join(self.wd,'counts.tsv'),'rt') as fp:
+            self.assertEqual(fp.readline(),u"#Index sequence\tCount\n")
+            self.assertEqual(fp.readline().split('\t')[0],b.ranked()[0])
+
+class TestSpaceSaving(unittest.TestCase):
+    def test_space_saving_exact_when_not_full(self):
+        top = SpaceSaving(5)
+        top.update("ABRACADABRA")
+        self.assertEqual(top.most_common(),
+                         [('A',5),('B',2),('R',2),('C',1),('D',1)])
+        self.assertEqual(top['A'],5)
+        self.assertEqual(top.error('A'),0)
+        self.assertEqual(len(top),5)
+    def test_space_saving_evicts_least_common(self):
+        top = SpaceSaving(2)
+        top.update("AABAC")
+        self.assertEqual(top.most_common(),[('A',3),('C',2)])
+        self.assertEqual(top.error('C'),1)
+        self.assertFalse('B' in top)
+    def test_space_saving_weighted_updates(self):
+        top = SpaceSaving(2)
+        top.update({ 'A': 10, 'B': 3 })
+        top.add('C',2)
+        self.assertEqual(top.most_common(),[('A',10),('C',5)])
+        self.assertEqual(top.error('C'),3)
+    def test_space_saving_guarantees(self):
+        random.seed(98765)
+        items = [random.choice('ABC') if random.random() < 0.6
+                 else random.randint(0,1000) for i in range(5000)]
+        items = [str(x) for x in items]
+        counts = Counter(items)
+        top = SpaceSaving(50)
+        top.update(items)
+        self.assertEqual(len(top),50)
+        for item in counts:
+            if counts[item] > len(items)/50:
+                self.assertTrue(item in top)
+        for item,count in top.most_common():
+            self.assertTrue(count >= counts[item])
+            self.assertTrue(count - top.error(item) <= counts[item])
+        self.assertEqual([x[0] for x in top.most_common(3)],
+                         [x[0] for x in counts.most_common(3)])
 
 class TestSequencesMatchFunction(unittest.TestCase):
     def test_sequences_match_exact(self):
@@ -241,20 +761,41 @@ class TestSequencesMatchFunction(unittest.TestCase):
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser(
-        version="$(prog)s "+__version__,
         description="Examine barcode sequences from one or more "
         "Fastq files and report the most prevalent. Sequences will "
         "be pooled from all specified Fastqs before being analysed.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
     p.add_argument('--cutoff',action='store',dest='cutoff',
                    default=1000000,type=int,
                    help="Minimum number of times a barcode sequence "
                    "must appear to be reported (default is 1000000)")
-    p.add_argument('fastqs',metavar="FASTQ",nargs='+',
+    add_nprocessors_option(p,1)
+    p.add_argument('--top-k',action='store',dest='top_k',
+                   default=None,type=int,
+                   help="Only keep counts for the TOP_K most common "
+                   "barcode sequences, to limit the memory used for "
+                   "very diverse samples (counts are then approximate)")
+    p.add_argument('--save-counts',action='store',dest='save_counts',
+                   default=None,metavar='FILE',
+                   help="Write the barcode counts to FILE (as JSON if "
+                   "FILE ends with '.json', otherwise tab-delimited)")
+    p.add_argument('--load-counts',action='append',dest='counts_files',
+                   default=[],metavar='FILE',
+                   help="Read in barcode counts from FILE written "
+                   "previously using --save-counts (can be specified "
+                   "multiple times; counts are pooled with any Fastqs)")
+    p.add_argument('fastqs',metavar="FASTQ",nargs='*',
                    help="Fastq to examine barcodes from (reads from "
                    "multiple Fastqs will be pooled)")
     args = p.parse_args()
+    if not args.fastqs and not args.counts_files:
+        p.error("Need at least one Fastq or --load-counts file")
     try:
-        main(args.fastqs,args.cutoff)
+        main(args.fastqs,args.cutoff,counts_files=args.counts_files,
+             save_counts=args.save_counts,
+             nprocs=int(args.nprocessors),
+             top_k=args.top_k)
     except KeyboardInterrupt:
         print("Terminating following Ctrl-C")
         pass
@@ -16,7 +16,7 @@ the files form an R1/2 pair.
 
 """
 
-__version__ = "1.1.0"
+__version__ = "1.2.0"
 
 #######################################################################
 # Import modules that this module depends on
@@ -44,9 +44,14 @@ if __name__ == "__main__":
     
     # Create command line parser
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Check that read headers for R1 and R2 fastq files "
         "are in agreement, and that the files form an R1/2 pair.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('--fast',action='store_true',dest='fast',
+                   help="perform fast check, by only comparing read "
+                   "headers up to the first space (or up to the trailing "
+                   "'/1' or '/2' for older Illumina formats)")
     p.add_argument('fastq_file_r1',metavar="R1.fastq",
                    help="Fastq file with R1 reads")
     p.add_argument('fastq_file_r2',metavar="R2.fastq",
@@ -55,7 +60,8 @@ if __name__ == "__main__":
     # Parse command line
     args = p.parse_args()
     # Process the data
-    if FASTQFile.fastqs_are_pair(args.fastq_file_r1,args.fastq_file_r2):
+    if FASTQFile.fastqs_are_pair(args.fastq_file_r1,args.fastq_file_r2,
+                                 fast=args.fast):
         sys.exit(0)
     else:
         logging.error("Not R1/R2 pair")
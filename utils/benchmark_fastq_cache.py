@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#
+#     benchmark_fastq_cache.py: benchmark FASTQ cache against gzip
+#     Copyright (C) University of Manchester 2026 Peter Briggs
+#
+########################################################################
+#
+# benchmark_fastq_cache.py
+#
+#########################################################################
+
+"""benchmark_fastq_cache.py
+
+Benchmark for the FASTQ cache format in bcftbx.FASTQCache: reports
+the time taken to build a cache from a gzipped FASTQ file, and the
+time taken to scan all the reads in the cache compared with scanning
+the reads in the original '.fastq.gz' file using FastqIterator.
+
+Reads are taken from the supplied FASTQ file, or else a synthetic
+gzipped FASTQ file is generated.
+
+Requires the 'numpy' package.
+
+"""
+
+#######################################################################
+# Module metadata
+#######################################################################
+
+__version__ = '0.0.1'
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.FASTQFile import FastqIterator
+from bcftbx.FASTQFile import FastqWriter
+from bcftbx.FASTQCache import FastqCache
+from bcftbx.FASTQCache import build_fastq_cache
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_fastq(fastq,nreads,length=101,seed=1):
+    """Write a synthetic gzipped Illumina 1.8+ FASTQ file
+
+    Arguments:
+      fastq (str): path to the FASTQ file to write
+      nreads (int): number of records to generate
+      length (int): length of each sequence
+      seed (int): seed for the random number generator
+    """
+    rng = random.Random(seed)
+    index = ''.join([rng.choice('ACGT') for i in range(8)])
+    with FastqWriter(fastq,compress=True) as fq:
+        for i in range(nreads):
+            seqid = "@NB500968:115:HWJMHBGX9:%d:%d:%d:%d 1:N:0:%s" % \
+                    (i%4+1,11101+i%12,rng.randint(1000,25000),
+                     rng.randint(1000,20000),index)
+            seq = ''.join([rng.choice('ACGTN') for j in range(length)])
+            qual = ''.join([rng.choice('#AAEE/6<') for j in range(length)])
+            fq.write("%s\n%s\n+\n%s\n" % (seqid,seq,qual))
+
+def scan(reads):
+    """Scan all the reads, touching the sequence of each one
+
+    Arguments:
+      reads (iterator): iterator returning read objects
+
+    Returns:
+      Integer: number of reads scanned.
+    """
+    nreads = 0
+    for read in reads:
+        read.sequence
+        nreads += 1
+    if hasattr(reads,'close'):
+        reads.close()
+    return nreads
+
+def timed(func,*args,**kws):
+    """Time a function call
+
+    Returns:
+      Tuple: tuple of (elapsed time, return value).
+    """
+    start = time.time()
+    retval = func(*args,**kws)
+    return (time.time() - start,retval)
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        description="Compare the time taken to scan the reads in "
+        "a FASTQ cache with the time taken to scan the reads in "
+        "the gzipped FASTQ, using FASTQ (if supplied) or else "
+        "synthetic reads.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n',action='store',dest='nreads',
+                   default=500000,type=int,
+                   help="number of synthetic reads to generate "
+                   "(default: 500000)")
+    p.add_argument('-r','--repeats',action='store',
+                   default=3,type=int,
+                   help="number of times to repeat each scan and "
+                   "report the best (default: 3)")
+    p.add_argument('fastq',metavar="FASTQ",nargs='?',
+                   help="gzipped FASTQ file to use")
+    args = p.parse_args()
+    wd = tempfile.mkdtemp(prefix="benchmark_fastq_cache.")
+    try:
+        if args.fastq:
+            fastq = args.fastq
+        else:
+            fastq = os.path.join(wd,"synthetic_R1.fastq.gz")
+            print("Generating %d synthetic reads" % args.nreads)
+            make_fastq(fastq,args.nreads)
+        # Build the cache
+        cache_file = os.path.join(wd,os.path.basename(fastq)+".fqc")
+        elapsed,cache = timed(build_fastq_cache,fastq,cache_file)
+        nreads = cache.nreads
+        cache.close()
+        print("Built cache for %d reads in %.2fs" % (nreads,elapsed))
+        print("FASTQ: %d bytes" % os.path.getsize(fastq))
+        print("Cache: %d bytes" % os.path.getsize(cache_file))
+        # Scan the reads
+        print("%-36s %10s %12s" % ("Scan","Time (s)","Reads/s"))
+        for name,reads in (
+                ("FastqIterator (.fastq.gz)",
+                 lambda: FastqIterator(fastq)),
+                ("FastqIterator (.fastq.gz, binary)",
+                 lambda: FastqIterator(fastq,binary=True)),
+                ("FastqCache",
+                 lambda: FastqCache(cache_file)),
+                ("FastqCache (binary)",
+                 lambda: FastqCache(cache_file,binary=True))):
+            elapsed = min([timed(scan,reads())[0]
+                           for i in range(args.repeats)])
+            print("%-36s %10.2f %12.0f" %
+                  (name,elapsed,nreads/max(elapsed,1.0e-9)))
+    finally:
+        shutil.rmtree(wd)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+#
+#     benchmark_fastq_reads.py: benchmark FASTQ read objects
+#     Copyright (C) University of Manchester 2026 Peter Briggs
+#
+########################################################################
+#
+# benchmark_fastq_reads.py
+#
+#########################################################################
+
+"""benchmark_fastq_reads.py
+
+Micro-benchmark for the FASTQ read classes in bcftbx.FASTQFile:
+reports the memory used per read and the number of reads per second
+that can be created when reads are held in memory (as done by e.g.
+remove_mispairs.py), for:
+
+- FastqRead objects with the sequence identifier left unparsed
+- FastqRead objects where only the index sequence is accessed
+- FastqRead objects where all the identifier fields are accessed
+- RawFastqRead objects
+
+Reads are taken from the supplied FASTQ file, or else a synthetic
+set of Illumina 1.8+ reads is generated.
+
+Memory use is measured using 'tracemalloc' and so is only reported
+for Python 3.
+
+"""
+
+#######################################################################
+# Module metadata
+#######################################################################
+
+__version__ = '0.0.1'
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import sys
+import os
+import io
+import gc
+import time
+import random
+import argparse
+try:
+    import tracemalloc
+except ImportError:
+    # Not available for Python 2
+    tracemalloc = None
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.FASTQFile import FastqRead
+from bcftbx.FASTQFile import RawFastqRead
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_records(nreads,length=101,seed=1):
+    """Generate synthetic Illumina 1.8+ FASTQ records
+
+    Arguments:
+      nreads (int): number of records to generate
+      length (int): length of each sequence
+      seed (int): seed for the random number generator
+
+    Returns:
+      List: list of records, each of which is a tuple of
+        the four lines (as bytes, including newlines).
+    """
+    rng = random.Random(seed)
+    index = ''.join([rng.choice('ACGT') for i in range(8)])
+    records = []
+    for i in range(nreads):
+        seqid = "@NB500968:115:HWJMHBGX9:%d:%d:%d:%d 1:N:0:%s\n" % \
+                (i%4+1,11101+i%12,rng.randint(1000,25000),
+                 rng.randint(1000,20000),index)
+        seq = ''.join([rng.choice('ACGTN') for j in range(length)])
+        qual = ''.join([rng.choice('#AAEE/6<') for j in range(length)])
+        records.append(tuple([x.encode('utf-8')
+                              for x in (seqid,seq+'\n','+\n',qual+'\n')]))
+    return records
+
+def read_records(fastq,nreads=None):
+    """Read FASTQ records from a file
+
+    Arguments:
+      fastq (str): path to an uncompressed FASTQ file
+      nreads (int): optional; maximum number of records to
+        read (default is to read all records)
+
+    Returns:
+      List: list of records, each of which is a tuple of
+        the four lines (as bytes, including newlines).
+    """
+    records = []
+    with io.open(fastq,'rb') as fp:
+        while nreads is None or len(records) < nreads:
+            record = tuple([fp.readline() for i in range(4)])
+            if not record[0]:
+                break
+            records.append(record)
+    return records
+
+def fastq_read(record):
+    """Create a FastqRead without parsing the identifier
+    """
+    return FastqRead(*[x.decode('utf-8') for x in record])
+
+def fastq_read_index(record):
+    """Create a FastqRead and fetch the index sequence
+    """
+    read = FastqRead(*[x.decode('utf-8') for x in record])
+    read.seqid.index_sequence
+    return read
+
+def fastq_read_all_fields(record):
+    """Create a FastqRead and fetch all the identifier fields
+    """
+    read = FastqRead(*[x.decode('utf-8') for x in record])
+    seqid = read.seqid
+    for field in seqid._FIELDS:
+        getattr(seqid,field)
+    return read
+
+def raw_fastq_read(record):
+    """Create a RawFastqRead
+    """
+    return RawFastqRead(record)
+
+def benchmark(func,records):
+    """Time creating reads and measure the memory they use
+
+    Arguments:
+      func (function): function which creates a read object
+        from a record
+      records (list): records to create read objects from
+
+    Returns:
+      Tuple: tuple of (reads/s, bytes per read), where bytes
+        per read is None if memory use can't be measured.
+    """
+    # Timing (without tracing memory allocations, which slows
+    # things down)
+    gc.collect()
+    start = time.time()
+    reads = [func(record) for record in records]
+    elapsed = time.time() - start
+    del(reads)
+    # Memory use
+    bytes_per_read = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        reads = [func(record) for record in records]
+        size,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        bytes_per_read = float(size)/len(reads)
+        del(reads)
+    return (len(records)/max(elapsed,1.0e-9),bytes_per_read)
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        description="Report the memory used per read and the "
+        "number of reads per second for the FASTQ read classes "
+        "in bcftbx.FASTQFile, using reads from FASTQ (if "
+        "supplied) or else synthetic reads.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n',action='store',dest='nreads',
+                   default=200000,type=int,
+                   help="number of reads to use (default: 200000)")
+    p.add_argument('-r','--repeats',action='store',
+                   default=3,type=int,
+                   help="number of times to repeat each benchmark "
+                   "and report the best (default: 3)")
+    p.add_argument('fastq',metavar="FASTQ",nargs='?',
+                   help="uncompressed FASTQ file to take reads from")
+    args = p.parse_args()
+    if args.fastq:
+        records = read_records(args.fastq,args.nreads)
+    else:
+        records = make_records(args.nreads)
+    if not records:
+        p.error("No reads to benchmark")
+    print("Benchmarking with %d reads" % len(records))
+    print("%-36s %12s %14s" % ("Read type","Reads/s","Bytes/read"))
+    for name,func in (("FastqRead",fastq_read),
+                      ("FastqRead (index sequence)",fastq_read_index),
+                      ("FastqRead (all identifier fields)",
+                       fastq_read_all_fields),
+                      ("RawFastqRead",raw_fastq_read)):
+        results = [benchmark(func,records) for i in range(args.repeats)]
+        rate = max([r[0] for r in results])
+        bytes_per_read = results[-1][1]
+        print("%-36s %12.0f %14s" %
+              (name,rate,
+               ("%.0f" % bytes_per_read if bytes_per_read is not None
+                else "n/a")))
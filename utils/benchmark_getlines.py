@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+#     benchmark_getlines.py: benchmark bcftbx.utils.getlines
+#     Copyright (C) University of Manchester 2026 Peter Briggs
+#
+########################################################################
+#
+# benchmark_getlines.py
+#
+#########################################################################
+
+"""benchmark_getlines.py
+
+Benchmark for the 'getlines' function in bcftbx.utils: reports the
+time taken to read all the lines from a file using 'getlines' (in
+both text and binary modes), compared with the previous buffered
+implementation (which read and decoded fixed-size chunks and split
+them after appending to the leftover partial line), and with simply
+iterating over the lines of the file object.
+
+Lines are read from the supplied file, or else a synthetic FASTQ
+file is generated. Gzipped files (with a '.gz' extension) are also
+supported.
+
+"""
+
+#######################################################################
+# Module metadata
+#######################################################################
+
+__version__ = '0.0.1'
+
+#######################################################################
+# Import modules that this module depends on
+#######################################################################
+
+import sys
+import os
+import io
+import gzip
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+# Put .. onto Python search path for modules
+SHARE_DIR = os.path.abspath(
+    os.path.normpath(
+        os.path.join(os.path.dirname(sys.argv[0]),'..')))
+sys.path.append(SHARE_DIR)
+from bcftbx.utils import getlines
+from bcftbx.utils import CHUNKSIZE
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_fastq(fastq,nreads,length=101,seed=1):
+    """Write a synthetic uncompressed Illumina 1.8+ FASTQ file
+
+    Arguments:
+      fastq (str): path to the FASTQ file to write
+      nreads (int): number of records to generate
+      length (int): length of each sequence
+      seed (int): seed for the random number generator
+    """
+    rng = random.Random(seed)
+    index = ''.join([rng.choice('ACGT') for i in range(8)])
+    with io.open(fastq,'wt') as fp:
+        for i in range(nreads):
+            seqid = u"@NB500968:115:HWJMHBGX9:%d:%d:%d:%d 1:N:0:%s" % \
+                    (i%4+1,11101+i%12,rng.randint(1000,25000),
+                     rng.randint(1000,20000),index)
+            seq = u''.join([rng.choice('ACGTN') for j in range(length)])
+            qual = u''.join([rng.choice('#AAEE/6<') for j in range(length)])
+            fp.write(u"%s\n%s\n+\n%s\n" % (seqid,seq,qual))
+
+def getlines_buffered(filen):
+    """Previous implementation of 'getlines'
+
+    Reads and decodes chunks of 'CHUNKSIZE' bytes, appends
+    each one to the partial line left over from the previous
+    chunk and then splits the result into lines.
+    """
+    if filen.split('.')[-1] == 'gz':
+        open_ = gzip.open
+    else:
+        open_ = io.open
+    buf = ''
+    lines = []
+    with open_(filen,'rb') as fp:
+        while True:
+            data = fp.read(CHUNKSIZE).decode("UTF-8")
+            if not data:
+                break
+            buf = buf + data
+            if buf[0] == '\n':
+                buf = buf[1:]
+            if buf[-1] != '\n':
+                i = buf.rfind('\n')
+                if i == -1:
+                    continue
+                else:
+                    lines = buf[:i].split('\n')
+                    buf = buf[i+1:]
+            else:
+                lines = buf[:-1].split('\n')
+                buf = ''
+            for line in lines:
+                yield line
+
+def fileobj_lines(filen):
+    """Iterate over the lines of the file object
+    """
+    if filen.split('.')[-1] == 'gz':
+        fp = gzip.open(filen,'rt')
+    else:
+        fp = io.open(filen,'rt')
+    with fp:
+        for line in fp:
+            yield line.rstrip('\n')
+
+def count_lines(lines):
+    """Consume the lines and return the number of lines
+    """
+    nlines = 0
+    for line in lines:
+        nlines += 1
+    return nlines
+
+#######################################################################
+# Main program
+#######################################################################
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(
+        description="Compare the time taken to read the lines "
+        "from FILE (if supplied) or else a synthetic FASTQ file "
+        "using 'bcftbx.utils.getlines' with other implementations.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
+    p.add_argument('-n',action='store',dest='nreads',
+                   default=500000,type=int,
+                   help="number of reads in the synthetic FASTQ "
+                   "(default: 500000)")
+    p.add_argument('-r','--repeats',action='store',
+                   default=3,type=int,
+                   help="number of times to repeat each benchmark "
+                   "and report the best (default: 3)")
+    p.add_argument('--gzip',action='store_true',
+                   help="gzip the synthetic FASTQ")
+    p.add_argument('filen',metavar="FILE",nargs='?',
+                   help="file to read lines from")
+    args = p.parse_args()
+    wd = tempfile.mkdtemp(prefix="benchmark_getlines.")
+    try:
+        if args.filen:
+            filen = args.filen
+        else:
+            filen = os.path.join(wd,"synthetic_R1.fastq")
+            print("Generating %d synthetic reads" % args.nreads)
+            make_fastq(filen,args.nreads)
+            if args.gzip:
+                with io.open(filen,'rb') as fp:
+                    with gzip.open(filen+".gz",'wb') as fq:
+                        shutil.copyfileobj(fp,fq)
+                os.remove(filen)
+                filen += ".gz"
+        print("Reading %s (%d bytes)" % (os.path.basename(filen),
+                                         os.path.getsize(filen)))
+        print("%-36s %10s %12s" % ("Implementation","Time (s)","Lines/s"))
+        for name,lines in (
+                ("getlines",
+                 lambda: getlines(filen)),
+                ("getlines (binary)",
+                 lambda: getlines(filen,binary=True)),
+                ("getlines (previous implementation)",
+                 lambda: getlines_buffered(filen)),
+                ("File object iteration",
+                 lambda: fileobj_lines(filen))):
+            timings = []
+            for i in range(args.repeats):
+                start = time.time()
+                nlines = count_lines(lines())
+                timings.append(time.time() - start)
+            elapsed = min(timings)
+            print("%-36s %10.2f %12.0f" %
+                  (name,elapsed,nlines/max(elapsed,1.0e-9)))
+    finally:
+        shutil.rmtree(wd)
@@ -19,7 +19,7 @@ Compare the contents of two directories.
 # Module metadata
 #######################################################################
 
-__version__ = '0.1.1'
+__version__ = '0.1.2'
 
 #######################################################################
 # Import modules that this module depends on
@@ -29,7 +29,6 @@ import sys
 import os
 import argparse
 import logging
-import itertools
 from multiprocessing import Pool
 
 # Put .. onto Python search path for modules
@@ -38,6 +37,7 @@ SHARE_DIR = os.path.abspath(
         os.path.join(os.path.dirname(sys.argv[0]),'..')))
 sys.path.append(SHARE_DIR)
 import bcftbx.Md5sum as Md5sum
+from bcftbx.utils import scandir_walk
 
 #######################################################################
 # Classes
@@ -85,7 +85,7 @@ class CmpResult(object):
 # Functions
 #######################################################################
 
-def yield_filepairs(dir1,dir2,include_dirs=False):
+def yield_filepairs(dir1,dir2,include_dirs=False,nthreads=1):
     """Return pairs of equivalent files under two directories
  
     Walk directory structure under dir1 and iteratively yield
@@ -96,21 +96,25 @@ def yield_filepairs(dir1,dir2,include_dirs=False):
     but the second may not. Also additional files may exist
     under dir2 but these will not be returned.
 
+    'nthreads' sets the number of threads used to list the
+    directories under dir1 (see 'bcftbx.utils.scandir_walk').
+
     """
     dir1 = os.path.abspath(dir1)
     dir2 = os.path.abspath(dir2)
-    for d in os.walk(dir1,followlinks=True):
-        d1 = os.path.normpath(d[0])
-        if os.path.islink(d1):
+    for dir_entry,dirs,files in scandir_walk(dir1,followlinks=True,
+                                             nthreads=nthreads):
+        d1 = os.path.normpath(dir_entry.path)
+        if dir_entry.is_symlink():
             yield (d1,os.path.normpath(
                 os.path.join(dir2,os.path.relpath(d1,dir1))))
         else:
             if include_dirs:
                 yield (d1,os.path.normpath(
                     os.path.join(dir2,os.path.relpath(d1,dir1))))
-            for f in d[2]:
+            for f in files:
                 # File in dir1
-                f1 = os.path.join(d1,f)
+                f1 = os.path.join(d1,f.name)
                 f2 = os.path.join(dir2,os.path.relpath(f1,dir1))
                 yield (f1,f2)
 
@@ -174,11 +178,12 @@ def cmp_dirs(dir1,dir2,n=1):
     """
     counts = {}
     if n == 1:
-        mapper = itertools.imap
+        mapper = map
     else:
         pool = Pool(n)
         mapper = pool.imap
-    for result in mapper(cmp_filepair,yield_filepairs(dir1,dir2)):
+    for result in mapper(cmp_filepair,yield_filepairs(dir1,dir2,
+                                                      nthreads=n)):
         print("%s: %s" % (result.relpath(dir1),result.status_message))
         try:
             counts[result.status] += 1
@@ -195,11 +200,12 @@ def cmp_dirs(dir1,dir2,n=1):
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser(
-        version="%(prog)s "+__version__,
         description="Compare contents of DIR1 against "
         "corresponding files and directories in DIR2. "
         "Files are compared using MD5 sums, symlinks "
         "using their targets.")
+    p.add_argument('--version',action='version',
+                   version="%(prog)s "+__version__)
     p.add_argument('-n',action='store',dest='n_processors',
                    default=1,type=int,
                    help="specify number of cores to use")
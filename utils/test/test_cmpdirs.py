@@ -27,8 +27,9 @@ class TestYieldFilepairs(unittest.TestCase):
         # Get all files, links and directories in the example directory
         expected = self.d.filelist(include_links=True,include_dirs=True)
         # Remove any (non-link) directories from the expected list
-        expected = filter(lambda x: os.path.islink(x) or not os.path.isdir(x),
-                          expected)
+        expected = list(filter(lambda x: os.path.islink(x) or
+                               not os.path.isdir(x),
+                               expected))
         print("Expected = %s" % expected)
         # Get all file pairs from the example dir and a
         # dummy target directory name